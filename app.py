@@ -1,10 +1,16 @@
 from flask import Flask
 
+from commands import register_commands
 from config import Config
 from routes.chat import chat_bp
-from routes.images import images_bp
+from routes.images import image_files_bp, images_bp
+from routes.jobs import jobs_bp
 from routes.main import main_bp
+from routes.metrics import metrics_bp
 from routes.prompts import prompts_bp
+from routes.search import search_bp
+from routes.transfer import transfer_bp
+from utils.http_cache import compress_response
 
 
 def create_app():
@@ -18,6 +24,15 @@ def create_app():
     app.register_blueprint(chat_bp)
     app.register_blueprint(prompts_bp)
     app.register_blueprint(images_bp)
+    app.register_blueprint(image_files_bp)
+    app.register_blueprint(jobs_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(search_bp)
+    app.register_blueprint(transfer_bp)
+
+    app.after_request(compress_response)
+
+    register_commands(app)
 
     return app
 
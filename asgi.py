@@ -0,0 +1,49 @@
+"""
+Async serving mode: ``uvicorn asgi:app --host 0.0.0.0 --port 5550 --workers 2``.
+
+Chat and image generation are served by the async routes in
+``routes/async_chat.py`` and ``routes/async_images.py``, which wait on
+providers on the event loop, so one process holds hundreds of turns in
+flight without a thread each. Every other route is the regular Flask app,
+mounted with ``a2wsgi.WSGIMiddleware`` and run on a small thread pool.
+"""
+
+import time
+
+from a2wsgi import WSGIMiddleware
+
+from app import app as flask_app
+from config import Config
+from routes.async_chat import routes as chat_routes
+from routes.async_images import routes as image_routes
+from utils.asgi import Request, json_response, read_body
+from utils.metrics import HTTP_REQUEST_DURATION, HTTP_REQUESTS
+
+
+def create_asgi_app():
+    routes = {**chat_routes, **image_routes}
+    wsgi = WSGIMiddleware(flask_app, workers=Config.ASGI_WSGI_THREADS)
+
+    async def asgi_app(scope, receive, send):
+        handler = routes.get((scope["method"], scope["path"])) if scope["type"] == "http" else None
+        if handler is None:
+            # Flask records its own request metrics and reads the body as it needs it;
+            # the middleware also answers the server's lifespan messages.
+            await wsgi(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        try:
+            response = await handler(Request(scope, await read_body(receive)))
+        except Exception as exc:
+            print(f"Unhandled error in {scope['path']}: {exc}")
+            response = json_response({"error": "Internal server error"}, 500)
+        # As in routes/metrics.py, streamed bodies continue after this point.
+        HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, endpoint=scope["path"], method=scope["method"])
+        HTTP_REQUESTS.inc(endpoint=scope["path"], method=scope["method"], status=getattr(response, "status", 200))
+        await response(send, receive)
+
+    return asgi_app
+
+
+app = create_asgi_app()
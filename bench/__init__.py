@@ -0,0 +1 @@
+# Benchmark and stress tooling package
@@ -0,0 +1,89 @@
+"""
+Offline g4f provider for benchmarks.
+
+    from bench.fake_provider import FakeProvider, register
+    register(latency=0.2, failure_rate=0.05, image_url="http://127.0.0.1:8001/")
+
+``register`` adds the provider to ``PROVIDER_REGISTRY`` so that
+``G4F_FREE_PROVIDERS=BenchFake`` routes every ``StableAIClient`` call to it:
+chat completions (streamed in chunks or whole), and image generation, which
+answers with URLs pointing at ``bench.image_stub``. Nothing leaves the host.
+"""
+
+import asyncio
+import random
+from itertools import count
+
+from g4f.providers.base_provider import AsyncGeneratorProvider
+from g4f.providers.response import ImageResponse
+
+from services.ai_client import PROVIDER_REGISTRY
+
+PROVIDER_NAME = "BenchFake"
+
+_REPLY = (
+    "Факел догорает, и в темноте коридора слышен скрежет когтей. "
+    "Мастер бросает кубик инициативы: гоблины уже близко. "
+)
+
+
+class FakeProvider(AsyncGeneratorProvider):
+    """
+    Answers after ``latency`` seconds (plus up to ``jitter``), failing with
+    probability ``failure_rate``. Streaming replies are split into ``chunks``
+    parts spread over the same latency. Like the real free providers it is an
+    async generator, which g4f's sync client drives on a private event loop.
+    """
+
+    url = "http://127.0.0.1"
+    working = True
+    supports_stream = True
+    supports_message_history = True
+
+    latency = 0.0
+    jitter = 0.0
+    failure_rate = 0.0
+    chunks = 20
+    reply = _REPLY * 4
+    image_url = "http://127.0.0.1:8001/"
+
+    _image_ids = count(1)
+
+    @classmethod
+    def configure(cls, **options) -> None:
+        for name, value in options.items():
+            if not hasattr(cls, name) or name.startswith("_"):
+                raise AttributeError(f"Unknown fake provider option: {name}")
+            setattr(cls, name, value)
+
+    @classmethod
+    async def create_async_generator(cls, model: str, messages, stream: bool = False, **kwargs):
+        delay = cls.latency + random.uniform(0, cls.jitter)
+        if random.random() < cls.failure_rate:
+            await asyncio.sleep(delay / 2)
+            raise RuntimeError("Fake provider failure")
+
+        if "prompt" in kwargs:
+            # Image request from g4f's Images client.
+            await asyncio.sleep(delay)
+            yield ImageResponse(f"{cls.image_url.rstrip('/')}/{next(cls._image_ids)}.jpg", kwargs["prompt"])
+            return
+
+        if not stream:
+            await asyncio.sleep(delay)
+            yield cls.reply
+            return
+
+        size = max(len(cls.reply) // max(cls.chunks, 1), 1)
+        parts = [cls.reply[i:i + size] for i in range(0, len(cls.reply), size)]
+        for part in parts:
+            await asyncio.sleep(delay / len(parts))
+            yield part
+
+
+def register(name: str = PROVIDER_NAME, **options) -> type:
+    """Configure the fake provider and make it selectable as ``name``."""
+
+    FakeProvider.configure(**options)
+    PROVIDER_REGISTRY[name] = FakeProvider
+    return FakeProvider
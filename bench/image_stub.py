@@ -0,0 +1,79 @@
+"""
+Local HTTP server that stands in for image hosts.
+
+    python -m bench.image_stub --port 8001 --size 200000 --latency 0.05
+
+Answers every GET with ``--size`` bytes of JPEG-looking data after
+``--latency`` seconds, so ``ImageDownloader`` can be benchmarked offline.
+"""
+
+import argparse
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+# JPEG SOI/APP0 marker followed by filler and the EOI marker.
+_HEADER = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00"
+_TRAILER = b"\xff\xd9"
+
+
+def _body(size: int) -> bytes:
+    filler = max(size - len(_HEADER) - len(_TRAILER), 0)
+    return _HEADER + b"\x00" * filler + _TRAILER
+
+
+class ImageStub:
+    """Threaded image server on ``127.0.0.1``; port 0 picks a free one."""
+
+    def __init__(self, port: int = 0, *, size: int = 200_000, latency: float = 0.0):
+        body = _body(size)
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if latency:
+                    time.sleep(latency)
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+
+    def start(self) -> "ImageStub":
+        Thread(target=self.server.serve_forever, name="image_stub", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--size", type=int, default=200_000, help="bytes per image")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before answering")
+    args = parser.parse_args(argv)
+
+    stub = ImageStub(args.port, size=args.size, latency=args.latency)
+    print(f"Serving {args.size} byte images on {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Benchmark for the full-text search index.
+
+    python -m bench.search --messages 100000 --queries 200
+
+Indexes synthetic chat messages, then reports the build time, the time a
+fresh worker needs to load the index from disk and per-query latency next to
+a linear scan over the message texts.
+"""
+
+import argparse
+import itertools
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+_WORDS = (
+    "эльф дракон замок лес гора река меч щит маг заклинание таверна трактирщик стража король королева "
+    "принц гоблин орк тролль гном пещера сокровище карта путь дорога ночь луна солнце огонь вода камень "
+    "кольцо амулет зелье яд стрела лук кинжал броня шлем конь повозка деревня город храм жрец бог демон "
+    "нежить скелет призрак вампир оборотень волк медведь ворон змея паук рыцарь наемник вор ассасин бард "
+    "druid ranger paladin warlock sorcerer cleric rogue fighter monk barbarian initiative spell slot"
+).split()
+_ENDINGS = ("", "", "а", "ы", "ов", "ом", "е", "ами")
+_SYLLABLES = "ба ве ги до жу зе ка ло ми но пу ра си то фу ха це чи ша ю ям ор ин ет ус ал".split()
+
+
+def _vocabulary(rng: random.Random, size: int):
+    """
+    ``size`` made-up words with Zipf frequencies, as in natural text; the
+    game words sit in the middle of the distribution and are the queries.
+    """
+
+    words = ["".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(size)]
+    words[50:50 + len(_WORDS)] = _WORDS
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    return words, list(itertools.accumulate(weights))
+
+
+def _message(rng: random.Random, vocabulary) -> str:
+    words, cumulative = vocabulary
+    count = rng.randint(5, 60)
+    chosen = rng.choices(words, cum_weights=cumulative, k=count)
+    return " ".join(word + rng.choice(_ENDINGS) for word in chosen).capitalize() + "."
+
+
+def _percentile(samples, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(7)
+    vocabulary = _vocabulary(rng, args.vocabulary)
+    with tempfile.TemporaryDirectory(prefix="jarvis-bench-") as data_dir:
+        os.environ["LOCAL_DATA_DIR"] = data_dir
+        from utils.search_index import SearchIndex, tokenize
+
+        documents = [
+            {
+                "id": f"message:{i}",
+                "kind": "message",
+                "user_id": f"user-{i % args.users}",
+                "session_id": i // 50,
+                "text": _message(rng, vocabulary),
+            }
+            for i in range(1, args.messages + 1)
+        ]
+
+        started = time.perf_counter()
+        SearchIndex("bench_search", indexes=("session_id",)).write(documents)
+        build = time.perf_counter() - started
+
+        started = time.perf_counter()
+        index = SearchIndex("bench_search", indexes=("session_id",))
+        index.search("дракон", user_id="user-0")
+        load = time.perf_counter() - started
+
+        queries = [" ".join(rng.sample(_WORDS, rng.randint(1, 3))) for _ in range(args.queries)]
+        # The first pass also sorts each term's postings by score once.
+        passes = []
+        for _ in range(2):
+            latencies = []
+            for query in queries:
+                started = time.perf_counter()
+                index.search(query, user_id="user-0", limit=20)
+                latencies.append(time.perf_counter() - started)
+            passes.append(latencies)
+
+        texts = [(document["user_id"], document["text"].lower()) for document in documents]
+        scans = []
+        for query in queries[:10]:
+            terms = tokenize(query)
+            started = time.perf_counter()
+            [text for user_id, text in texts if user_id == "user-0" and any(term in text for term in terms)]
+            scans.append(time.perf_counter() - started)
+
+    print(f"{args.messages} messages, {args.queries} queries")
+    print(f"build            {build:9.3f} s")
+    print(f"load in worker   {load:9.3f} s")
+    for name, latencies in zip(("first", "warm"), passes):
+        print(f"{name:<5} median      {statistics.median(latencies) * 1000:9.3f} ms")
+        print(f"{name:<5} p99         {_percentile(latencies, 0.99) * 1000:9.3f} ms")
+    for words in (1, 2, 3):
+        latencies = [seconds for query, seconds in zip(queries, passes[1]) if len(query.split()) == words]
+        print(f"warm  {words} word(s)  {statistics.median(latencies) * 1000:9.3f} ms median")
+    print(f"linear scan      {statistics.median(scans) * 1000:9.3f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+Report how long a worker takes to import the app and how much memory it holds.
+
+    python -m bench.startup --runs 5 --top 10
+
+Each run imports ``app`` in a fresh interpreter (as a gunicorn worker does)
+and records the wall time, the resident set size afterwards and whether g4f
+was loaded. ``-X importtime`` output of the last run is summed per top-level
+package to show where boot time goes. With ``--first-call`` the cost of
+loading the AI providers on the first request is measured as well.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+_PROBE = """
+import json, resource, sys, time
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+started = time.perf_counter()
+import app
+result = {"import_seconds": time.perf_counter() - started, "rss_mb": rss_mb(), "g4f_loaded": "g4f" in sys.modules}
+if FIRST_CALL:
+    from services.ai_client import get_ai_client
+    started = time.perf_counter()
+    get_ai_client().router
+    result["first_call_seconds"] = time.perf_counter() - started
+    result["rss_after_first_call_mb"] = rss_mb()
+print(json.dumps(result))
+"""
+
+
+def _probe(first_call: bool, data_dir: str):
+    env = dict(os.environ, LOCAL_DATA_DIR=data_dir, PYTHONPATH=str(ROOT))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.replace("FIRST_CALL", str(first_call))],
+        capture_output=True, text=True, cwd=ROOT, env=env, check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1]), completed.stderr
+
+
+def _import_totals(importtime_log: str):
+    """Sum self time per top-level package from ``-X importtime`` output."""
+
+    totals = defaultdict(int)
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            self_us, _, name = line[len("import time:"):].split("|", 2)
+            totals[name.strip().split(".")[0]] += int(self_us)
+        except ValueError:
+            continue
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="packages to list by import time")
+    parser.add_argument("--first-call", action="store_true", help="also load the AI providers")
+    args = parser.parse_args(argv)
+
+    results, importtime_log = [], ""
+    with tempfile.TemporaryDirectory(prefix="jarvis-bench-") as data_dir:
+        for _ in range(args.runs):
+            result, importtime_log = _probe(args.first_call, data_dir)
+            results.append(result)
+
+    def median(key):
+        return statistics.median(result[key] for result in results)
+
+    print(f"import app:      {median('import_seconds') * 1000:8.1f} ms (median of {args.runs})")
+    print(f"RSS after boot:  {median('rss_mb'):8.1f} MB")
+    print(f"g4f loaded:      {'yes' if results[-1]['g4f_loaded'] else 'no'}")
+    if args.first_call:
+        print(f"first AI call:   {median('first_call_seconds') * 1000:8.1f} ms to load providers")
+        print(f"RSS after call:  {median('rss_after_first_call_mb'):8.1f} MB")
+
+    print("\nSlowest packages to import (self time, last run):")
+    for name, micros in _import_totals(importtime_log)[: args.top]:
+        print(f"  {name:<24} {micros / 1000:8.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
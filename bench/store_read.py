@@ -0,0 +1,69 @@
+"""
+Microbenchmark for repeated ``JsonStore`` reads.
+
+    python -m bench.store_read --records 10000 --reads 200
+
+Compares the previous behaviour (``json.load`` + ``copy.deepcopy`` on every
+read) with the cached ``read()`` and ``snapshot()`` of the current store.
+"""
+
+import argparse
+import copy
+import json
+import os
+import sys
+import tempfile
+import time
+
+
+def _timed(func, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=10000)
+    parser.add_argument("--reads", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="jarvis-bench-") as data_dir:
+        os.environ["LOCAL_DATA_DIR"] = data_dir
+        from utils.local_storage import JsonStore
+
+        store = JsonStore("bench_images", default_factory=list)
+        store.write(
+            [
+                {
+                    "id": i,
+                    "user_id": "local-user",
+                    "url": f"https://example.invalid/{i}.jpg",
+                    "prompt": "Тёмный эльф в лунном лесу " * 4,
+                    "source": "chat",
+                    "created_at": "2025-01-01T00:00:00",
+                }
+                for i in range(1, args.records + 1)
+            ]
+        )
+
+        def uncached():
+            with open(store.path, "r", encoding="utf-8") as fh:
+                return copy.deepcopy(json.load(fh))
+
+        results = {
+            "json.load + deepcopy": _timed(uncached, args.reads),
+            "JsonStore.read()": _timed(store.read, args.reads),
+            "JsonStore.snapshot()": _timed(store.snapshot, args.reads),
+        }
+
+    baseline = results["json.load + deepcopy"]
+    print(f"{args.records} records, {args.reads} reads each")
+    for name, seconds in results.items():
+        print(f"{name:<24} {seconds * 1000:9.3f} ms/read  {baseline / seconds:8.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
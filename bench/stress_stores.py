@@ -0,0 +1,103 @@
+"""
+Hammer the local stores from several processes and verify nothing was lost.
+
+    python -m bench.stress_stores --processes 8 --iterations 200
+
+Each worker appends messages to a ``RecordLog`` and sessions to a ``JsonStore``
+(through ``append`` and ``transaction``) in a throwaway data directory.
+The script exits with a non-zero status if any record is missing or an id was
+handed out twice.
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+from collections import Counter
+
+
+def _worker(data_dir: str, worker_id: int, iterations: int) -> None:
+    os.environ["LOCAL_DATA_DIR"] = data_dir
+    from utils.local_storage import JsonStore, RecordLog
+
+    messages = RecordLog("stress_messages", indexes=("session_id", "user_id"))
+    sessions = JsonStore("stress_sessions", default_factory=list)
+    user_id = f"worker-{worker_id}"
+
+    for i in range(iterations):
+        messages.append(
+            [
+                {"session_id": worker_id, "user_id": user_id, "role": "user", "content": f"{i}"},
+                {"session_id": worker_id, "user_id": user_id, "role": "assistant", "content": f"{i}"},
+            ]
+        )
+        if i % 2:
+            sessions.append([{"user_id": user_id, "seq": i}])
+        else:
+            with sessions.transaction() as items:
+                items.append({"id": max((s["id"] for s in items), default=0) + 1, "user_id": user_id, "seq": i})
+        # Exercise concurrent readers alongside the writers.
+        messages.find("session_id", worker_id, last=2)
+
+
+def _verify(data_dir: str, processes: int, iterations: int) -> list:
+    os.environ["LOCAL_DATA_DIR"] = data_dir
+    from utils.local_storage import JsonStore, RecordLog
+
+    errors = []
+    messages = RecordLog("stress_messages", indexes=("session_id", "user_id")).read()
+    sessions = JsonStore("stress_sessions", default_factory=list).read()
+
+    for name, records, per_worker in (
+        ("messages", messages, iterations * 2),
+        ("sessions", sessions, iterations),
+    ):
+        expected = processes * per_worker
+        if len(records) != expected:
+            errors.append(f"{name}: expected {expected} records, found {len(records)}")
+        duplicates = [rid for rid, count in Counter(r["id"] for r in records).items() if count > 1]
+        if duplicates:
+            errors.append(f"{name}: {len(duplicates)} duplicate ids, e.g. {duplicates[:5]}")
+        per_user = Counter(r["user_id"] for r in records)
+        for worker_id in range(processes):
+            found = per_user.get(f"worker-{worker_id}", 0)
+            if found != per_worker:
+                errors.append(f"{name}: worker-{worker_id} wrote {per_worker}, found {found}")
+    return errors
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="jarvis-stress-") as data_dir:
+        workers = [
+            multiprocessing.Process(target=_worker, args=(data_dir, worker_id, args.iterations))
+            for worker_id in range(args.processes)
+        ]
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join()
+        if any(process.exitcode for process in workers):
+            print("A worker process crashed", file=sys.stderr)
+            return 1
+
+        errors = _verify(data_dir, args.processes, args.iterations)
+
+    for error in errors:
+        print(error, file=sys.stderr)
+    if errors:
+        return 1
+    print(
+        f"OK: {args.processes} processes x {args.iterations} iterations, "
+        "no lost records or duplicate ids"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
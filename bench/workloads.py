@@ -0,0 +1,381 @@
+"""
+End-to-end load test of the HTTP API with an offline provider.
+
+    python -m bench.workloads --records 1000 10000 100000 --concurrency 8 --duration 10
+    python -m bench.workloads --records 10000 --compare bench/results/1a2b3c4.json
+    python -m bench.workloads --records 1000 --server asgi --concurrency 200 --label asgi
+
+For every store size the app runs in a fresh process on a throwaway data
+directory seeded with that many images, chat messages and prompts. All
+providers are ``bench.fake_provider`` instances and image downloads go to
+``bench.image_stub``, so only the app's own overhead is measured.
+Each workload keeps ``--concurrency`` clients busy for ``--duration``
+seconds and reports throughput and p50/p95/p99 latency. Results are written
+to ``bench/results/<label>.json`` (the label defaults to the current commit)
+and can be compared against an earlier run with ``--compare``. ``--server
+asgi`` serves ``asgi:app`` with uvicorn instead of the threaded Flask app.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+from threading import Thread
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+SEED_USER = "local-user"
+MESSAGES_PER_SESSION = 20
+
+
+def _chat(http, base, state):
+    payload = {"message": f"Я открываю дверь №{state['calls']}", "session_id": state.get("session_id")}
+    response = http.post(f"{base}/api/chat", json=payload, timeout=120)
+    if response.ok:
+        state["session_id"] = response.json().get("session_id")
+    return response.ok
+
+
+def _chat_stream(http, base, state):
+    payload = {"message": f"Осматриваю комнату №{state['calls']}", "session_id": state.get("session_id")}
+    with http.post(f"{base}/api/chat/stream", json=payload, stream=True, timeout=120) as response:
+        if not response.ok:
+            return False
+        # Timed until the reply is stored; illustrations arrive later on the same stream.
+        for line in response.iter_lines(decode_unicode=True):
+            if line == "event: done":
+                return True
+            if line == "event: error":
+                return False
+    return False
+
+
+def _generate_image(http, base, state):
+    payload = {"prompt": f"Дракон над башней, вариант {state['calls']}"}
+    response = http.post(f"{base}/api/generate-image", json=payload, timeout=120)
+    return response.ok and bool(response.json().get("image_urls"))
+
+
+def _chat_history(http, base, state):
+    return http.get(f"{base}/api/chat-history", params={"limit": 50}, timeout=60).ok
+
+
+def _session_messages(http, base, state):
+    session_id = 1 + state["calls"] % state["seeded_sessions"]
+    return http.get(f"{base}/api/chat-history/{session_id}", params={"limit": 50}, timeout=60).ok
+
+
+def _images(http, base, state):
+    return http.get(f"{base}/api/images", params={"limit": 50}, timeout=60).ok
+
+
+def _prompts(http, base, state):
+    return http.get(f"{base}/api/prompts", timeout=60).ok
+
+
+WORKLOADS = {
+    "chat": _chat,
+    "chat_stream": _chat_stream,
+    "generate_image": _generate_image,
+    "chat_history": _chat_history,
+    "session_messages": _session_messages,
+    "images": _images,
+    "prompts": _prompts,
+}
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return None
+    index = min(int(len(ordered) * fraction), len(ordered) - 1)
+    return round(ordered[index] * 1000, 2)
+
+
+def _seed(records: int) -> int:
+    """Fill the stores with ``records`` images and messages; return the number of sessions."""
+
+    from services.chat_service import _set_session_stats
+    from utils.local_storage import JsonStore, open_record_store
+
+    started = datetime(2024, 1, 1)
+    stamp = lambda i: (started + timedelta(seconds=i)).isoformat()
+
+    sessions_count = max(records // MESSAGES_PER_SESSION, 1)
+    messages = [
+        {
+            "session_id": 1 + i // MESSAGES_PER_SESSION % sessions_count,
+            "user_id": SEED_USER,
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": "Тёмный эльф крадётся по лунному лесу, держа кинжал наготове. " * 3,
+            "created_at": stamp(i),
+        }
+        for i in range(records)
+    ]
+    message_log = open_record_store("chat_messages", indexes=("session_id", "user_id"))
+    stored = message_log.append(messages)
+
+    last_messages, counts = {}, Counter()
+    for message in stored:
+        last_messages[message["session_id"]] = message
+        counts[message["session_id"]] += 1
+    sessions = []
+    for session_id in range(1, sessions_count + 1):
+        session = {
+            "id": session_id,
+            "user_id": SEED_USER,
+            "session_name": f"Кампания {session_id}",
+            "created_at": stamp(session_id),
+            "updated_at": stamp(session_id),
+        }
+        _set_session_stats(session, last_messages[session_id], counts[session_id])
+        sessions.append(session)
+    JsonStore("chat_sessions", default_factory=list).write(sessions)
+
+    JsonStore("images", default_factory=list).write(
+        [
+            {
+                "id": i,
+                "user_id": SEED_USER,
+                "url": f"http://127.0.0.1/{i}.jpg",
+                "prompt": "Замок на утёсе в грозу, масляная живопись",
+                "source": "image_generator",
+                "created_at": stamp(i),
+            }
+            for i in range(1, records + 1)
+        ]
+    )
+    JsonStore("prompts", default_factory=list).write(
+        [
+            {"id": i, "user_id": SEED_USER, "title": f"Правило {i}", "content": "Говори как старый бард."}
+            for i in range(1, 21)
+        ]
+    )
+    return sessions_count
+
+
+def _drive(base: str, workload, concurrency: int, duration: float, seeded_sessions: int) -> dict:
+    import requests
+
+    latencies, errors = [], [0]
+    deadline = time.perf_counter() + duration
+
+    def client(worker_id):
+        http = requests.Session()
+        state = {"calls": worker_id * 100_000, "seeded_sessions": seeded_sessions}
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                ok = workload(http, base, state)
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            state["calls"] += 1
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors[0] += 1
+
+    started = time.perf_counter()
+    threads = [Thread(target=client, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors[0],
+        "throughput": round(len(ordered) / elapsed, 2),
+        "p50_ms": _percentile(ordered, 0.50),
+        "p95_ms": _percentile(ordered, 0.95),
+        "p99_ms": _percentile(ordered, 0.99),
+    }
+
+
+def _start_wsgi():
+    """Serve ``app`` with werkzeug's threaded server; return its URL and a stop function."""
+
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    from app import create_app
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, create_app(), threaded=True, request_handler=QuietHandler)
+    Thread(target=server.serve_forever, name="bench_server", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server.shutdown
+
+
+def _start_asgi():
+    """Serve ``asgi:app`` with uvicorn on one event loop; return its URL and a stop function."""
+
+    import socket
+
+    import uvicorn
+
+    from asgi import app
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning", access_log=False))
+    thread = Thread(target=server.run, kwargs={"sockets": [sock]}, name="bench_server", daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    def stop():
+        server.should_exit = True
+        thread.join()
+
+    return f"http://127.0.0.1:{sock.getsockname()[1]}", stop
+
+
+def _run_size(options: dict, records: int) -> dict:
+    """Seed a fresh data directory, start the app and run every workload against it."""
+
+    with tempfile.TemporaryDirectory(prefix="jarvis-bench-") as data_dir:
+        provider_names = [f"BenchFake{i}" for i in range(1, options["providers"] + 1)]
+        os.environ.update(
+            {
+                "LOCAL_DATA_DIR": data_dir,
+                "IMAGE_DOWNLOAD_DIR": os.path.join(data_dir, "downloads"),
+                "G4F_FREE_PROVIDERS": " ".join(provider_names),
+                "AI_CACHE_ENABLED": "true" if options["cache"] else "false",
+                "AI_CLIENT_BACKOFF_SECONDS": "0.5",
+                "METRICS_FLUSH_SECONDS": "60",
+            }
+        )
+
+        from bench.image_stub import ImageStub
+
+        stub = ImageStub(size=options["image_bytes"], latency=options["image_latency"]).start()
+
+        from bench.fake_provider import register
+
+        for name in provider_names:
+            register(
+                name,
+                latency=options["latency"],
+                jitter=options["jitter"],
+                failure_rate=options["failure_rate"],
+                image_url=stub.url,
+            )
+
+        seed_started = time.perf_counter()
+        seeded_sessions = _seed(records)
+        print(f"[{records}] seeded in {time.perf_counter() - seed_started:.1f}s", flush=True)
+
+        base, stop_server = (_start_asgi if options["server"] == "asgi" else _start_wsgi)()
+
+        results = {}
+        try:
+            for name in options["workloads"]:
+                results[name] = _drive(
+                    base, WORKLOADS[name], options["concurrency"], options["duration"], seeded_sessions
+                )
+                print(f"[{records}] {_format_row(name, results[name])}", flush=True)
+        finally:
+            stop_server()
+            stub.stop()
+        return results
+
+
+def _format_row(name: str, stats: dict) -> str:
+    return (
+        f"{name:<17} {stats['requests']:>7} req {stats['errors']:>5} err "
+        f"{stats['throughput']:>9.2f} req/s  p50 {stats['p50_ms']} ms  "
+        f"p95 {stats['p95_ms']} ms  p99 {stats['p99_ms']} ms"
+    )
+
+
+def _git_label() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "local"
+
+
+def _change(old, new) -> str:
+    if not old or new is None:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def _compare(baseline: dict, current: dict) -> None:
+    print(f"\nCompared with {baseline['label']} ({baseline['created_at']}):")
+    for records, workloads in current["results"].items():
+        for name, stats in workloads.items():
+            old = baseline["results"].get(records, {}).get(name)
+            if not old:
+                continue
+            print(
+                f"[{records}] {name:<17} throughput {old['throughput']} -> {stats['throughput']} "
+                f"({_change(old['throughput'], stats['throughput'])}), "
+                f"p95 {old['p95_ms']} -> {stats['p95_ms']} ms ({_change(old['p95_ms'], stats['p95_ms'])})"
+            )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--workloads", nargs="+", choices=sorted(WORKLOADS), default=list(WORKLOADS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per workload")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake provider latency, seconds")
+    parser.add_argument("--jitter", type=float, default=0.05, help="extra random latency, seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--providers", type=int, default=3, help="number of fake providers")
+    parser.add_argument("--image-bytes", type=int, default=200_000)
+    parser.add_argument("--image-latency", type=float, default=0.05)
+    parser.add_argument("--cache", action="store_true", help="keep the AI response cache enabled")
+    parser.add_argument(
+        "--server", choices=("wsgi", "asgi"), default="wsgi", help="threaded Flask app or the async asgi:app"
+    )
+    parser.add_argument("--label", default=None, help="result file name, defaults to the git commit")
+    parser.add_argument("--compare", type=Path, default=None, help="earlier result file to compare with")
+    args = parser.parse_args(argv)
+
+    options = {
+        key: value for key, value in vars(args).items() if key not in ("records", "label", "compare")
+    }
+    report = {
+        "label": args.label or _git_label(),
+        "created_at": datetime.utcnow().isoformat(),
+        "options": options,
+        "results": {},
+    }
+
+    # Stores and services bind to LOCAL_DATA_DIR at import time, so every
+    # size runs in its own interpreter.
+    context = multiprocessing.get_context("spawn")
+    for records in args.records:
+        with context.Pool(1) as pool:
+            report["results"][str(records)] = pool.apply(_run_size, (options, records))
+
+    RESULTS_DIR.mkdir(exist_ok=True)
+    result_path = RESULTS_DIR / f"{report['label']}.json"
+    with open(result_path, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, ensure_ascii=False, indent=2)
+    print(f"\nResults saved to {result_path}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as fh:
+            _compare(json.load(fh), report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
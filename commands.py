@@ -0,0 +1,53 @@
+import click
+from flask import Flask
+
+from services.chat_service import rebuild_session_stats, session_archive
+from services.search_service import rebuild_search_index
+from services.transfer_service import export_ndjson, import_ndjson
+
+
+def register_commands(app: Flask) -> None:
+    """Attach maintenance commands to ``flask --app app <command>``."""
+
+    @app.cli.command("rebuild-session-stats")
+    def rebuild_session_stats_command():
+        """Recompute last_message, message_count and updated_at of all chat sessions."""
+
+        count = rebuild_session_stats()
+        click.echo(f"Updated {count} chat sessions")
+
+    @app.cli.command("rebuild-search-index")
+    def rebuild_search_index_command():
+        """Rebuild the full-text index over chat messages, prompts and images."""
+
+        count = rebuild_search_index()
+        click.echo(f"Indexed {count} documents")
+
+    @app.cli.command("export-data")
+    @click.option("--user", "user_id", default=None, help="Only export this user's data.")
+    @click.option("--since", default=None, help="Only records created at or after this ISO date.")
+    @click.option("--until", default=None, help="Only records created before this ISO date.")
+    @click.option("--output", type=click.File("wb"), default="-", help="File to write (stdout by default).")
+    def export_data_command(user_id, since, until, output):
+        """Write sessions with their messages, prompts and images as NDJSON."""
+
+        for line in export_ndjson(user_id, since=since, until=until):
+            output.write(line)
+
+    @app.cli.command("import-data")
+    @click.argument("source", type=click.File("rb"))
+    @click.option("--user", "user_id", default=None, help="Import every record for this user.")
+    def import_data_command(source, user_id):
+        """Upsert an NDJSON export; importing the same file twice changes nothing."""
+
+        counts = import_ndjson(source, user_id=user_id)
+        click.echo(", ".join(f"{count} {kind}" for kind, count in counts.items()))
+
+    @app.cli.command("archive-sessions")
+    @click.option("--idle-days", type=float, default=None, help="Archive sessions idle this long (SESSION_ARCHIVE_AFTER_DAYS by default).")
+    def archive_sessions_command(idle_days):
+        """Move idle chat sessions out of the message store into compressed segments."""
+
+        max_idle_seconds = None if idle_days is None else idle_days * 24 * 3600
+        count = session_archive.archive_idle(max_idle_seconds)
+        click.echo(f"Archived {count} chat sessions")
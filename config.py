@@ -17,4 +17,26 @@ class Config:
     _default_image_dir = BASE_DIR / "images"
     IMAGE_DOWNLOAD_DIR = Path(
         os.getenv("IMAGE_DOWNLOAD_DIR", str(_default_image_dir))
-    ).expanduser().resolve()
\ No newline at end of file
+    ).expanduser().resolve()
+    IMAGE_DOWNLOAD_WORKERS = int(os.getenv("IMAGE_DOWNLOAD_WORKERS", "4"))
+    IMAGE_DOWNLOAD_MAX_BYTES = int(os.getenv("IMAGE_DOWNLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+    IMAGE_DOWNLOAD_MAX_ATTEMPTS = int(os.getenv("IMAGE_DOWNLOAD_MAX_ATTEMPTS", "3"))
+    IMAGE_DOWNLOAD_BACKOFF_SECONDS = float(os.getenv("IMAGE_DOWNLOAD_BACKOFF_SECONDS", "1"))
+    IMAGE_DOWNLOAD_TIMEOUT = float(os.getenv("IMAGE_DOWNLOAD_TIMEOUT", "60"))
+    # Quota of the download directory; 0 disables a limit. Least recently served files go first.
+    IMAGE_STORAGE_MAX_BYTES = int(os.getenv("IMAGE_STORAGE_MAX_BYTES", str(1024 * 1024 * 1024)))
+    IMAGE_STORAGE_MAX_FILES = int(os.getenv("IMAGE_STORAGE_MAX_FILES", "0"))
+    IMAGE_STORAGE_SWEEP_SECONDS = float(os.getenv("IMAGE_STORAGE_SWEEP_SECONDS", "600"))
+    IMAGE_STORAGE_ORPHAN_GRACE_SECONDS = float(os.getenv("IMAGE_STORAGE_ORPHAN_GRACE_SECONDS", "3600"))
+    IMAGE_CACHE_MAX_AGE = int(os.getenv("IMAGE_CACHE_MAX_AGE", str(365 * 24 * 3600)))
+    IMAGE_GENERATION_WORKERS = int(os.getenv("IMAGE_GENERATION_WORKERS", "8"))
+    IMAGE_GENERATION_PER_USER = int(os.getenv("IMAGE_GENERATION_PER_USER", "4"))
+    IMAGE_DEFAULT_COUNT = int(os.getenv("IMAGE_DEFAULT_COUNT", "4"))
+    IMAGE_MAX_COUNT = int(os.getenv("IMAGE_MAX_COUNT", "8"))
+    # Sessions idle for longer are moved out of the message store; 0 disables archiving.
+    SESSION_ARCHIVE_AFTER_DAYS = float(os.getenv("SESSION_ARCHIVE_AFTER_DAYS", "30"))
+    SESSION_ARCHIVE_INTERVAL_SECONDS = float(os.getenv("SESSION_ARCHIVE_INTERVAL_SECONDS", "3600"))
+    # JSON responses at least this large are sent gzip- or brotli-compressed when the client accepts it.
+    RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+    # Threads that run the synchronous Flask routes in the async (ASGI) mode.
+    ASGI_WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", "8"))
@@ -0,0 +1,48 @@
+from services.async_chat_service import AsyncChatService
+from utils.asgi import Request, SSEResponse, json_response
+from utils.local_user import get_user_id
+
+chat_service = AsyncChatService()
+
+
+async def chat(request: Request):
+    data = request.json()
+    message = data.get("message", "").strip()
+    if not message:
+        return json_response({"error": "No message provided"}, 400)
+
+    try:
+        result = await chat_service.process_chat_message_async(
+            user_id=get_user_id(),
+            message=message,
+            selected_prompts=data.get("selected_prompts", []),
+            session_id=data.get("session_id"),
+            model=data.get("model"),
+        )
+        return json_response(result)
+    except Exception as exc:
+        print(f"Chat error: {exc}")
+        return json_response({"error": "Failed to generate response. Please try again."}, 500)
+
+
+async def chat_stream(request: Request):
+    data = request.json()
+    message = data.get("message", "").strip()
+    if not message:
+        return json_response({"error": "No message provided"}, 400)
+
+    events = chat_service.stream_chat_message_async(
+        user_id=get_user_id(),
+        message=message,
+        selected_prompts=data.get("selected_prompts", []),
+        session_id=data.get("session_id"),
+        model=data.get("model"),
+    )
+    return SSEResponse(events, "Failed to generate response. Please try again.")
+
+
+# Async counterparts of the routes in routes/chat.py, served by asgi.py.
+routes = {
+    ("POST", "/api/chat"): chat,
+    ("POST", "/api/chat/stream"): chat_stream,
+}
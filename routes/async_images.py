@@ -0,0 +1,44 @@
+from services.async_image_service import AsyncImageService
+from services.image_service import InvalidImageCountError
+from utils.asgi import Request, SSEResponse, json_response
+from utils.local_user import get_user_id
+
+image_service = AsyncImageService()
+
+
+async def generate_image(request: Request):
+    data = request.json()
+    prompt = data.get("prompt", "").strip()
+    if not prompt:
+        return json_response({"error": "Prompt is required to generate images."}, 400)
+    try:
+        count = image_service.image_count(data.get("n"))
+    except InvalidImageCountError as exc:
+        return json_response({"error": str(exc)}, 400)
+    try:
+        result = await image_service.generate_image_async(get_user_id(), prompt, count)
+        return json_response(result)
+    except Exception as exc:
+        print(f"Error generating image: {exc}")
+        return json_response({"error": "Failed to generate image."}, 500)
+
+
+async def generate_image_stream(request: Request):
+    data = request.json()
+    prompt = data.get("prompt", "").strip()
+    if not prompt:
+        return json_response({"error": "Prompt is required to generate images."}, 400)
+    try:
+        count = image_service.image_count(data.get("n"))
+    except InvalidImageCountError as exc:
+        return json_response({"error": str(exc)}, 400)
+
+    events = image_service.stream_images_async(get_user_id(), prompt, count)
+    return SSEResponse(events, "Failed to generate image.")
+
+
+# Async counterparts of the generation routes in routes/images.py, served by asgi.py.
+routes = {
+    ("POST", "/api/generate-image"): generate_image,
+    ("POST", "/api/generate-image/stream"): generate_image_stream,
+}
@@ -1,7 +1,10 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 
 from services.chat_service import ChatService
+from utils.http_cache import conditional_json
 from utils.local_user import get_user_id
+from utils.pagination import InvalidPageError, page_response, parse_page_args
+from utils.sse import iter_sse
 
 chat_bp = Blueprint("chat", __name__, url_prefix="/api")
 chat_service = ChatService()
@@ -32,16 +35,53 @@ def chat():
         return jsonify({"error": "Failed to generate response. Please try again."}), 500
 
 
+@chat_bp.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    data = request.get_json() or {}
+    message = data.get("message", "").strip()
+
+    if not message:
+        return jsonify({"error": "No message provided"}), 400
+
+    events = chat_service.stream_chat_message(
+        user_id=get_user_id(),
+        message=message,
+        selected_prompts=data.get("selected_prompts", []),
+        session_id=data.get("session_id"),
+        model=data.get("model"),
+    )
+    return Response(
+        stream_with_context(iter_sse(events, "Failed to generate response. Please try again.")),
+        mimetype="text/event-stream",
+        # Disable proxy buffering so tokens reach the browser as they are produced.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @chat_bp.route("/chat-history", methods=["GET"])
 def chat_history():
-    history = chat_service.list_chat_sessions(get_user_id())
-    return jsonify(history)
+    try:
+        limit, cursor, fields = parse_page_args(request.args)
+    except InvalidPageError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    def build():
+        history, next_cursor = chat_service.list_chat_sessions(get_user_id(), limit=limit, cursor=cursor)
+        return page_response(history, next_cursor, limit, fields)
+
+    return conditional_json(chat_service.sessions_version(), build)
 
 
 @chat_bp.route("/chat-history/<int:session_id>", methods=["GET"])
 def chat_history_session(session_id):
-    messages = chat_service.get_session_messages(session_id, get_user_id())
-    return jsonify(messages)
+    try:
+        limit, cursor, fields = parse_page_args(request.args)
+    except InvalidPageError as exc:
+        return jsonify({"error": str(exc)}), 400
+    messages, next_cursor = chat_service.get_session_messages(
+        session_id, get_user_id(), limit=limit, cursor=cursor
+    )
+    return jsonify(page_response(messages, next_cursor, limit, fields))
 
 
 @chat_bp.route("/chat-history/<int:session_id>", methods=["DELETE"])
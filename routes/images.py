@@ -1,9 +1,15 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, redirect, request, send_file, stream_with_context
 
-from services.image_service import ImageService
+from config import Config
+from services.image_service import ImageService, InvalidImageCountError, image_storage, local_image_file
+from services.thumbnails import THUMBNAIL_SIZES, get_thumbnail
+from utils.http_cache import conditional_json
 from utils.local_user import get_user_id
+from utils.pagination import InvalidPageError, page_response, parse_page_args
+from utils.sse import iter_sse
 
 images_bp = Blueprint("images", __name__, url_prefix="/api")
+image_files_bp = Blueprint("image_files", __name__)
 image_service = ImageService()
 
 
@@ -14,17 +20,48 @@ def generate_image():
     if not prompt:
         return jsonify({"error": "Prompt is required to generate images."}), 400
     try:
-        result = image_service.generate_image(get_user_id(), prompt)
+        count = image_service.image_count(data.get("n"))
+    except InvalidImageCountError as exc:
+        return jsonify({"error": str(exc)}), 400
+    try:
+        result = image_service.generate_image(get_user_id(), prompt, count)
         return jsonify(result)
     except Exception as exc:
         print(f"Error generating image: {exc}")
         return jsonify({"error": "Failed to generate image."}), 500
 
 
+@images_bp.route("/generate-image/stream", methods=["POST"])
+def generate_image_stream():
+    data = request.get_json() or {}
+    prompt = data.get("prompt", "").strip()
+    if not prompt:
+        return jsonify({"error": "Prompt is required to generate images."}), 400
+    try:
+        count = image_service.image_count(data.get("n"))
+    except InvalidImageCountError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    events = image_service.stream_images(get_user_id(), prompt, count)
+    return Response(
+        stream_with_context(iter_sse(events, "Failed to generate image.")),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @images_bp.route("/images", methods=["GET"])
 def get_images():
-    images = image_service.list_images(get_user_id())
-    return jsonify(images)
+    try:
+        limit, cursor, fields = parse_page_args(request.args)
+    except InvalidPageError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    def build():
+        images, next_cursor = image_service.list_images(get_user_id(), limit=limit, cursor=cursor)
+        return page_response(images, next_cursor, limit, fields)
+
+    return conditional_json(image_service.images_version(), build)
 
 
 @images_bp.route("/images/<int:image_id>", methods=["PUT"])
@@ -43,4 +80,27 @@ def update_image(image_id):
 def delete_image(image_id):
     if image_service.delete_image(image_id, get_user_id()):
         return "", 204
-    return "", 404
\ No newline at end of file
+    return "", 404
+
+
+@image_files_bp.route("/images/<int:image_id>", methods=["GET"])
+def image_file(image_id):
+    size = request.args.get("size")
+    if size and size not in THUMBNAIL_SIZES:
+        return jsonify({"error": f"size must be one of: {', '.join(THUMBNAIL_SIZES)}"}), 400
+    image = image_service.get_image(image_id, get_user_id())
+    if not image:
+        return "", 404
+
+    path = local_image_file(image)
+    if path is None:
+        # Not downloaded (yet): let the browser fetch it from the provider.
+        return redirect(image["url"])
+    image_storage.touch(path)
+    if size:
+        path = get_thumbnail(path, size)
+
+    # File names are content hashes, which makes them strong validators.
+    response = send_file(path, etag=path.stem, max_age=Config.IMAGE_CACHE_MAX_AGE, conditional=True)
+    response.cache_control.public = True
+    return response
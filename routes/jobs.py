@@ -0,0 +1,14 @@
+from flask import Blueprint, jsonify
+
+from services.job_queue import get_job
+from utils.local_user import get_user_id
+
+jobs_bp = Blueprint("jobs", __name__, url_prefix="/api")
+
+
+@jobs_bp.route("/jobs/<int:job_id>", methods=["GET"])
+def job_status(job_id):
+    job = get_job(job_id, get_user_id())
+    if job:
+        return jsonify(job)
+    return "", 404
@@ -0,0 +1,28 @@
+import time
+
+from flask import Blueprint, Response, g, request
+
+from utils.metrics import HTTP_REQUEST_DURATION, HTTP_REQUESTS, render_metrics
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+@metrics_bp.before_app_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+
+@metrics_bp.after_app_request
+def record_request(response):
+    started = g.pop("request_started", None)
+    # Label by route rule, not raw path, to keep the number of series bounded.
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    if started is not None and endpoint != "/metrics":
+        HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+        HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
@@ -1,7 +1,9 @@
 from flask import Blueprint, jsonify, request
 
 from services.prompt_service import PromptService
+from utils.http_cache import conditional_json
 from utils.local_user import get_user_id
+from utils.pagination import InvalidPageError, page_response, parse_page_args
 
 prompts_bp = Blueprint("prompts", __name__, url_prefix="/api")
 prompt_service = PromptService()
@@ -9,8 +11,16 @@ prompt_service = PromptService()
 
 @prompts_bp.route("/prompts", methods=["GET"])
 def get_prompts():
-    prompts = prompt_service.get_user_prompts(get_user_id())
-    return jsonify(prompts)
+    try:
+        limit, cursor, fields = parse_page_args(request.args)
+    except InvalidPageError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    def build():
+        prompts, next_cursor = prompt_service.get_user_prompts(get_user_id(), limit=limit, cursor=cursor)
+        return page_response(prompts, next_cursor, limit, fields)
+
+    return conditional_json(prompt_service.prompts_version(), build)
 
 
 @prompts_bp.route("/prompts", methods=["POST"])
@@ -0,0 +1,32 @@
+from flask import Blueprint, jsonify, request
+
+from services.search_service import SEARCH_KINDS, SearchService
+from utils.local_user import get_user_id
+
+search_bp = Blueprint("search", __name__, url_prefix="/api")
+search_service = SearchService()
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+
+@search_bp.route("/search", methods=["GET"])
+def search():
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "Search query is required."}), 400
+
+    raw_types = request.args.get("types", "")
+    kinds = [kind.strip() for kind in raw_types.split(",") if kind.strip()] or None
+    if kinds and any(kind not in SEARCH_KINDS for kind in kinds):
+        return jsonify({"error": f"types must be a subset of {', '.join(SEARCH_KINDS)}"}), 400
+
+    try:
+        limit = int(request.args.get("limit") or DEFAULT_SEARCH_LIMIT)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
+
+    results = search_service.search(get_user_id(), query, kinds=kinds, limit=min(limit, MAX_SEARCH_LIMIT))
+    return jsonify({"query": query, "results": results})
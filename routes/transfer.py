@@ -0,0 +1,36 @@
+from datetime import datetime
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+
+from services.transfer_service import InvalidExportError, export_ndjson, import_ndjson
+from utils.local_user import get_user_id
+
+transfer_bp = Blueprint("transfer", __name__, url_prefix="/api")
+
+
+@transfer_bp.route("/export", methods=["GET"])
+def export_data():
+    since = request.args.get("since") or None
+    until = request.args.get("until") or None
+    for name, value in (("since", since), ("until", until)):
+        if value is not None:
+            try:
+                datetime.fromisoformat(value)
+            except ValueError:
+                return jsonify({"error": f"{name} must be an ISO date or datetime"}), 400
+
+    return Response(
+        stream_with_context(export_ndjson(get_user_id(), since=since, until=until)),
+        mimetype="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=jarvis-export.ndjson"},
+    )
+
+
+@transfer_bp.route("/import", methods=["POST"])
+def import_data():
+    # Read line by line from the request body instead of loading it whole.
+    try:
+        counts = import_ndjson(request.stream, user_id=get_user_id())
+    except InvalidExportError as exc:
+        return jsonify({"error": str(exc)}), 400
+    return jsonify(counts)
@@ -1,25 +1,50 @@
+import importlib
 import os
 import time
-from typing import Callable, Iterable, List, Optional, Sequence
-
-from g4f.client import Client
-from g4f.Provider import OperaAria, Chatai, WeWordle, Startnest
-from g4f.providers.retry_provider import RetryProvider
-from g4f.errors import (
-    ProviderNotWorkingError,
-    RateLimitError,
-    ModelNotFoundError,
-    StreamNotSupportedError,
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from itertools import chain
+from threading import Lock
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+from services.provider_router import ProviderRouter
+from services.response_cache import ResponseCache
+from utils.metrics import AI_PROVIDER_DURATION
+
+if TYPE_CHECKING:
+    from g4f.client import Client
+
+# g4f and its providers take a third of a second and ~30 MB to import, so they
+# are loaded on the first AI call rather than when a worker boots.
+
+# Runs provider calls when hedging is on, so a slow call can be raced by a second one.
+_request_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("AI_REQUEST_WORKERS", "16")), thread_name_prefix="ai_request"
 )
 
 
-PROVIDER_REGISTRY = {
-    "OperaAria": OperaAria,
-    "Chatai": Chatai,
-    "WeWordle": WeWordle,
-    "Startnest": Startnest,
+# Provider classes or import paths of them, resolved on first use.
+PROVIDER_REGISTRY: Dict[str, Union[str, type]] = {
+    "OperaAria": "g4f.Provider.OperaAria",
+    "Chatai": "g4f.Provider.Chatai",
+    "WeWordle": "g4f.Provider.WeWordle",
+    "Startnest": "g4f.Provider.Startnest",
 }
 
+_shared_client = None
+_shared_client_lock = Lock()
+
+
+def get_ai_client() -> "StableAIClient":
+    """Return the process-wide client shared by all services."""
+
+    global _shared_client
+    if _shared_client is None:
+        with _shared_client_lock:
+            if _shared_client is None:
+                _shared_client = StableAIClient()
+    return _shared_client
+
 
 def _parse_provider_names(raw: Optional[str]) -> List[str]:
     if not raw:
@@ -27,12 +52,50 @@ def _parse_provider_names(raw: Optional[str]) -> List[str]:
     return [name.strip() for name in raw.split() if name.strip()]
 
 
+def _load_provider(spec: Union[str, type, None]) -> Optional[type]:
+    if not isinstance(spec, str):
+        return spec
+    module_name, _, attr = spec.rpartition(".")
+    try:
+        return getattr(importlib.import_module(module_name), attr, None)
+    except ImportError as exc:
+        print(f"Failed to import provider {spec}: {exc}")
+        return None
+
+
+def _chunk_text(chunk) -> Optional[str]:
+    choices = getattr(chunk, "choices", None)
+    if not choices:
+        return None
+    delta = getattr(choices[0], "delta", None)
+    content = getattr(delta, "content", None)
+    return content if isinstance(content, str) else None
+
+
+def _image_entries(response) -> List[dict]:
+    """Reduce an images response to plain dicts that can be cached as JSON."""
+
+    entries = []
+    for item in getattr(response, "data", None) or []:
+        if isinstance(item, dict):
+            url, b64_json = item.get("url"), item.get("b64_json")
+        else:
+            url, b64_json = getattr(item, "url", None), getattr(item, "b64_json", None)
+        if url or b64_json:
+            entries.append({"url": url, "b64_json": b64_json})
+    return entries
+
+
+def _images_response(entries: List[dict]):
+    return SimpleNamespace(data=[SimpleNamespace(**entry) for entry in entries])
+
+
 class StableAIClient:
     """
-    Wraps g4f.Client with a retry-aware provider configuration and backoff logic.
+    Wraps g4f.Client with health-aware provider routing and backoff logic.
     The defaults follow the guidance from ИСПОЛЬЗОВАНИЕ_БЕСПЛАТНЫХ_ПРОВАЙДЕРОВ.md:
     - Use only free providers (needs_auth = False)
-    - Randomize provider order to distribute load
+    - Prefer fast, healthy providers and skip ones whose circuit is open
     - Retry across providers before surfacing an error
     """
 
@@ -42,7 +105,8 @@ class StableAIClient:
         *,
         max_attempts: Optional[int] = None,
         backoff_seconds: Optional[float] = None,
-        retry_provider_max_retries: Optional[int] = None,
+        router: Optional[ProviderRouter] = None,
+        response_cache: Optional[ResponseCache] = None,
     ):
         raw_env_providers = os.getenv("G4F_FREE_PROVIDERS")
         self.provider_names = (
@@ -56,29 +120,126 @@ class StableAIClient:
         self.backoff_seconds = backoff_seconds or float(
             os.getenv("AI_CLIENT_BACKOFF_SECONDS", "5")
         )
-        self.retry_provider_max_retries = retry_provider_max_retries or int(
-            os.getenv("AI_PROVIDER_MAX_RETRIES", "3")
-        )
         self.shuffle_providers = os.getenv("AI_PROVIDER_SHUFFLE", "true").lower() != "false"
 
         self.default_chat_model = os.getenv("G4F_CHAT_MODEL", "gpt-4o-mini")
         self.default_image_model = os.getenv("G4F_IMAGE_MODEL", "sdxl-1.0")
 
-        self.client = self._build_client()
+        self.response_cache = response_cache or ResponseCache.from_env()
+        self.hedge_after_seconds = float(os.getenv("AI_HEDGE_AFTER_SECONDS", "8"))
+        self.hedge_max_parallel = int(os.getenv("AI_HEDGE_MAX_PARALLEL", "2"))
+        self._providers: Optional[Dict[str, type]] = None
+        self._router = router
+        self._setup_lock = Lock()
+        self._clients = {}
+
+    @property
+    def providers(self) -> Dict[str, type]:
+        """Working provider classes by name; imports g4f on first access."""
+
+        if self._providers is None:
+            with self._setup_lock:
+                if self._providers is None:
+                    self._providers = self._resolve_providers(self.provider_names)
+        return self._providers
+
+    @property
+    def router(self) -> ProviderRouter:
+        if self._router is None:
+            names = list(self.providers)
+            with self._setup_lock:
+                if self._router is None:
+                    self._router = ProviderRouter(
+                        names,
+                        failure_threshold=int(os.getenv("AI_CIRCUIT_FAILURE_THRESHOLD", "3")),
+                        cooldown_seconds=float(os.getenv("AI_CIRCUIT_COOLDOWN_SECONDS", "60")),
+                        retry_backoff_seconds=self.backoff_seconds,
+                        alpha=float(os.getenv("AI_ROUTER_EWMA_ALPHA", "0.3")),
+                        shuffle=self.shuffle_providers,
+                    )
+        return self._router
+
+    def chat_completion(
+        self, *, messages: List[dict], model: Optional[str] = None, cache: bool = True, **kwargs
+    ) -> str:
+        """Return the reply text; ``cache=False`` always asks the provider."""
 
-    def chat_completion(self, *, messages: List[dict], model: Optional[str] = None, **kwargs) -> str:
         payload = {
             "model": model or self.default_chat_model,
             "messages": messages,
             **kwargs,
         }
+        cache_key = self.response_cache.chat_key(payload) if cache else None
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            return cached
 
-        response = self._run_with_retry(lambda: self.client.chat.completions.create(**payload))
+        started = time.monotonic()
+        response = self._run_with_retry(
+            lambda client: client.chat.completions.create(**payload), kind="chat", model=payload["model"]
+        )
 
         if not response or not getattr(response, "choices", None):
             raise RuntimeError("AI response did not contain any choices")
 
-        return response.choices[0].message.content
+        content = response.choices[0].message.content
+        self.response_cache.set(cache_key, content, latency=time.monotonic() - started)
+        return content
+
+    def stream_chat_completion(
+        self, *, messages: List[dict], model: Optional[str] = None, cache: bool = True, **kwargs
+    ) -> Iterator[str]:
+        """
+        Yield the response text piece by piece as the provider produces it.
+
+        Provider failures are retried only until the first chunk arrives;
+        once text has been handed to the caller a failure is raised as is.
+        Streamed replies share cache entries with ``chat_completion``; a
+        cached reply is yielded as a single piece.
+        """
+
+        payload = {
+            "model": model or self.default_chat_model,
+            "messages": messages,
+            **kwargs,
+        }
+        cache_key = self.response_cache.chat_key(payload) if cache else None
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+        from g4f.errors import StreamNotSupportedError
+
+        started = time.monotonic()
+        try:
+            first_chunk, chunks = self._run_with_retry(
+                lambda client: self._open_stream(client, {**payload, "stream": True}),
+                discard=lambda opened: getattr(opened[1], "close", lambda: None)(),
+                kind="stream",
+                model=payload["model"],
+            )
+        except StreamNotSupportedError:
+            yield self.chat_completion(messages=messages, model=model, cache=cache, **kwargs)
+            return
+        if first_chunk is None:
+            raise RuntimeError("AI response stream ended without any content")
+
+        parts = []
+        for chunk in chain((first_chunk,), chunks):
+            text = _chunk_text(chunk)
+            if text:
+                parts.append(text)
+                yield text
+        # Only a stream that ran to the end is cached.
+        self.response_cache.set(cache_key, "".join(parts) or None, latency=time.monotonic() - started)
+
+    @staticmethod
+    def _open_stream(client: "Client", payload: dict):
+        # g4f only contacts the provider when the stream is iterated, so pull the
+        # first chunk here to let _run_with_retry see connection errors.
+        chunks = iter(client.chat.completions.create(**payload))
+        return next(chunks, None), chunks
 
     def generate_image(
         self,
@@ -86,70 +247,177 @@ class StableAIClient:
         prompt: str,
         model: Optional[str] = None,
         response_format: str = "url",
+        cache: bool = False,
         **kwargs,
     ):
+        """
+        Generate images for ``prompt``.
+
+        Not cached by default: asking twice for the same prompt should give new
+        images. With ``cache=True`` a repeated request within the image TTL gets
+        the cached result, in the same ``data[i].url`` shape as a provider reply.
+        """
+
         payload = {
             "model": model or self.default_image_model,
             "prompt": prompt,
             "response_format": response_format,
             **kwargs,
         }
+        cache_key = self.response_cache.key("image", payload) if cache else None
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            return _images_response(cached)
 
-        return self._run_with_retry(lambda: self.client.images.generate(**payload))
+        started = time.monotonic()
+        response = self._run_with_retry(
+            lambda client: client.images.generate(**payload), kind="image", model=payload["model"]
+        )
+        self.response_cache.set(
+            cache_key,
+            _image_entries(response) or None,
+            latency=time.monotonic() - started,
+            ttl=self.response_cache.image_ttl_seconds,
+        )
+        return response
 
-    def _run_with_retry(self, func: Callable):
+    def _run_with_retry(
+        self,
+        func: Callable[["Client"], Any],
+        discard: Optional[Callable[[Any], None]] = None,
+        *,
+        kind: str = "chat",
+        model: Optional[str] = None,
+    ):
+        """
+        Call ``func`` with a client bound to one provider at a time.
+
+        Providers are tried in the router's order. A failed provider is parked
+        by the router instead of the thread sleeping, so the next attempt goes
+        straight to another provider. With hedging on, a request that has not
+        answered within the hedge delay is also sent to the next provider and
+        the first answer wins; ``discard`` receives answers that lost the race.
+        """
+
+        from g4f.errors import ModelNotFoundError, StreamNotSupportedError
+
+        names = self.router.candidates(self.max_attempts)
+        pending: Dict[Future, str] = {}
+        exhausted = False
+        attempts = 0
         last_error = None
+        model_errors = []
 
-        for attempt in range(self.max_attempts):
-            try:
-                return func()
-            except ModelNotFoundError as exc:
-                # Fail immediately to let the caller switch models.
-                raise exc
-            except StreamNotSupportedError:
-                # Fallback by reissuing the request without stream hint.
-                return func()
-            except (ProviderNotWorkingError, RateLimitError) as exc:
-                last_error = exc
-                if attempt < self.max_attempts - 1:
-                    wait_time = self.backoff_seconds * (attempt + 1)
-                    time.sleep(wait_time)
-                    self._refresh_client()
-                    continue
+        while True:
+            # Reached after a failure or once the hedge delay has passed.
+            if not exhausted and len(pending) < max(self.hedge_max_parallel, 1):
+                future, name = self._launch(names, func, set(pending.values()), {"kind": kind, "model": model})
+                if future is None:
+                    exhausted = True
+                else:
+                    attempts += 1
+                    pending[future] = name
+            if not pending:
                 break
 
+            timeout = None
+            if self.hedging and not exhausted and len(pending) < self.hedge_max_parallel:
+                timeout = self.router.hedge_delay(name, self.hedge_after_seconds)
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                del pending[future]
+                try:
+                    result = future.result()
+                except ModelNotFoundError as exc:
+                    model_errors.append(exc)
+                except StreamNotSupportedError:
+                    # The caller falls back to a non-streaming request.
+                    self._abandon(pending, discard)
+                    raise
+                except Exception as exc:
+                    last_error = exc
+                else:
+                    self._abandon(pending, discard)
+                    return result
+
+        if last_error is None and model_errors:
+            # Fail immediately to let the caller switch models.
+            raise model_errors[-1]
+
         if last_error:
             raise RuntimeError(
-                f"AI provider failed after {self.max_attempts} attempts: {last_error}"
+                f"AI provider failed after {attempts} attempts: {last_error}"
             ) from last_error
 
-        raise RuntimeError("AI provider failed without raising an explicit error")
+        raise RuntimeError("No AI provider is available, all of them are backing off after failures")
 
-    def _refresh_client(self):
-        # Re-initialize the underlying g4f Client with a fresh provider rotation.
-        self.client = self._build_client()
+    @property
+    def hedging(self) -> bool:
+        """Whether a slow call is raced against the next provider."""
 
-    def _build_client(self) -> Client:
-        providers = self._resolve_providers(self.provider_names)
+        return self.hedge_after_seconds > 0 and self.hedge_max_parallel > 1
 
-        retry_provider = RetryProvider(
-            providers=providers,
-            shuffle=self.shuffle_providers,
-            single_provider_retry=False,
-            max_retries=self.retry_provider_max_retries,
-        )
+    def _launch(self, names: Iterator[str], func: Callable[["Client"], Any], busy: set, labels: Dict):
+        name = self.router.claim_next(names, busy)
+        if name is None:
+            return None, None
+        if self.hedging:
+            return _request_executor.submit(self._attempt, name, func, labels), name
+        # Without hedging the call runs on the request thread.
+        future = Future()
+        try:
+            future.set_result(self._attempt(name, func, labels))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future, name
+
+    def _attempt(self, name: str, func: Callable[["Client"], Any], labels: Dict):
+        from g4f.errors import ModelNotFoundError, StreamNotSupportedError
+
+        started = time.monotonic()
+        try:
+            result = func(self._client_for(name))
+        except (ModelNotFoundError, StreamNotSupportedError):
+            # Says nothing about the provider's health.
+            self.router.release(name)
+            AI_PROVIDER_DURATION.observe(time.monotonic() - started, provider=name, outcome="unsupported", **labels)
+            raise
+        except Exception as exc:
+            self.router.record_failure(name, time.monotonic() - started, exc)
+            AI_PROVIDER_DURATION.observe(time.monotonic() - started, provider=name, outcome="error", **labels)
+            raise
+        self.router.record_success(name, time.monotonic() - started)
+        AI_PROVIDER_DURATION.observe(time.monotonic() - started, provider=name, outcome="ok", **labels)
+        return result
+
+    @staticmethod
+    def _abandon(pending: Dict[Future, str], discard: Optional[Callable[[Any], None]]):
+        # Running calls cannot be interrupted; their answers are dropped when they arrive.
+        for future in pending:
+            if future.cancel() or discard is None:
+                continue
+            future.add_done_callback(
+                lambda f: discard(f.result()) if not f.cancelled() and f.exception() is None else None
+            )
+
+    def _client_for(self, name: str) -> "Client":
+        from g4f.client import Client
 
-        return Client(provider=retry_provider)
+        client = self._clients.get(name)
+        if client is None:
+            client = self._clients[name] = Client(provider=self.providers[name])
+        return client
 
     @staticmethod
-    def _resolve_providers(names: Iterable[str]):
-        resolved = []
+    def _resolve_providers(names: Iterable[str]) -> Dict[str, type]:
+        resolved = {}
         for name in names:
-            provider = PROVIDER_REGISTRY.get(name)
+            provider = _load_provider(PROVIDER_REGISTRY.get(name))
             if not provider:
                 continue
             if getattr(provider, "working", True):
-                resolved.append(provider)
+                resolved[name] = provider
 
         if not resolved:
             raise ValueError(
@@ -163,8 +431,10 @@ class StableAIClient:
         return {
             "providers": self.provider_names,
             "max_attempts": self.max_attempts,
-            "retry_provider_max_retries": self.retry_provider_max_retries,
+            "hedge_after_seconds": self.hedge_after_seconds if self.hedging else None,
             "chat_model": self.default_chat_model,
             "image_model": self.default_image_model,
+            "routing": self.router.state(),
+            "cache": self.response_cache.stats(),
         }
 
@@ -0,0 +1,270 @@
+import asyncio
+import time
+from threading import Lock
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from services.ai_client import StableAIClient, _chunk_text, _image_entries, _images_response, get_ai_client
+from utils.metrics import AI_PROVIDER_DURATION
+
+if TYPE_CHECKING:
+    from g4f.client import AsyncClient
+
+_shared_async_client = None
+_shared_async_client_lock = Lock()
+
+
+def get_async_ai_client() -> "AsyncStableAIClient":
+    """Return the process-wide async client; it shares routing and cache with ``get_ai_client()``."""
+
+    global _shared_async_client
+    if _shared_async_client is None:
+        with _shared_async_client_lock:
+            if _shared_async_client is None:
+                _shared_async_client = AsyncStableAIClient(get_ai_client())
+    return _shared_async_client
+
+
+class AsyncStableAIClient:
+    """
+    Async counterpart of ``StableAIClient`` built on g4f's ``AsyncClient``.
+
+    Provider calls are awaited on the event loop instead of holding a thread
+    each, so one process can wait on many providers at once. Settings,
+    provider health and the response cache are those of the wrapped sync
+    client, so both serving modes route around the same failures. Unlike the
+    sync client, a hedged call that loses the race is cancelled rather than
+    left running.
+    """
+
+    def __init__(self, sync_client: Optional[StableAIClient] = None):
+        self.sync_client = sync_client or get_ai_client()
+        self._clients = {}
+
+    @property
+    def router(self):
+        return self.sync_client.router
+
+    @property
+    def response_cache(self):
+        return self.sync_client.response_cache
+
+    async def chat_completion(
+        self, *, messages: List[dict], model: Optional[str] = None, cache: bool = True, **kwargs
+    ) -> str:
+        """Return the reply text; ``cache=False`` always asks the provider."""
+
+        payload = {
+            "model": model or self.sync_client.default_chat_model,
+            "messages": messages,
+            **kwargs,
+        }
+        cache_key = self.response_cache.chat_key(payload) if cache else None
+        cached = await asyncio.to_thread(self.response_cache.get, cache_key) if cache_key else None
+        if cached is not None:
+            return cached
+
+        started = time.monotonic()
+        response = await self._run_with_retry(
+            lambda client: client.chat.completions.create(**payload), kind="chat", model=payload["model"]
+        )
+
+        if not response or not getattr(response, "choices", None):
+            raise RuntimeError("AI response did not contain any choices")
+
+        content = response.choices[0].message.content
+        await asyncio.to_thread(self.response_cache.set, cache_key, content, latency=time.monotonic() - started)
+        return content
+
+    async def stream_chat_completion(
+        self, *, messages: List[dict], model: Optional[str] = None, cache: bool = True, **kwargs
+    ) -> AsyncIterator[str]:
+        """Yield the response text piece by piece; see ``StableAIClient.stream_chat_completion``."""
+
+        payload = {
+            "model": model or self.sync_client.default_chat_model,
+            "messages": messages,
+            **kwargs,
+        }
+        cache_key = self.response_cache.chat_key(payload) if cache else None
+        cached = await asyncio.to_thread(self.response_cache.get, cache_key) if cache_key else None
+        if cached is not None:
+            yield cached
+            return
+
+        from g4f.errors import StreamNotSupportedError
+
+        started = time.monotonic()
+        try:
+            first_chunk, chunks = await self._run_with_retry(
+                lambda client: self._open_stream(client, {**payload, "stream": True}),
+                discard=lambda opened: opened[1].aclose(),
+                kind="stream",
+                model=payload["model"],
+            )
+        except StreamNotSupportedError:
+            yield await self.chat_completion(messages=messages, model=model, cache=cache, **kwargs)
+            return
+        if first_chunk is None:
+            raise RuntimeError("AI response stream ended without any content")
+
+        parts = []
+        try:
+            text = _chunk_text(first_chunk)
+            if text:
+                parts.append(text)
+                yield text
+            async for chunk in chunks:
+                text = _chunk_text(chunk)
+                if text:
+                    parts.append(text)
+                    yield text
+        finally:
+            await chunks.aclose()
+        await asyncio.to_thread(
+            self.response_cache.set, cache_key, "".join(parts) or None, latency=time.monotonic() - started
+        )
+
+    @staticmethod
+    async def _open_stream(client: "AsyncClient", payload: dict):
+        # As in the sync client, pull the first chunk so connection errors are retried.
+        chunks = client.chat.completions.create(**payload)
+        return await anext(chunks, None), chunks
+
+    async def generate_image(
+        self,
+        *,
+        prompt: str,
+        model: Optional[str] = None,
+        response_format: str = "url",
+        cache: bool = False,
+        **kwargs,
+    ):
+        """Generate images for ``prompt``; see ``StableAIClient.generate_image``."""
+
+        payload = {
+            "model": model or self.sync_client.default_image_model,
+            "prompt": prompt,
+            "response_format": response_format,
+            **kwargs,
+        }
+        cache_key = self.response_cache.key("image", payload) if cache else None
+        cached = await asyncio.to_thread(self.response_cache.get, cache_key) if cache_key else None
+        if cached is not None:
+            return _images_response(cached)
+
+        started = time.monotonic()
+        response = await self._run_with_retry(
+            lambda client: client.images.generate(**payload), kind="image", model=payload["model"]
+        )
+        await asyncio.to_thread(
+            self.response_cache.set,
+            cache_key,
+            _image_entries(response) or None,
+            latency=time.monotonic() - started,
+            ttl=self.response_cache.image_ttl_seconds,
+        )
+        return response
+
+    async def _run_with_retry(
+        self,
+        func: Callable[["AsyncClient"], Awaitable[Any]],
+        discard: Optional[Callable[[Any], Awaitable[None]]] = None,
+        *,
+        kind: str = "chat",
+        model: Optional[str] = None,
+    ):
+        """Await ``func`` with one provider at a time; see ``StableAIClient._run_with_retry``."""
+
+        from g4f.errors import ModelNotFoundError, StreamNotSupportedError
+
+        sync_client = self.sync_client
+        names = self.router.candidates(sync_client.max_attempts)
+        labels = {"kind": kind, "model": model}
+        parallel = sync_client.hedge_max_parallel if sync_client.hedging else 1
+        pending: Dict[asyncio.Task, str] = {}
+        exhausted = False
+        attempts = 0
+        last_error = None
+        model_errors = []
+
+        try:
+            while True:
+                if not exhausted and len(pending) < parallel:
+                    name = self.router.claim_next(names, set(pending.values()))
+                    if name is None:
+                        exhausted = True
+                    else:
+                        attempts += 1
+                        pending[asyncio.ensure_future(self._attempt(name, func, labels))] = name
+                if not pending:
+                    break
+
+                timeout = None
+                if not exhausted and len(pending) < parallel:
+                    timeout = self.router.hedge_delay(name, sync_client.hedge_after_seconds)
+                done, _ = await asyncio.wait(list(pending), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    del pending[task]
+                    try:
+                        result = task.result()
+                    except ModelNotFoundError as exc:
+                        model_errors.append(exc)
+                    except StreamNotSupportedError:
+                        raise
+                    except Exception as exc:
+                        last_error = exc
+                    else:
+                        return result
+        finally:
+            await self._abandon(pending, discard)
+
+        if last_error is None and model_errors:
+            raise model_errors[-1]
+
+        if last_error:
+            raise RuntimeError(
+                f"AI provider failed after {attempts} attempts: {last_error}"
+            ) from last_error
+
+        raise RuntimeError("No AI provider is available, all of them are backing off after failures")
+
+    async def _attempt(self, name: str, func: Callable[["AsyncClient"], Awaitable[Any]], labels: Dict):
+        from g4f.errors import ModelNotFoundError, StreamNotSupportedError
+
+        started = time.monotonic()
+        try:
+            result = await func(self._client_for(name))
+        except asyncio.CancelledError:
+            # Lost a hedged race or the request went away.
+            self.router.release(name)
+            raise
+        except (ModelNotFoundError, StreamNotSupportedError):
+            self.router.release(name)
+            AI_PROVIDER_DURATION.observe(time.monotonic() - started, provider=name, outcome="unsupported", **labels)
+            raise
+        except Exception as exc:
+            self.router.record_failure(name, time.monotonic() - started, exc)
+            AI_PROVIDER_DURATION.observe(time.monotonic() - started, provider=name, outcome="error", **labels)
+            raise
+        self.router.record_success(name, time.monotonic() - started)
+        AI_PROVIDER_DURATION.observe(time.monotonic() - started, provider=name, outcome="ok", **labels)
+        return result
+
+    @staticmethod
+    async def _abandon(pending: Dict[asyncio.Task, str], discard: Optional[Callable[[Any], Awaitable[None]]]):
+        for task in pending:
+            task.cancel()
+        results = await asyncio.gather(*pending, return_exceptions=True)
+        for result in results:
+            # Answers that arrived before the call could be cancelled.
+            if discard is not None and not isinstance(result, BaseException):
+                await discard(result)
+
+    def _client_for(self, name: str) -> "AsyncClient":
+        from g4f.client import AsyncClient
+
+        client = self._clients.get(name)
+        if client is None:
+            client = self._clients[name] = AsyncClient(provider=self.sync_client.providers[name])
+        return client
@@ -0,0 +1,174 @@
+import asyncio
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from services.async_ai_client import AsyncStableAIClient, get_async_ai_client
+from services.async_image_service import start_image_async
+from services.chat_service import ChatService
+from services.image_service import record_images
+from services.job_queue import QueueFullError, image_jobs
+from utils.metrics import CHAT_STAGE_DURATION
+from utils.prompt_utils import enhance_image_prompt
+
+
+class AsyncChatService(ChatService):
+    """
+    ``ChatService`` whose chat turns run on the event loop.
+
+    Provider calls and the two illustrations are awaited instead of holding a
+    thread each. Store reads and writes are short and file-locked, so they run
+    in the loop's default thread pool rather than blocking the loop. History,
+    sessions and summaries are the inherited ``ChatService`` methods.
+    """
+
+    def __init__(self, ai_client: Optional[AsyncStableAIClient] = None, **kwargs):
+        self.async_client = ai_client or get_async_ai_client()
+        super().__init__(self.async_client.sync_client, **kwargs)
+
+    async def process_chat_message_async(
+        self,
+        *,
+        user_id: str,
+        message: str,
+        selected_prompts: Optional[List[Dict]] = None,
+        session_id: Optional[int] = None,
+        model: Optional[str] = None,
+    ) -> Dict:
+        """Async ``process_chat_message``."""
+
+        with CHAT_STAGE_DURATION.time(stage="session"):
+            session = await asyncio.to_thread(self._get_or_create_session, user_id, session_id, message)
+        user_image = self._start_user_image_async(user_id, message, selected_prompts)
+        try:
+            with CHAT_STAGE_DURATION.time(stage="context"):
+                conversation = await asyncio.to_thread(self._build_conversation, message, selected_prompts, session)
+            with CHAT_STAGE_DURATION.time(stage="llm"):
+                ai_response = await self.async_client.chat_completion(
+                    messages=conversation,
+                    model=(model or "gpt-4"),
+                    temperature=0.7,
+                    max_tokens=1000,
+                )
+            with CHAT_STAGE_DURATION.time(stage="persist"):
+                await asyncio.to_thread(self._persist_messages, session["id"], user_id, message, ai_response)
+        except BaseException:
+            user_image.cancel()
+            raise
+        image_job_id = await self._submit_chat_images_async(
+            user_id, message, ai_response, selected_prompts, user_image
+        )
+        return {"response": ai_response, "session_id": session["id"], "image_job_id": image_job_id}
+
+    async def stream_chat_message_async(
+        self,
+        *,
+        user_id: str,
+        message: str,
+        selected_prompts: Optional[List[Dict]] = None,
+        session_id: Optional[int] = None,
+        model: Optional[str] = None,
+    ) -> AsyncIterator[Tuple[str, Dict]]:
+        """Async ``stream_chat_message``; yields the same events."""
+
+        with CHAT_STAGE_DURATION.time(stage="session"):
+            session = await asyncio.to_thread(self._get_or_create_session, user_id, session_id, message)
+        user_image = self._start_user_image_async(user_id, message, selected_prompts)
+        try:
+            yield "session", {"session_id": session["id"]}
+
+            with CHAT_STAGE_DURATION.time(stage="context"):
+                conversation = await asyncio.to_thread(self._build_conversation, message, selected_prompts, session)
+            parts = []
+            started = time.perf_counter()
+            async for text in self.async_client.stream_chat_completion(
+                messages=conversation,
+                model=(model or "gpt-4"),
+                temperature=0.7,
+                max_tokens=1000,
+            ):
+                if not parts:
+                    CHAT_STAGE_DURATION.observe(time.perf_counter() - started, stage="llm_first_token")
+                parts.append(text)
+                yield "token", {"text": text}
+            CHAT_STAGE_DURATION.observe(time.perf_counter() - started, stage="llm")
+
+            ai_response = "".join(parts)
+            with CHAT_STAGE_DURATION.time(stage="persist"):
+                await asyncio.to_thread(self._persist_messages, session["id"], user_id, message, ai_response)
+        except BaseException:
+            # Also covers the client going away mid-reply.
+            user_image.cancel()
+            raise
+        yield "done", {"response": ai_response, "session_id": session["id"]}
+
+        image_job_id = await self._submit_chat_images_async(
+            user_id, message, ai_response, selected_prompts, user_image
+        )
+        if image_job_id is None:
+            return
+        yield "image_job", {"job_id": image_job_id}
+
+        job = await image_jobs.wait_async(image_job_id)
+        if job and job.get("status") == "done" and job.get("result"):
+            yield "images", job["result"]
+
+    def _start_user_image_async(
+        self, user_id: str, user_message: str, selected_prompts: Optional[List[Dict]]
+    ) -> asyncio.Task:
+        return start_image_async(
+            self.async_client,
+            enhance_image_prompt(user_message, selected_prompts),
+            source="chat_user",
+            user_id=user_id,
+        )
+
+    async def _submit_chat_images_async(
+        self,
+        user_id: str,
+        user_message: str,
+        ai_response: str,
+        selected_prompts: Optional[List[Dict]],
+        user_image: asyncio.Task,
+    ) -> Optional[int]:
+        ai_image = start_image_async(
+            self.async_client, enhance_image_prompt(ai_response, selected_prompts), source="chat_ai", user_id=user_id
+        )
+        try:
+            job = await image_jobs.submit_async(
+                "chat_images",
+                user_id,
+                self._collect_chat_images_async,
+                user_id,
+                user_message,
+                user_image,
+                ai_image,
+            )
+        except QueueFullError as exc:
+            print(f"Skipping chat images: {exc}")
+            user_image.cancel()
+            ai_image.cancel()
+            return None
+        return job["id"]
+
+    async def _collect_chat_images_async(
+        self, user_id: str, user_message: str, user_image: asyncio.Task, ai_image: asyncio.Task
+    ) -> Dict:
+        """Async ``_collect_chat_images``."""
+
+        results = await asyncio.gather(user_image, ai_image, return_exceptions=True)
+        # Illustrations swallow their own errors, so only a cancelled one ends up here.
+        user_image_url, ai_image_url = (None if isinstance(result, BaseException) else result for result in results)
+        if not user_image_url and not ai_image_url:
+            raise RuntimeError("Failed to generate chat images")
+
+        images = []
+        if user_image_url:
+            images.append((user_image_url, user_message[:500]))
+        if ai_image_url:
+            images.append((ai_image_url, f"ИИ: {user_message}"[:500]))
+        await asyncio.to_thread(record_images, user_id, images, "chat")
+
+        return {
+            "user_image_url": user_image_url,
+            "ai_image_url": ai_image_url,
+        }
@@ -0,0 +1,126 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from config import Config
+from services.async_ai_client import AsyncStableAIClient, get_async_ai_client
+from services.image_service import ImageService, record_images
+from utils.metrics import IMAGE_GENERATION_DURATION
+from utils.prompt_utils import enhance_image_prompt
+
+
+class _AsyncUserSlots:
+    """
+    Caps running generations per user at ``limit``, as ``_UserSlots`` does in
+    the threaded mode. A user's semaphore is dropped once nobody holds or
+    waits for it.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(limit, 1)
+        # user id -> [semaphore, holders and waiters]
+        self._slots: Dict[str, list] = {}
+
+    @asynccontextmanager
+    async def hold(self, user_id: str):
+        entry = self._slots.get(user_id)
+        if entry is None:
+            entry = self._slots[user_id] = [asyncio.Semaphore(self.limit), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._slots[user_id]
+
+
+_user_slots = _AsyncUserSlots(Config.IMAGE_GENERATION_PER_USER)
+
+
+async def generate_image_url_async(
+    ai_client: AsyncStableAIClient, prompt: str, *, source: str
+) -> Optional[str]:
+    """Generate one image and return its URL, or ``None`` on failure."""
+
+    try:
+        with IMAGE_GENERATION_DURATION.time(source=source):
+            response = await ai_client.generate_image(
+                model="sdxl-1.0",
+                prompt=prompt,
+                response_format="url",
+            )
+
+        if not getattr(response, "data", None):
+            return None
+        return getattr(response.data[0], "url", None) or response.data[0].get("url")
+    except Exception as e:
+        print(f"Error generating image: {e}")
+        return None
+
+
+def start_image_async(ai_client: AsyncStableAIClient, prompt: str, *, source: str, user_id: str) -> asyncio.Task:
+    """Start ``generate_image_url_async`` as a task on the running loop, within the user's cap."""
+
+    async def generate() -> Optional[str]:
+        async with _user_slots.hold(user_id):
+            return await generate_image_url_async(ai_client, prompt, source=source)
+
+    return asyncio.ensure_future(generate())
+
+
+class AsyncImageService(ImageService):
+    """
+    ``ImageService`` whose generation runs on the event loop.
+
+    Listing, editing and deleting images are inherited unchanged; only
+    ``generate_image_async`` and ``stream_images_async`` are coroutines.
+    """
+
+    def __init__(self, ai_client: Optional[AsyncStableAIClient] = None):
+        self.async_client = ai_client or get_async_ai_client()
+        super().__init__(self.async_client.sync_client)
+
+    async def generate_image_async(self, user_id: str, prompt: str, n: Optional[int] = None) -> Dict[str, List[str]]:
+        """Generate and store ``n`` images for a prompt (four by default)."""
+
+        async for event, data in self.stream_images_async(user_id, prompt, n):
+            if event == "done":
+                return data
+        return {"image_urls": []}
+
+    async def stream_images_async(
+        self, user_id: str, prompt: str, n: Optional[int] = None
+    ) -> AsyncIterator[Tuple[str, Dict]]:
+        """Generate ``n`` images, yielding the same events as ``ImageService.stream_images``."""
+
+        count = self.image_count(n)
+        enhanced_prompt = enhance_image_prompt(prompt)
+
+        async def generate_one(index: int) -> Tuple[int, Optional[str]]:
+            async with _user_slots.hold(user_id):
+                url = await generate_image_url_async(
+                    self.async_client, enhanced_prompt, source="image_generator"
+                )
+            return index, url
+
+        tasks = [asyncio.ensure_future(generate_one(index)) for index in range(count)]
+        generated: List[Tuple[int, str]] = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, image_url = await next_done
+                if image_url:
+                    generated.append((index, image_url))
+                    yield "image", {"index": index, "url": image_url}
+        finally:
+            # Also reached when the client disconnects: unfinished images are
+            # cancelled and the finished ones are still kept.
+            for task in tasks:
+                task.cancel()
+            generated.sort()
+            await asyncio.to_thread(
+                record_images, user_id, [(url, enhanced_prompt) for _, url in generated], "image_generator"
+            )
+
+        yield "done", {"image_urls": [url for _, url in generated]}
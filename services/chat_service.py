@@ -1,18 +1,92 @@
+import os
+import time
+from concurrent.futures import CancelledError, Future
 from datetime import datetime
-from typing import Dict, List, Optional
+from threading import Lock
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 
-from services.ai_client import StableAIClient
-from services.image_service import record_image
-from utils.local_storage import JsonStore, next_id
-from utils.prompt_utils import get_system_prompt, get_user_prompt, enhance_image_prompt
+from config import Config
+from services.ai_client import StableAIClient, get_ai_client
+from services.context_builder import ContextBuilder
+from services.image_service import record_images, start_image
+from services.job_queue import QueueFullError, image_jobs, summary_jobs
+from services.search_service import index_documents, message_document, unindex_session
+from services.session_archive import SessionArchive
+from utils.local_storage import DATA_DIR, JsonStore, next_id, open_record_store
+from utils.metrics import CHAT_STAGE_DURATION
+from utils.pagination import decode_cursor, select_page, trim_page
+from utils.prompt_utils import enhance_image_prompt, prompt_templates
 
-_session_store = JsonStore("chat_sessions", default_factory=list)
-_message_store = JsonStore("chat_messages", default_factory=list)
+session_store = JsonStore("chat_sessions", default_factory=list)
+message_store = open_record_store("chat_messages", indexes=("session_id", "user_id"))
+session_archive = SessionArchive(
+    DATA_DIR / "archive" / "sessions",
+    session_store,
+    message_store,
+    max_idle_seconds=Config.SESSION_ARCHIVE_AFTER_DAYS * 24 * 3600,
+    interval=Config.SESSION_ARCHIVE_INTERVAL_SECONDS,
+)
+
+# Upper bound on history loaded per turn, on top of the token budget.
+CONTEXT_MAX_MESSAGES = int(os.getenv("CHAT_CONTEXT_MAX_MESSAGES", "200"))
+LAST_MESSAGE_PREVIEW_CHARS = 100
+
+
+def rebuild_session_stats(session_ids: Optional[Set[int]] = None) -> int:
+    """
+    Recompute ``last_message``, ``message_count`` and ``updated_at`` of every
+    session (or of ``session_ids``) from its messages and return the number
+    of sessions updated.
+
+    Sessions created before these fields existed are also filled in lazily on
+    their next turn; this brings all of them up to date at once. Archived
+    sessions keep the stats they were archived with.
+    """
+
+    if session_ids is not None and not session_ids:
+        return 0
+    updated = 0
+    with session_store.transaction() as sessions:
+        for session in sessions:
+            if session_ids is not None and session.get("id") not in session_ids:
+                continue
+            if session.get("archived_at"):
+                continue
+            messages = message_store.find("session_id", session.get("id"))
+            _set_session_stats(session, messages[-1] if messages else None, len(messages))
+            updated += 1
+    return updated
+
+
+def _set_session_stats(session: Dict, last_message: Optional[Dict], message_count: int) -> None:
+    session["message_count"] = message_count
+    if last_message is None:
+        session["last_message"] = None
+        return
+    content = last_message.get("content") or ""
+    session["last_message"] = content[:LAST_MESSAGE_PREVIEW_CHARS] or None
+    session["updated_at"] = max(session.get("updated_at") or "", last_message.get("created_at") or "")
+
+
+def _image_result(image: Future) -> Optional[str]:
+    """URL of a started illustration; one that was cancelled counts as missing."""
+
+    try:
+        return image.result()
+    except CancelledError:
+        return None
 
 
 class ChatService:
-    def __init__(self, ai_client: Optional[StableAIClient] = None):
-        self.ai_client = ai_client or StableAIClient()
+    def __init__(
+        self,
+        ai_client: Optional[StableAIClient] = None,
+        context_builder: Optional[ContextBuilder] = None,
+    ):
+        self.ai_client = ai_client or get_ai_client()
+        self.context_builder = context_builder or ContextBuilder()
+        self._summaries_in_flight = set()
+        self._summary_lock = Lock()
 
     def process_chat_message(
         self,
@@ -25,179 +99,379 @@ class ChatService:
     ) -> Dict:
         """Process chat message and generate AI response."""
 
-        session = self._get_or_create_session(user_id, session_id, message)
-        ai_response = self._generate_ai_response(message, selected_prompts, session["id"], model)
-        self._persist_messages(session["id"], user_id, message, ai_response)
-        images = self._generate_chat_images(user_id, message, ai_response, selected_prompts)
-        return {"response": ai_response, "session_id": session["id"], **images}
+        with CHAT_STAGE_DURATION.time(stage="session"):
+            session = self._get_or_create_session(user_id, session_id, message)
+        user_image = self._start_user_image(user_id, message, selected_prompts)
+        try:
+            ai_response = self._generate_ai_response(message, selected_prompts, session, model)
+            with CHAT_STAGE_DURATION.time(stage="persist"):
+                self._persist_messages(session["id"], user_id, message, ai_response)
+        except Exception:
+            user_image.cancel()
+            raise
+        image_job_id = self._submit_chat_images(user_id, message, ai_response, selected_prompts, user_image)
+        return {"response": ai_response, "session_id": session["id"], "image_job_id": image_job_id}
+
+    def stream_chat_message(
+        self,
+        *,
+        user_id: str,
+        message: str,
+        selected_prompts: Optional[List[Dict]] = None,
+        session_id: Optional[int] = None,
+        model: Optional[str] = None,
+    ) -> Iterator[Tuple[str, Dict]]:
+        """
+        Process a chat message, yielding ``(event, data)`` pairs as work completes.
+
+        Events are ``session`` (right away), ``token`` for every piece of the
+        reply, ``done`` once the reply is stored, ``image_job`` when the
+        illustrations are queued and ``images`` once that job has finished.
+        """
+
+        with CHAT_STAGE_DURATION.time(stage="session"):
+            session = self._get_or_create_session(user_id, session_id, message)
+        user_image = self._start_user_image(user_id, message, selected_prompts)
+        try:
+            yield "session", {"session_id": session["id"]}
+
+            with CHAT_STAGE_DURATION.time(stage="context"):
+                conversation = self._build_conversation(message, selected_prompts, session)
+            parts = []
+            started = time.perf_counter()
+            for text in self.ai_client.stream_chat_completion(
+                messages=conversation,
+                model=(model or "gpt-4"),
+                temperature=0.7,
+                max_tokens=1000,
+            ):
+                if not parts:
+                    CHAT_STAGE_DURATION.observe(time.perf_counter() - started, stage="llm_first_token")
+                parts.append(text)
+                yield "token", {"text": text}
+            # Includes the time the client took to read the tokens.
+            CHAT_STAGE_DURATION.observe(time.perf_counter() - started, stage="llm")
 
-    def list_chat_sessions(self, user_id: str) -> List[Dict]:
-        sessions = [s for s in _session_store.read() if s.get("user_id") == user_id]
-        messages = _message_store.read()
+            ai_response = "".join(parts)
+            with CHAT_STAGE_DURATION.time(stage="persist"):
+                self._persist_messages(session["id"], user_id, message, ai_response)
+        except BaseException:
+            # Also covers the client going away mid-reply.
+            user_image.cancel()
+            raise
+        yield "done", {"response": ai_response, "session_id": session["id"]}
+
+        image_job_id = self._submit_chat_images(user_id, message, ai_response, selected_prompts, user_image)
+        if image_job_id is None:
+            return
+        yield "image_job", {"job_id": image_job_id}
+
+        job = image_jobs.wait(image_job_id)
+        if job and job.get("status") == "done" and job.get("result"):
+            yield "images", job["result"]
+
+    def list_chat_sessions(
+        self, user_id: str, *, limit: Optional[int] = None, cursor: Optional[str] = None
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Return the user's sessions, newest first, and the next cursor.
+
+        Pages are ordered by ``created_at``, which never changes: ordering by
+        ``updated_at`` would let a session that gets a new turn while the
+        client pages jump ahead of the cursor and be skipped or repeated.
+        """
+
+        sessions = (s for s in session_store.snapshot() if s.get("user_id") == user_id)
+        page, next_cursor = select_page(sessions, sort_key="created_at", limit=limit, cursor=cursor)
         result = []
-        for session in sessions:
-            session_messages = [
-                msg for msg in messages if msg.get("session_id") == session.get("id")
-            ]
-            session_messages.sort(key=lambda m: m.get("created_at", ""))
-            last_message = session_messages[-1]["content"] if session_messages else None
+        for session in page:
+            if "message_count" in session:
+                last_message = session.get("last_message")
+                message_count = session["message_count"]
+            else:
+                # Session stored before the stats were kept; see rebuild_session_stats.
+                session_messages = message_store.find("session_id", session.get("id"))
+                last_message = session_messages[-1]["content"] if session_messages else None
+                message_count = len(session_messages)
             result.append(
                 {
                     "id": session.get("id"),
                     "session_name": session.get("session_name"),
+                    "created_at": session.get("created_at"),
                     "updated_at": session.get("updated_at"),
-                    "last_message": (last_message[:100] if last_message else None),
+                    "last_message": (last_message[:LAST_MESSAGE_PREVIEW_CHARS] if last_message else None),
+                    "message_count": message_count,
                 }
             )
-        return sorted(result, key=lambda s: s.get("updated_at", ""), reverse=True)
+        return result, next_cursor
+
+    def sessions_version(self) -> str:
+        """Changes whenever a session is written (sessions without stats are counted from messages)."""
+
+        return f"{session_store.etag()}:{message_store.etag()}"
+
+    def get_session_messages(
+        self, session_id: int, user_id: str, *, limit: Optional[int] = None, cursor: Optional[str] = None
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Return a session's messages and the cursor of the next page.
+
+        Without ``limit`` all messages are returned oldest first. Pages start
+        at the newest message and go back in time, newest first.
+        """
 
-    def get_session_messages(self, session_id: int, user_id: str) -> List[Dict]:
         session = self._find_session(session_id, user_id)
         if not session:
-            return []
-        messages = [
-            msg
-            for msg in _message_store.read()
-            if msg.get("session_id") == session_id
-        ]
-        messages.sort(key=lambda msg: msg.get("created_at", ""))
-        return messages
+            return [], None
+        if limit is None:
+            messages = self._session_messages(session)
+            messages.sort(key=lambda msg: msg.get("created_at", ""))
+            return messages, None
+        # Message ids grow with created_at, so the cursor's id is enough to resume.
+        before = decode_cursor(cursor)[1] if cursor else None
+        messages = self._session_messages(session, before=before, last=limit + 1)
+        messages.reverse()
+        return trim_page(messages, limit, "created_at")
+
+    @staticmethod
+    def _session_messages(session: Dict, *, before: Optional[int] = None, last: Optional[int] = None) -> List[Dict]:
+        """
+        Messages of ``session`` in id order. An archived session is read from
+        its segment: only a new turn brings it back into the message store.
+        """
+
+        if not session.get("archived_at"):
+            return message_store.find("session_id", session["id"], before=before, last=last)
+        messages = sorted(session_archive.read(session["id"]), key=lambda msg: msg["id"])
+        if before is not None:
+            messages = [msg for msg in messages if msg["id"] < before]
+        return messages[-last:] if last else messages
 
     def delete_chat_session(self, session_id: int, user_id: str) -> bool:
-        sessions = _session_store.read()
-        new_sessions = [
-            s for s in sessions if not (s.get("id") == session_id and s.get("user_id") == user_id)
-        ]
-        if len(new_sessions) == len(sessions):
+        if not self._find_session(session_id, user_id):
             return False
-        _session_store.write(new_sessions)
+        with session_store.transaction() as sessions:
+            sessions[:] = [
+                s for s in sessions if not (s.get("id") == session_id and s.get("user_id") == user_id)
+            ]
 
-        messages = _message_store.read()
-        messages = [m for m in messages if m.get("session_id") != session_id]
-        _message_store.write(messages)
+        message_store.delete_where("session_id", session_id)
+        session_archive.discard(session_id)
+        unindex_session(session_id)
         return True
 
     def _get_or_create_session(self, user_id: str, session_id: Optional[int], message: str) -> Dict:
-        sessions = _session_store.read()
-        session = None
-        if session_id:
-            session = next(
-                (s for s in sessions if s.get("id") == session_id and s.get("user_id") == user_id),
-                None,
-            )
-        if not session:
-            session = {
-                "id": next_id(sessions),
-                "user_id": user_id,
-                "session_name": (message[:50] if message else "New session"),
-                "created_at": datetime.utcnow().isoformat(),
-                "updated_at": datetime.utcnow().isoformat(),
-            }
-            sessions.append(session)
-        else:
-            session["session_name"] = session.get("session_name") or (message[:50] if message else "Chat")
-            session["updated_at"] = datetime.utcnow().isoformat()
-        _session_store.write(sessions)
+        session_archive.start()
+        restored = False
+        with session_store.transaction() as sessions:
+            session = None
+            if session_id:
+                session = next(
+                    (s for s in sessions if s.get("id") == session_id and s.get("user_id") == user_id),
+                    None,
+                )
+            if not session:
+                session = {
+                    "id": next_id(sessions),
+                    "user_id": user_id,
+                    "session_name": (message[:50] if message else "New session"),
+                    "created_at": datetime.utcnow().isoformat(),
+                    "updated_at": datetime.utcnow().isoformat(),
+                }
+                sessions.append(session)
+            else:
+                restored = session_archive.restore_into(session)
+                session["session_name"] = session.get("session_name") or (message[:50] if message else "Chat")
+                session["updated_at"] = datetime.utcnow().isoformat()
+        if restored:
+            session_archive.discard(session["id"])
         return session
 
     def _find_session(self, session_id: int, user_id: str) -> Optional[Dict]:
-        sessions = _session_store.read()
+        sessions = session_store.snapshot()
         for session in sessions:
             if session.get("id") == session_id and session.get("user_id") == user_id:
-                return session
+                return dict(session)
         return None
 
     def _persist_messages(self, session_id: int, user_id: str, user_message: str, ai_response: str) -> None:
-        messages = _message_store.read()
         user_record = {
-            "id": next_id(messages),
             "session_id": session_id,
             "user_id": user_id,
             "role": "user",
             "content": user_message,
             "created_at": datetime.utcnow().isoformat(),
         }
-        messages.append(user_record)
         ai_record = {
-            "id": next_id(messages),
             "session_id": session_id,
             "user_id": user_id,
             "role": "assistant",
             "content": ai_response,
             "created_at": datetime.utcnow().isoformat(),
         }
-        messages.append(ai_record)
-        _message_store.write(messages)
+        stored = message_store.append([user_record, ai_record])
+        index_documents([message_document(record) for record in stored])
+
+        with session_store.transaction() as sessions:
+            for session in sessions:
+                if session.get("id") == session_id:
+                    if "message_count" in session:
+                        message_count = session["message_count"] + len(stored)
+                    else:
+                        message_count = len(message_store.find("session_id", session_id))
+                    _set_session_stats(session, stored[-1], message_count)
+                    break
 
     def _generate_ai_response(
         self,
         message: str,
         selected_prompts: Optional[List[Dict]],
-        session_id: int,
+        session: Dict,
         model: Optional[str],
     ) -> str:
-        system_message = get_system_prompt()
-        user_prompt = get_user_prompt()
-        combined_prompt = f"{system_message}\n\n{user_prompt}"
-
-        if selected_prompts:
-            prompt_contents = [p.get("content", "") for p in selected_prompts if p.get("content")]
-            if prompt_contents:
-                combined_prompt += f"\n\nVery important context: {' '.join(prompt_contents)}"
-
-        conversation = [{"role": "system", "content": combined_prompt}]
-
-        history = [
-            msg
-            for msg in _message_store.read()
-            if msg.get("session_id") == session_id
-        ]
+        with CHAT_STAGE_DURATION.time(stage="context"):
+            conversation = self._build_conversation(message, selected_prompts, session)
+        with CHAT_STAGE_DURATION.time(stage="llm"):
+            return self.ai_client.chat_completion(
+                messages=conversation,
+                model=(model or "gpt-4"),
+                temperature=0.7,
+                max_tokens=1000,
+            )
+
+    def _build_conversation(
+        self,
+        message: str,
+        selected_prompts: Optional[List[Dict]],
+        session: Dict,
+    ) -> List[Dict]:
+        combined_prompt = prompt_templates.system_message(selected_prompts)
+
+        # Only messages that are not yet part of the rolling summary are loaded.
+        history = message_store.find(
+            "session_id",
+            session["id"],
+            after=session.get("summary_upto_id"),
+            last=CONTEXT_MAX_MESSAGES,
+        )
         history.sort(key=lambda msg: msg.get("created_at", ""))
-        for msg in history:
-            conversation.append({"role": msg.get("role"), "content": msg.get("content")})
 
-        conversation.append({"role": "user", "content": message})
+        conversation, overflowed = self.context_builder.build(
+            combined_prompt, session.get("summary"), history, message
+        )
+        if overflowed:
+            self._schedule_summary_refresh(session, combined_prompt)
+        return conversation
+
+    def _schedule_summary_refresh(self, session: Dict, system_prompt: str) -> None:
+        session_id = session["id"]
+        with self._summary_lock:
+            if session_id in self._summaries_in_flight:
+                return
+            self._summaries_in_flight.add(session_id)
+        try:
+            summary_jobs.submit(
+                "session_summary",
+                session["user_id"],
+                self._refresh_summary,
+                session_id,
+                session["user_id"],
+                system_prompt,
+            )
+        except QueueFullError as exc:
+            print(f"Skipping summary refresh: {exc}")
+            with self._summary_lock:
+                self._summaries_in_flight.discard(session_id)
+
+    def _refresh_summary(self, session_id: int, user_id: str, system_prompt: str) -> None:
+        """Fold the oldest unsummarized messages of a session into its summary."""
+
+        try:
+            session = self._find_session(session_id, user_id)
+            if not session:
+                return
+            summarized_upto = session.get("summary_upto_id")
+            history = message_store.find("session_id", session_id, after=summarized_upto)
+            history.sort(key=lambda msg: msg.get("created_at", ""))
+            folded = self.context_builder.messages_to_summarize(history, system_prompt, session.get("summary"))
+            if not folded:
+                return
+
+            summary = self.ai_client.chat_completion(
+                messages=self.context_builder.summary_request(session.get("summary"), folded),
+                temperature=0.3,
+                max_tokens=self.context_builder.summary_max_tokens,
+            )
+            with session_store.transaction() as sessions:
+                for stored in sessions:
+                    # Skip the update if another worker refreshed the summary meanwhile.
+                    if stored.get("id") == session_id and stored.get("summary_upto_id") == summarized_upto:
+                        stored["summary"] = summary
+                        stored["summary_upto_id"] = folded[-1]["id"]
+                        break
+        finally:
+            with self._summary_lock:
+                self._summaries_in_flight.discard(session_id)
 
-        return self.ai_client.chat_completion(
-            messages=conversation,
-            model=(model or "gpt-4"),
-            temperature=0.7,
-            max_tokens=1000,
+    def _start_user_image(self, user_id: str, user_message: str, selected_prompts: Optional[List[Dict]]) -> Future:
+        """Start the illustration of the user's message; it does not need the reply."""
+
+        return start_image(
+            self.ai_client,
+            enhance_image_prompt(user_message, selected_prompts),
+            source="chat_user",
+            user_id=user_id,
         )
 
-    def _generate_chat_images(
+    def _submit_chat_images(
         self,
         user_id: str,
         user_message: str,
         ai_response: str,
         selected_prompts: Optional[List[Dict]],
-    ) -> Dict:
+        user_image: Future,
+    ) -> Optional[int]:
+        """
+        Start the illustration of the reply and queue a job that stores both
+        images; return the job id, if accepted.
+        """
+
+        ai_image = start_image(
+            self.ai_client, enhance_image_prompt(ai_response, selected_prompts), source="chat_ai", user_id=user_id
+        )
         try:
-            user_image_prompt = enhance_image_prompt(user_message, selected_prompts)
-            user_image_response = self.ai_client.generate_image(
-                model="sdxl-1.0",
-                prompt=user_image_prompt,
-                response_format="url",
+            job = image_jobs.submit(
+                "chat_images",
+                user_id,
+                self._collect_chat_images,
+                user_id,
+                user_message,
+                user_image,
+                ai_image,
             )
-            user_image_url = user_image_response.data[0].url
-            record_image(user_id, user_image_url, user_message[:500], "chat")
+        except QueueFullError as exc:
+            print(f"Skipping chat images: {exc}")
+            user_image.cancel()
+            ai_image.cancel()
+            return None
+        return job["id"]
 
-            ai_image_prompt = enhance_image_prompt(
-                f"{ai_response}", selected_prompts
-            )
-            ai_image_response = self.ai_client.generate_image(
-                model="sdxl-1.0",
-                prompt=ai_image_prompt,
-                response_format="url",
-            )
-            ai_image_url = ai_image_response.data[0].url
-            record_image(user_id, ai_image_url, f"ИИ: {user_message}"[:500], "chat")
+    def _collect_chat_images(self, user_id: str, user_message: str, user_image: Future, ai_image: Future) -> Dict:
+        """Wait for both illustrations and store the ones that succeeded in one write."""
 
-            return {
-                "user_image_url": user_image_url,
-                "ai_image_url": ai_image_url,
-            }
-        except Exception as exc:
-            print(f"Image generation error: {exc}")
-            return {}
+        user_image_url = _image_result(user_image)
+        ai_image_url = _image_result(ai_image)
+        if not user_image_url and not ai_image_url:
+            raise RuntimeError("Failed to generate chat images")
 
+        images = []
+        if user_image_url:
+            images.append((user_image_url, user_message[:500]))
+        if ai_image_url:
+            images.append((ai_image_url, f"ИИ: {user_message}"[:500]))
+        record_images(user_id, images, "chat")
+
+        return {
+            "user_image_url": user_image_url,
+            "ai_image_url": ai_image_url,
+        }
@@ -0,0 +1,128 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+# Rough per-message overhead of the chat format (role, separators).
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain the running summary of a Dungeons & Dragons campaign chat. "
+    "Merge the previous summary with the new messages into one concise summary. "
+    "Keep names of characters, NPCs, places and items, important decisions, "
+    "open quests and the current situation. Drop small talk. "
+    "Write the summary in the language of the conversation."
+)
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """
+    Cheap token estimate without a tokenizer.
+
+    UTF-8 bytes / 4 is close to real tokenizers for English (~4 chars per
+    token) and for Cyrillic (2 bytes per char, ~2 chars per token).
+    """
+
+    if not text:
+        return _MESSAGE_OVERHEAD_TOKENS
+    return len(text.encode("utf-8")) // 4 + _MESSAGE_OVERHEAD_TOKENS
+
+
+class ContextBuilder:
+    """
+    Fits a session's history into a fixed token budget.
+
+    The most recent turns are sent verbatim; everything older is represented by
+    the rolling summary stored with the session. When turns fall out of the
+    window, ``messages_to_summarize`` picks enough of the oldest ones to bring
+    the window down to ``low_watermark`` of its budget, so the summary is
+    refreshed once every few turns rather than on every turn.
+    """
+
+    def __init__(
+        self,
+        *,
+        token_budget: Optional[int] = None,
+        summary_max_tokens: Optional[int] = None,
+        low_watermark: float = 0.5,
+    ):
+        self.token_budget = token_budget or int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "6000"))
+        self.summary_max_tokens = summary_max_tokens or int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "500"))
+        self.low_watermark = low_watermark
+
+    def build(
+        self,
+        system_prompt: str,
+        summary: Optional[str],
+        history: List[Dict],
+        message: str,
+    ) -> Tuple[List[Dict], bool]:
+        """
+        Return the conversation to send and whether the summary needs a refresh.
+
+        ``history`` holds the session messages not yet folded into ``summary``,
+        oldest first.
+        """
+
+        conversation = [{"role": "system", "content": system_prompt}]
+        if summary:
+            conversation.append({"role": "system", "content": self.summary_message(summary)})
+
+        available = self._history_budget(system_prompt, summary, message)
+        kept: List[Dict] = []
+        used = 0
+        for msg in reversed(history):
+            cost = estimate_tokens(msg.get("content"))
+            if used + cost > available:
+                break
+            kept.append(msg)
+            used += cost
+        kept.reverse()
+
+        for msg in kept:
+            conversation.append({"role": msg.get("role"), "content": msg.get("content")})
+        conversation.append({"role": "user", "content": message})
+        return conversation, len(kept) < len(history)
+
+    def messages_to_summarize(self, history: List[Dict], system_prompt: str, summary: Optional[str]) -> List[Dict]:
+        """
+        Return the oldest messages to fold into the summary, oldest first.
+
+        A single refresh never folds more than one token budget worth of
+        messages, so the summary request itself stays bounded; whatever is
+        left over triggers another refresh on a later turn.
+        """
+
+        target = int(self._history_budget(system_prompt, summary, "") * self.low_watermark)
+        remaining = sum(estimate_tokens(msg.get("content")) for msg in history)
+        folded: List[Dict] = []
+        folded_tokens = 0
+        for msg in history:
+            cost = estimate_tokens(msg.get("content"))
+            if remaining <= target or (folded and folded_tokens + cost > self.token_budget):
+                break
+            folded.append(msg)
+            folded_tokens += cost
+            remaining -= cost
+        return folded
+
+    def summary_request(self, summary: Optional[str], messages: List[Dict]) -> List[Dict]:
+        """Build the model request that merges ``messages`` into ``summary``."""
+
+        transcript = "\n".join(f"{msg.get('role')}: {msg.get('content')}" for msg in messages)
+        return [
+            {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+            {
+                "role": "user",
+                "content": f"Previous summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}",
+            },
+        ]
+
+    @staticmethod
+    def summary_message(summary: str) -> str:
+        return f"Summary of the earlier part of this conversation:\n{summary}"
+
+    def _history_budget(self, system_prompt: str, summary: Optional[str], message: str) -> int:
+        # Reserve room for the summary at its maximum size so the window does
+        # not overflow again as soon as the summary grows.
+        summary_tokens = max(estimate_tokens(summary), self.summary_max_tokens)
+        fixed = estimate_tokens(system_prompt) + summary_tokens + estimate_tokens(message)
+        return max(self.token_budget - fixed, 0)
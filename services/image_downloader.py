@@ -0,0 +1,166 @@
+import hashlib
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+from urllib.parse import urlparse
+from uuid import uuid4
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import Config
+from utils.metrics import IMAGE_DOWNLOAD_DURATION
+
+_CHUNK_SIZE = 64 * 1024
+
+
+class DownloadTooLargeError(RuntimeError):
+    """Raised when an image exceeds the configured size cap."""
+
+
+_CONTENT_TYPE_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+}
+
+
+def content_path(directory: Path, digest: str, extension: str) -> Path:
+    """Where a file with sha256 ``digest`` is stored: ``<dir>/<ab>/<digest><ext>``."""
+
+    return Path(directory) / digest[:2] / f"{digest}{extension}"
+
+
+def _detect_extension(url: str, content_type: Optional[str] = None) -> str:
+    mime = (content_type or "").split(";")[0].strip().lower()
+    if mime in _CONTENT_TYPE_EXTENSIONS:
+        return _CONTENT_TYPE_EXTENSIONS[mime]
+    parsed = urlparse(url or "")
+    suffix = Path(parsed.path).suffix
+    if suffix and len(suffix) <= 6:
+        return suffix
+    return ".jpg"
+
+
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code == 429 or exc.response.status_code >= 500
+    return False
+
+
+class ImageDownloader:
+    """
+    Saves generated images to disk on a dedicated, bounded thread pool.
+
+    Files are named by the sha256 of their content, so an image that was
+    downloaded before is stored only once however many records point at it.
+
+    A single ``requests.Session`` keeps connections to the image hosts alive
+    across downloads. Bodies are streamed to disk in chunks and aborted once
+    they exceed ``max_bytes``, so several large images never sit in memory at
+    once. Connection errors, timeouts, 429 and 5xx responses are retried with
+    a linear backoff on the download thread, never on a request thread.
+    """
+
+    def __init__(
+        self,
+        target_dir: Path,
+        *,
+        max_workers: int,
+        max_bytes: int,
+        max_attempts: int,
+        backoff_seconds: float,
+        timeout: float,
+    ):
+        self.target_dir = Path(target_dir)
+        self.target_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.timeout = timeout
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image_download")
+
+    def submit(self, url: str, on_done: Optional[Callable[[Optional[str]], None]] = None) -> Future:
+        """Download in the background; ``on_done`` receives the saved path or ``None``."""
+
+        def run():
+            file_path = self.download(url)
+            if on_done:
+                on_done(file_path)
+            return file_path
+
+        return self._executor.submit(run)
+
+    def download(self, url: str) -> Optional[str]:
+        """Download ``url`` now and return the local path, or ``None`` on failure."""
+
+        if not url:
+            return None
+
+        started = time.perf_counter()
+        for attempt in range(self.max_attempts):
+            try:
+                file_path = self._fetch(url)
+                IMAGE_DOWNLOAD_DURATION.observe(time.perf_counter() - started, outcome="ok")
+                return str(file_path)
+            except Exception as exc:
+                if attempt < self.max_attempts - 1 and _is_retryable(exc):
+                    time.sleep(self.backoff_seconds * (attempt + 1))
+                    continue
+                print(f"Failed to download image from {url}: {exc}")
+                IMAGE_DOWNLOAD_DURATION.observe(time.perf_counter() - started, outcome="error")
+                return None
+        return None
+
+    def _fetch(self, url: str) -> Path:
+        part_path = self.target_dir / f".{uuid4().hex}.part"
+        digest = hashlib.sha256()
+        try:
+            with self._session.get(url, timeout=self.timeout, stream=True) as response:
+                response.raise_for_status()
+                declared = int(response.headers.get("Content-Length") or 0)
+                if declared > self.max_bytes:
+                    raise DownloadTooLargeError(f"image is {declared} bytes, limit is {self.max_bytes}")
+
+                received = 0
+                with open(part_path, "wb") as fh:
+                    for chunk in response.iter_content(chunk_size=_CHUNK_SIZE):
+                        received += len(chunk)
+                        if received > self.max_bytes:
+                            raise DownloadTooLargeError(f"image exceeds {self.max_bytes} bytes")
+                        digest.update(chunk)
+                        fh.write(chunk)
+                extension = _detect_extension(url, response.headers.get("Content-Type"))
+
+            file_path = content_path(self.target_dir, digest.hexdigest(), extension)
+            # The same bytes may already be stored, possibly under another extension.
+            existing = next(file_path.parent.glob(f"{file_path.stem}.*"), None)
+            if existing is not None:
+                # Bump mtime so the storage sweeper does not take it for an orphan meanwhile.
+                os.utime(existing)
+                return existing
+            file_path.parent.mkdir(exist_ok=True)
+            part_path.replace(file_path)
+            return file_path
+        finally:
+            part_path.unlink(missing_ok=True)
+
+
+image_downloader = ImageDownloader(
+    Config.IMAGE_DOWNLOAD_DIR,
+    max_workers=Config.IMAGE_DOWNLOAD_WORKERS,
+    max_bytes=Config.IMAGE_DOWNLOAD_MAX_BYTES,
+    max_attempts=Config.IMAGE_DOWNLOAD_MAX_ATTEMPTS,
+    backoff_seconds=Config.IMAGE_DOWNLOAD_BACKOFF_SECONDS,
+    timeout=Config.IMAGE_DOWNLOAD_TIMEOUT,
+)
@@ -1,146 +1,315 @@
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from datetime import datetime
 from pathlib import Path
-import re
-from typing import Dict, List, Optional
-from urllib.parse import urlparse
-from uuid import uuid4
-
-import requests
+from threading import Condition, Lock
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlencode
 
 from config import Config
-from services.ai_client import StableAIClient
-from utils.local_storage import JsonStore, next_id
+from services.ai_client import StableAIClient, get_ai_client
+from services.image_downloader import image_downloader
+from services.image_storage import ImageStorage
+from services.search_service import image_document, index_documents, unindex_documents
+from utils.local_storage import JsonStore
+from utils.metrics import IMAGE_GENERATION_DURATION
+from utils.pagination import select_page
 from utils.prompt_utils import enhance_image_prompt
 
-_images_store = JsonStore("images", default_factory=list)
-_image_download_dir = Path(Config.IMAGE_DOWNLOAD_DIR)
-_image_download_dir.mkdir(parents=True, exist_ok=True)
+images_store = JsonStore("images", default_factory=list)
+image_storage = ImageStorage(
+    Config.IMAGE_DOWNLOAD_DIR,
+    images_store,
+    max_bytes=Config.IMAGE_STORAGE_MAX_BYTES,
+    max_files=Config.IMAGE_STORAGE_MAX_FILES,
+    sweep_interval=Config.IMAGE_STORAGE_SWEEP_SECONDS,
+    orphan_grace_seconds=Config.IMAGE_STORAGE_ORPHAN_GRACE_SECONDS,
+)
+
+# Shared by all requests of the process, so a burst of requests queues here
+# instead of each one starting its own threads.
+_generation_executor = ThreadPoolExecutor(
+    max_workers=Config.IMAGE_GENERATION_WORKERS, thread_name_prefix="image_generation"
+)
+
+_pending_files: Dict[int, str] = {}
+_pending_files_lock = Lock()
+_attach_lock = Lock()
+
+
+class _UserSlots:
+    """Counts running generations per user and caps them at ``limit``."""
+
+    def __init__(self, limit: int):
+        self.limit = max(limit, 1)
+        self._running: Dict[str, int] = {}
+        self._condition = Condition()
+
+    def acquire(self, user_id: str, blocking: bool = True) -> bool:
+        with self._condition:
+            while self._running.get(user_id, 0) >= self.limit:
+                if not blocking:
+                    return False
+                self._condition.wait()
+            self._running[user_id] = self._running.get(user_id, 0) + 1
+            return True
+
+    def release(self, user_id: str) -> None:
+        with self._condition:
+            running = self._running.get(user_id, 0) - 1
+            if running > 0:
+                self._running[user_id] = running
+            else:
+                self._running.pop(user_id, None)
+            self._condition.notify_all()
+
+
+_user_slots = _UserSlots(Config.IMAGE_GENERATION_PER_USER)
+
+
+def record_images(user_id: str, images: List[Tuple[str, str]], source: str) -> List[Dict]:
+    """
+    Persist generated images, given as ``(url, prompt)`` pairs, in one store
+    write and return the stored records.
+
+    Local copies are downloaded in the background; ``file_path`` is added to
+    each record once its download has finished.
+    """
+
+    if not images:
+        return []
+    now = datetime.utcnow().isoformat()
+    records = images_store.append(
+        [
+            {"user_id": user_id, "url": url, "prompt": prompt, "source": source, "created_at": now}
+            for url, prompt in images
+        ]
+    )
+    index_documents([image_document(record) for record in records])
+    for record in records:
+        image_downloader.submit(record["url"], lambda file_path, image_id=record["id"]: _attach_file(image_id, file_path))
+    return records
+
+
+def record_image(user_id: str, url: str, prompt: str, source: str) -> Dict:
+    """Persist a single generated image; see ``record_images``."""
+
+    return record_images(user_id, [(url, prompt)], source)[0]
+
+
+def _attach_file(image_id: int, file_path: Optional[str]) -> None:
+    if not file_path:
+        return
+    image_storage.start()
+    with _pending_files_lock:
+        _pending_files[image_id] = file_path
+    # Downloads that finish while another one is writing are folded into the
+    # next write instead of rewriting the store once each.
+    with _attach_lock:
+        with _pending_files_lock:
+            batch = dict(_pending_files)
+            _pending_files.clear()
+        if not batch:
+            return
+        with images_store.transaction() as images:
+            for image in images:
+                if image.get("id") in batch:
+                    image["file_path"] = batch[image["id"]]
+
+
+def generate_image_url(
+    ai_client: StableAIClient, prompt: str, *, source: str
+) -> Optional[str]:
+    """Generate one image and return its URL, or ``None`` on failure."""
+
+    try:
+        with IMAGE_GENERATION_DURATION.time(source=source):
+            response = ai_client.generate_image(
+                model="sdxl-1.0",
+                prompt=prompt,
+                response_format="url",
+            )
+
+        if not getattr(response, "data", None):
+            return None
+        return getattr(response.data[0], "url", None) or response.data[0].get("url")
+    except Exception as e:
+        print(f"Error generating image: {e}")
+        return None
 
 
-def _sanitize_filename_fragment(prompt: str) -> str:
-    if not prompt:
-        return "image"
-    slug = re.sub(r"[^a-z0-9]+", "-", prompt.lower())
-    slug = slug.strip("-")
-    return slug[:40] or "image"
+def start_image(ai_client: StableAIClient, prompt: str, *, source: str, user_id: str) -> Future:
+    """
+    Start ``generate_image_url`` on the shared generation pool. The image
+    counts against the user's ``IMAGE_GENERATION_PER_USER`` until it is done.
+    Request threads do not wait for a slot: while the user already runs that
+    many, the image is skipped and the returned future resolves to ``None``.
+    """
 
+    if not _user_slots.acquire(user_id, blocking=False):
+        print(f"Skipping {source} image: user {user_id} already runs {_user_slots.limit} generations")
+        future = Future()
+        future.set_result(None)
+        return future
+    try:
+        future = _generation_executor.submit(generate_image_url, ai_client, prompt, source=source)
+    except BaseException:
+        _user_slots.release(user_id)
+        raise
+    future.add_done_callback(lambda _: _user_slots.release(user_id))
+    return future
 
-def _detect_extension(url: str) -> str:
-    parsed = urlparse(url or "")
-    suffix = Path(parsed.path).suffix
-    if suffix and len(suffix) <= 6:
-        return suffix
-    return ".jpg"
 
+def local_image_file(image: Dict) -> Optional[Path]:
+    """Return the downloaded copy of an image record, if it exists on disk."""
 
-def _download_image(url: str, prompt: str) -> Optional[str]:
-    if not url:
+    file_path = image.get("file_path")
+    if not file_path:
         return None
+    path = Path(file_path).resolve()
     try:
-        response = requests.get(url, timeout=60)
-        response.raise_for_status()
-        ext = _detect_extension(url)
-        filename = (
-            f"{datetime.utcnow().strftime('%Y%m%d%H%M%S%f')}_{uuid4().hex[:8]}_"
-            f"{_sanitize_filename_fragment(prompt)}{ext}"
-        )
-        file_path = _image_download_dir / filename
-        with open(file_path, "wb") as fh:
-            fh.write(response.content)
-        return str(file_path)
-    except Exception as exc:
-        print(f"Failed to download image from {url}: {exc}")
+        path.relative_to(Config.IMAGE_DOWNLOAD_DIR)
+    except ValueError:
         return None
+    return path if path.is_file() else None
 
 
-def record_image(user_id: str, url: str, prompt: str, source: str) -> Dict:
-    """Persist a generated image, download it locally, and return the stored record."""
-
-    images = _images_store.read()
-    record = {
-        "id": next_id(images),
-        "user_id": user_id,
-        "url": url,
-        "prompt": prompt,
-        "source": source,
-        "created_at": datetime.utcnow().isoformat(),
-    }
-    file_path = _download_image(url, prompt)
-    if file_path:
-        record["file_path"] = file_path
-    images.append(record)
-    _images_store.write(images)
-    return record
+def image_file_url(image: Dict, size: Optional[str] = None) -> str:
+    """
+    URL of ``GET /images/<id>`` for a record. Once the file is downloaded the
+    URL carries a content version, so browsers may cache it indefinitely.
+    """
+
+    params = {}
+    if image.get("file_path"):
+        params["v"] = Path(image["file_path"]).stem[:16]
+    if size:
+        params["size"] = size
+    query = f"?{urlencode(params)}" if params else ""
+    return f"/images/{image['id']}{query}"
+
+
+class InvalidImageCountError(ValueError):
+    """Raised for an image count outside 1..``IMAGE_MAX_COUNT``."""
 
 
 class ImageService:
-    DEFAULT_IMAGE_COUNT = 4
+    DEFAULT_IMAGE_COUNT = Config.IMAGE_DEFAULT_COUNT
+    MAX_IMAGE_COUNT = Config.IMAGE_MAX_COUNT
 
     def __init__(self, ai_client: Optional[StableAIClient] = None):
-        self.ai_client = ai_client or StableAIClient()
+        self.ai_client = ai_client or get_ai_client()
 
-    def generate_image(self, user_id: str, prompt: str) -> Dict[str, List[str]]:
-        """Generate and store four images for a prompt using ThreadPoolExecutor."""
-        
+    def generate_image(self, user_id: str, prompt: str, n: Optional[int] = None) -> Dict[str, List[str]]:
+        """Generate and store ``n`` images for a prompt (four by default)."""
+
+        for event, data in self.stream_images(user_id, prompt, n):
+            if event == "done":
+                return data
+        return {"image_urls": []}
+
+    def stream_images(self, user_id: str, prompt: str, n: Optional[int] = None) -> Iterator[Tuple[str, Dict]]:
+        """
+        Generate ``n`` images, yielding ``(event, data)`` pairs as work completes.
+
+        Events are ``image`` with the index and URL of every image as soon as
+        it is ready, in completion order, and ``done`` with all URLs once the
+        whole set has been stored in a single write. Images run on the shared
+        generation pool, at most ``IMAGE_GENERATION_PER_USER`` at a time per
+        user; failed images are skipped.
+        """
+
+        count = self.image_count(n)
         enhanced_prompt = enhance_image_prompt(prompt)
-        print(enhanced_prompt)
-        
-        def generate_one(_):
-            """Generate one image."""
-            try:
-                response = self.ai_client.generate_image(
-                    model="sdxl-1.0",
-                    prompt=enhanced_prompt,
-                    response_format="url",
-                )
-
-                if not getattr(response, "data", None):
-                    return None
-
-                image_url = getattr(response.data[0], "url", None) or response.data[0].get("url")
-                if not image_url:
-                    return None
-
-                record_image(user_id, image_url, enhanced_prompt, "image_generator")
-                return image_url
-                
-            except Exception as e:
-                print(f"Error generating image: {e}")
-                return None
-        
-        # Запускаем все задачи параллельно
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            # Отправляем все задачи и получаем результаты
-            results = list(executor.map(generate_one, range(self.DEFAULT_IMAGE_COUNT)))
-        
-        # Фильтруем None значения
-        image_urls = [url for url in results if url is not None]
-        
-        return {"image_urls": image_urls}
-
-
-    def list_images(self, user_id: str) -> List[Dict]:
-        images = [img for img in _images_store.read() if img.get("user_id") == user_id]
-        return sorted(images, key=lambda img: img.get("created_at", ""), reverse=True)
+
+        pending: Dict[Future, int] = {}
+        generated: List[Tuple[int, str]] = []
+        next_index = 0
+        try:
+            while next_index < count or pending:
+                # Block for a slot only when nothing of ours is running to wait on.
+                while next_index < count and _user_slots.acquire(user_id, blocking=not pending):
+                    future = _generation_executor.submit(self._generate_one, enhanced_prompt, next_index)
+                    future.add_done_callback(lambda _: _user_slots.release(user_id))
+                    pending[future] = next_index
+                    next_index += 1
+
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    image_url = future.result()
+                    if image_url:
+                        generated.append((index, image_url))
+                        yield "image", {"index": index, "url": image_url}
+        finally:
+            # Also reached when the client disconnects: images that have not
+            # started are dropped and the finished ones are still kept.
+            for future in pending:
+                future.cancel()
+            generated.sort()
+            record_images(user_id, [(url, enhanced_prompt) for _, url in generated], "image_generator")
+
+        yield "done", {"image_urls": [url for _, url in generated]}
+
+    def image_count(self, n: Optional[int]) -> int:
+        if n is None:
+            return self.DEFAULT_IMAGE_COUNT
+        if not isinstance(n, int) or isinstance(n, bool) or not 1 <= n <= self.MAX_IMAGE_COUNT:
+            raise InvalidImageCountError(f"n must be an integer between 1 and {self.MAX_IMAGE_COUNT}")
+        return n
+
+    def _generate_one(self, enhanced_prompt: str, index: int) -> Optional[str]:
+        return generate_image_url(self.ai_client, enhanced_prompt, source="image_generator")
+
+    def list_images(
+        self, user_id: str, *, limit: Optional[int] = None, cursor: Optional[str] = None
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """Return the user's images, newest first, and the cursor of the next page."""
+
+        images = (img for img in images_store.snapshot() if img.get("user_id") == user_id)
+        page, next_cursor = select_page(images, sort_key="created_at", limit=limit, cursor=cursor)
+        for image in page:
+            image["file_url"] = image_file_url(image)
+            image["thumb_url"] = image_file_url(image, "thumb")
+        return page, next_cursor
+
+    def images_version(self) -> str:
+        """Changes whenever any image record is written."""
+
+        return images_store.etag()
 
     def update_image(self, image_id: int, user_id: str, prompt: str) -> Optional[Dict]:
-        images = _images_store.read()
+        if not self.get_image(image_id, user_id):
+            return None
         updated = None
-        for image in images:
-            if image.get("id") == image_id and image.get("user_id") == user_id:
-                image["prompt"] = prompt
-                image["updated_at"] = datetime.utcnow().isoformat()
-                updated = image
-                break
+        with images_store.transaction() as images:
+            for image in images:
+                if image.get("id") == image_id and image.get("user_id") == user_id:
+                    image["prompt"] = prompt
+                    image["updated_at"] = datetime.utcnow().isoformat()
+                    updated = image
+                    break
         if updated:
-            _images_store.write(images)
+            index_documents([image_document(updated)])
         return updated
 
     def delete_image(self, image_id: int, user_id: str) -> bool:
-        images = _images_store.read()
-        new_images = [img for img in images if not (img.get("id") == image_id and img.get("user_id") == user_id)]
-        if len(new_images) != len(images):
-            _images_store.write(new_images)
-            return True
-        return False
+        image = self.get_image(image_id, user_id)
+        if not image:
+            return False
+        with images_store.transaction() as images:
+            images[:] = [img for img in images if not (img.get("id") == image_id and img.get("user_id") == user_id)]
+            # Files are shared by records with the same content; keep the file while one remains.
+            still_used = image.get("file_path") and any(
+                img.get("file_path") == image["file_path"] for img in images
+            )
+        unindex_documents([f"image:{image_id}"])
+        path = local_image_file(image)
+        if path and not still_used:
+            image_storage.remove(path)
+        return True
+
+    def get_image(self, image_id: int, user_id: str) -> Optional[Dict]:
+        for image in images_store.snapshot():
+            if image.get("id") == image_id and image.get("user_id") == user_id:
+                return dict(image)
+        return None
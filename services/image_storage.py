@@ -0,0 +1,193 @@
+import os
+import random
+import time
+from pathlib import Path
+from threading import Lock, Thread, get_native_id
+from typing import Dict, List, Tuple
+
+from services.thumbnails import THUMBNAIL_DIR, thumbnails_of
+from utils.local_storage import JsonStore
+from utils.metrics import IMAGE_FILES_REMOVED
+
+try:
+    import fcntl
+except ImportError:  # Windows: workers may sweep at the same time, which is harmless.
+    fcntl = None
+
+
+class ImageStorage:
+    """
+    Keeps the downloaded image directory within a quota.
+
+    A background sweeper periodically deletes files that no image record
+    points at any more (after ``orphan_grace_seconds``, so fresh downloads are
+    not caught before they are attached) and, while the directory holds more
+    than ``max_bytes`` or ``max_files``, evicts the least recently served
+    files. Records of evicted files lose their ``file_path`` and are served
+    from the provider URL again. Thumbnails count towards the quota and go
+    together with their original. Only one worker sweeps at a time.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        records: JsonStore,
+        *,
+        max_bytes: int,
+        max_files: int,
+        sweep_interval: float,
+        orphan_grace_seconds: float,
+        touch_interval: float = 60,
+    ):
+        self.directory = Path(directory)
+        self.records = records
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.sweep_interval = sweep_interval
+        self.orphan_grace_seconds = orphan_grace_seconds
+        self.touch_interval = touch_interval
+        self._pid = None
+        self._start_lock = Lock()
+
+    def start(self) -> None:
+        """Start the sweeper thread in this process; cheap to call on every use."""
+
+        if self.sweep_interval <= 0 or self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            Thread(target=self._sweep_loop, name="image_storage_sweeper", daemon=True).start()
+
+    def touch(self, path: Path) -> None:
+        """Mark a file as just served; eviction goes by this access time."""
+
+        self.start()
+        try:
+            stat = path.stat()
+            now = time.time()
+            if now - stat.st_atime >= self.touch_interval:
+                os.utime(path, (now, stat.st_mtime))
+        except OSError:
+            pass
+
+    def remove(self, path: Path, reason: str = "deleted") -> int:
+        """Delete a file and its thumbnails; return the bytes freed."""
+
+        freed = 0
+        for victim in [path, *thumbnails_of(path)]:
+            try:
+                size = victim.stat().st_size
+                victim.unlink()
+                freed += size
+            except FileNotFoundError:
+                continue
+            except OSError as exc:
+                print(f"Failed to remove image file {victim}: {exc}")
+        IMAGE_FILES_REMOVED.inc(reason=reason)
+        return freed
+
+    def sweep(self) -> Dict[str, int]:
+        """Remove orphaned files, then evict until the quota is met."""
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / ".sweep.lock", "a+b") as lock_fh:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return {}
+            try:
+                return self._sweep()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_fh, fcntl.LOCK_UN)
+
+    def _sweep(self) -> Dict[str, int]:
+        referenced = {
+            str(Path(image["file_path"]).resolve())
+            for image in self.records.snapshot()
+            if image.get("file_path")
+        }
+        cutoff = time.time() - self.orphan_grace_seconds
+        originals, thumbnail_bytes = self._scan()
+        orphans = evicted = 0
+
+        kept: List[Tuple[float, int, Path]] = []
+        total_bytes, count = thumbnail_bytes, 0
+        for path, stat in originals:
+            if str(path.resolve()) in referenced:
+                kept.append((stat.st_atime, stat.st_size, path))
+            elif stat.st_mtime < cutoff:
+                # Orphaned by a deleted record, or a download that never finished.
+                self.remove(path, "orphan")
+                orphans += 1
+                continue
+            # Fresh unreferenced files are probably about to be attached: count, never evict.
+            total_bytes += stat.st_size
+            count += 1
+
+        kept.sort()
+        evicted_paths = set()
+        for _, size, path in kept:
+            over_bytes = self.max_bytes > 0 and total_bytes > self.max_bytes
+            over_count = self.max_files > 0 and count > self.max_files
+            if not over_bytes and not over_count:
+                break
+            total_bytes -= self.remove(path, "quota") if path.exists() else size
+            count -= 1
+            evicted += 1
+            evicted_paths.add(str(path.resolve()))
+
+        if evicted_paths:
+            with self.records.transaction() as images:
+                for image in images:
+                    if image.get("file_path") and str(Path(image["file_path"]).resolve()) in evicted_paths:
+                        image.pop("file_path", None)
+
+        return {"orphans": orphans, "evicted": evicted, "files": count, "bytes": total_bytes}
+
+    def _scan(self) -> Tuple[List[Tuple[Path, os.stat_result]], int]:
+        """Return downloaded files with their stat, and the bytes taken by thumbnails."""
+
+        originals = []
+        thumbnail_bytes = 0
+        for entry in self.directory.rglob("*"):
+            if entry.name.startswith(".sweep") or not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            if THUMBNAIL_DIR in entry.parents:
+                if entry.suffix == ".tmp" or self._thumbnail_source_missing(entry):
+                    if stat.st_mtime < time.time() - self.orphan_grace_seconds:
+                        entry.unlink(missing_ok=True)
+                        continue
+                thumbnail_bytes += stat.st_size
+            else:
+                originals.append((entry, stat))
+        return originals, thumbnail_bytes
+
+    def _thumbnail_source_missing(self, thumbnail: Path) -> bool:
+        stem = thumbnail.stem.rsplit("_", 1)[0]
+        return not any(self.directory.glob(f"{stem[:2]}/{stem}.*")) and not any(self.directory.glob(f"{stem}.*"))
+
+    def _sweep_loop(self):
+        try:
+            # Only lower this thread's priority: on Linux every thread has its own nice value.
+            os.setpriority(os.PRIO_PROCESS, get_native_id(), 10)
+        except (AttributeError, OSError):
+            pass
+        # Spread the workers' sweeps over the interval.
+        time.sleep(random.uniform(0.5, 1.0) * self.sweep_interval)
+        while self._pid == os.getpid():
+            try:
+                result = self.sweep()
+                if result.get("orphans") or result.get("evicted"):
+                    print(f"Image storage sweep: {result}")
+            except Exception as exc:
+                print(f"Image storage sweep failed: {exc}")
+            time.sleep(self.sweep_interval)
+
@@ -0,0 +1,222 @@
+import asyncio
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import BoundedSemaphore, Lock
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from utils.local_storage import open_record_store
+from utils.metrics import JOB_DURATION, JOBS
+
+# Job states live in a shared store so that any gunicorn worker can answer
+# /api/jobs/<id>, not only the one that accepted the job. Each state change
+# appends one line instead of rewriting every job.
+_job_store = open_record_store("jobs", indexes=("id", "status"))
+
+JOB_RETENTION = timedelta(seconds=int(os.getenv("JOB_RETENTION_SECONDS", "3600")))
+# How often a process drops finished jobs past their retention.
+_PRUNE_INTERVAL_SECONDS = 60
+_last_prune = 0.0
+_PUBLIC_FIELDS = ("id", "kind", "status", "result", "error", "created_at", "started_at", "finished_at")
+
+
+class QueueFullError(RuntimeError):
+    """Raised when a queue already holds as many jobs as it accepts."""
+
+
+class JobQueue:
+    """
+    Bounded pool of background workers for slow, non-critical work.
+
+    At most ``max_workers`` jobs run at once and at most ``max_pending`` more
+    wait for a worker; beyond that ``submit`` raises ``QueueFullError`` instead
+    of piling up threads. Jobs run independently of the request that created
+    them, so closing the connection does not cancel them.
+    """
+
+    def __init__(self, name: str, *, max_workers: int, max_pending: int, max_async: int = 256):
+        self.name = name
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = BoundedSemaphore(max_workers + max_pending)
+        self._futures: Dict[int, Future] = {}
+        self._futures_lock = Lock()
+        # Coroutine jobs hold no thread while they wait, so they have their own, larger cap.
+        self._async_slots = BoundedSemaphore(max_async)
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def submit(self, kind: str, user_id: str, func: Callable[..., Any], *args) -> Dict:
+        """Queue ``func(*args)`` and return the stored job record."""
+
+        if not self._slots.acquire(blocking=False):
+            JOBS.inc(queue=self.name, status="rejected")
+            raise QueueFullError(f"{self.name} queue is full")
+        try:
+            job = _create_job(kind, user_id)
+            future = self._executor.submit(self._run, dict(job), func, args)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._futures_lock:
+            self._futures[job["id"]] = future
+        future.add_done_callback(lambda _: self._forget(job["id"]))
+        return job
+
+    def wait(self, job_id: int, timeout: Optional[float] = None) -> Optional[Dict]:
+        """Block until a job submitted by this process finishes, then return it."""
+
+        with self._futures_lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                # Failures are recorded on the job itself.
+                pass
+        return _find_job(job_id)
+
+    async def submit_async(self, kind: str, user_id: str, func: Callable[..., Awaitable[Any]], *args) -> Dict:
+        """Run the coroutine ``func(*args)`` as a job on the running event loop."""
+
+        if not self._async_slots.acquire(blocking=False):
+            JOBS.inc(queue=self.name, status="rejected")
+            raise QueueFullError(f"{self.name} queue is full")
+        try:
+            job = await asyncio.to_thread(_create_job, kind, user_id)
+        except BaseException:
+            self._async_slots.release()
+            raise
+        task = asyncio.ensure_future(self._run_async(dict(job), func, args))
+        self._tasks[job["id"]] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job["id"], None))
+        return job
+
+    async def wait_async(self, job_id: int) -> Optional[Dict]:
+        """Wait for a job started with ``submit_async`` in this process, then return it."""
+
+        task = self._tasks.get(job_id)
+        if task is not None:
+            # asyncio.wait leaves the job running if this caller is cancelled.
+            await asyncio.wait([task])
+        return await asyncio.to_thread(_find_job, job_id)
+
+    def _run(self, job: Dict, func: Callable[..., Any], args: tuple):
+        try:
+            _update_job(job, status="running", started_at=datetime.utcnow().isoformat())
+            try:
+                with JOB_DURATION.time(queue=self.name):
+                    result = func(*args)
+            except Exception as exc:
+                print(f"Job {job['id']} failed: {exc}")
+                JOBS.inc(queue=self.name, status="failed")
+                _update_job(job, status="failed", error=str(exc), finished_at=datetime.utcnow().isoformat())
+            else:
+                JOBS.inc(queue=self.name, status="done")
+                _update_job(job, status="done", result=result, finished_at=datetime.utcnow().isoformat())
+        finally:
+            self._slots.release()
+
+    async def _run_async(self, job: Dict, func: Callable[..., Awaitable[Any]], args: tuple):
+        try:
+            await asyncio.to_thread(_update_job, job, status="running", started_at=datetime.utcnow().isoformat())
+            try:
+                with JOB_DURATION.time(queue=self.name):
+                    result = await func(*args)
+            except Exception as exc:
+                print(f"Job {job['id']} failed: {exc}")
+                JOBS.inc(queue=self.name, status="failed")
+                await asyncio.to_thread(
+                    _update_job, job, status="failed", error=str(exc), finished_at=datetime.utcnow().isoformat()
+                )
+            else:
+                JOBS.inc(queue=self.name, status="done")
+                await asyncio.to_thread(
+                    _update_job, job, status="done", result=result, finished_at=datetime.utcnow().isoformat()
+                )
+        finally:
+            self._async_slots.release()
+
+    def _forget(self, job_id: int):
+        with self._futures_lock:
+            self._futures.pop(job_id, None)
+
+
+def get_job(job_id: int, user_id: str) -> Optional[Dict]:
+    """Return the public view of a job owned by ``user_id``."""
+
+    job = _find_job(job_id)
+    if not job or job.get("user_id") != user_id:
+        return None
+    return {field: job.get(field) for field in _PUBLIC_FIELDS}
+
+
+def _create_job(kind: str, user_id: str) -> Dict:
+    _prune_jobs()
+    job = {
+        "user_id": user_id,
+        "kind": kind,
+        "status": "queued",
+        "created_at": datetime.utcnow().isoformat(),
+        "pid": os.getpid(),
+    }
+    return dict(_job_store.append([job])[0])
+
+
+def _find_job(job_id: int) -> Optional[Dict]:
+    jobs = _job_store.find("id", job_id)
+    if not jobs:
+        return None
+    job = jobs[-1]
+    if job.get("status") in ("queued", "running") and not _process_alive(job.get("pid")):
+        job["status"] = "failed"
+        job["error"] = "Worker process exited before the job finished"
+    return job
+
+
+def _update_job(job: Dict, **changes) -> None:
+    # Only the worker running a job changes it, so its copy is current.
+    job.update(changes)
+    _job_store.upsert([job])
+
+
+def _prune_jobs() -> None:
+    """Drop finished jobs past their retention, at most once a minute per process."""
+
+    global _last_prune
+    if time.monotonic() - _last_prune < _PRUNE_INTERVAL_SECONDS:
+        return
+    _last_prune = time.monotonic()
+    cutoff = (datetime.utcnow() - JOB_RETENTION).isoformat()
+    for status in ("done", "failed"):
+        for job in _job_store.find("status", status):
+            if job.get("finished_at", "") < cutoff:
+                _job_store.delete_where("id", job["id"])
+
+
+def _process_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    if pid == os.getpid() or os.name == "nt":
+        # os.kill cannot probe processes on Windows without signalling them.
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # The process exists but belongs to someone else.
+        return True
+    return True
+
+
+image_jobs = JobQueue(
+    "image_jobs",
+    max_workers=int(os.getenv("IMAGE_JOB_WORKERS", "2")),
+    max_pending=int(os.getenv("IMAGE_JOB_MAX_PENDING", "8")),
+    max_async=int(os.getenv("IMAGE_JOB_MAX_ASYNC", "256")),
+)
+summary_jobs = JobQueue(
+    "summary_jobs",
+    max_workers=int(os.getenv("SUMMARY_JOB_WORKERS", "1")),
+    max_pending=int(os.getenv("SUMMARY_JOB_MAX_PENDING", "16")),
+)
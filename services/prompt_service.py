@@ -1,66 +1,75 @@
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
-from utils.local_storage import JsonStore, next_id
+from services.search_service import index_documents, prompt_document, unindex_documents
+from utils.local_storage import JsonStore
+from utils.pagination import select_page
 
-_prompt_store = JsonStore("prompts", default_factory=list)
+prompt_store = JsonStore("prompts", default_factory=list)
 
 
 class PromptService:
-    def __init__(self, store: JsonStore = _prompt_store):
+    def __init__(self, store: JsonStore = prompt_store):
         self.store = store
 
-    def get_user_prompts(self, user_id: str) -> List[Dict]:
-        """Return all prompts for the local user sorted by creation date."""
+    def get_user_prompts(
+        self, user_id: str, *, limit: Optional[int] = None, cursor: Optional[str] = None
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """Return prompts for the local user, newest first, and the cursor of the next page."""
 
-        prompts = [p for p in self.store.read() if p.get("user_id") == user_id]
-        return sorted(prompts, key=lambda p: p.get("created_at", ""), reverse=True)
+        prompts = (p for p in self.store.snapshot() if p.get("user_id") == user_id)
+        return select_page(prompts, sort_key="created_at", limit=limit, cursor=cursor)
+
+    def prompts_version(self) -> str:
+        """Changes whenever any prompt is written."""
+
+        return self.store.etag()
 
     def create_prompt(self, user_id: str, title: str, content: str) -> Dict:
         """Create and persist a prompt."""
 
-        prompts = self.store.read()
         prompt = {
-            "id": next_id(prompts),
             "user_id": user_id,
             "title": title,
             "content": content,
             "created_at": datetime.utcnow().isoformat(),
         }
-        prompts.append(prompt)
-        self.store.write(prompts)
+        prompt = self.store.append([prompt])[0]
+        index_documents([prompt_document(prompt)])
         return prompt
 
     def update_prompt(self, prompt_id: int, user_id: str, title: str, content: str) -> Optional[Dict]:
         """Update an existing prompt."""
 
-        prompts = self.store.read()
+        if not self.get_prompt_by_id(prompt_id, user_id):
+            return None
         updated = None
-        for prompt in prompts:
-            if prompt.get("id") == prompt_id and prompt.get("user_id") == user_id:
-                prompt["title"] = title
-                prompt["content"] = content
-                updated = prompt
-                break
+        with self.store.transaction() as prompts:
+            for prompt in prompts:
+                if prompt.get("id") == prompt_id and prompt.get("user_id") == user_id:
+                    prompt["title"] = title
+                    prompt["content"] = content
+                    updated = prompt
+                    break
         if updated:
-            self.store.write(prompts)
+            index_documents([prompt_document(updated)])
         return updated
 
     def delete_prompt(self, prompt_id: int, user_id: str) -> bool:
         """Delete a prompt by id."""
 
-        prompts = self.store.read()
-        new_prompts = [p for p in prompts if not (p.get("id") == prompt_id and p.get("user_id") == user_id)]
-        if len(new_prompts) != len(prompts):
-            self.store.write(new_prompts)
-            return True
-        return False
+        if not self.get_prompt_by_id(prompt_id, user_id):
+            return False
+        with self.store.transaction() as prompts:
+            prompts[:] = [p for p in prompts if not (p.get("id") == prompt_id and p.get("user_id") == user_id)]
+        unindex_documents([f"prompt:{prompt_id}"])
+        return True
 
     def get_prompt_by_id(self, prompt_id: int, user_id: str) -> Optional[Dict]:
         """Retrieve a single prompt."""
 
-        prompts = self.store.read()
+        prompts = self.store.snapshot()
         for prompt in prompts:
             if prompt.get("id") == prompt_id and prompt.get("user_id") == user_id:
-                return prompt
+                return dict(prompt)
         return None
\ No newline at end of file
@@ -0,0 +1,207 @@
+import random
+import time
+from collections import deque
+from threading import Lock
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def _percentile(values: Sequence[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(int(len(ordered) * fraction), len(ordered) - 1)
+    return round(ordered[index], 3)
+
+
+class ProviderRouter:
+    """
+    Orders providers by observed health and keeps dead ones out of rotation.
+
+    Every call reports back through ``record_success``/``record_failure``; the
+    router keeps an EWMA of latency and success rate per provider and ranks
+    fast, reliable providers first (providers without data yet go first so
+    they get measured). A failed provider is parked for
+    ``retry_backoff_seconds`` times its consecutive failures, so retries move
+    on to other providers instead of sleeping. After ``failure_threshold``
+    consecutive failures a provider's circuit opens and it is skipped for
+    ``cooldown_seconds``; then a single request is let through as a probe
+    (half-open) and its outcome closes or re-opens the circuit. State is kept
+    per process.
+    """
+
+    def __init__(
+        self,
+        names: Sequence[str],
+        *,
+        failure_threshold: int = 3,
+        cooldown_seconds: float = 60,
+        retry_backoff_seconds: float = 5,
+        alpha: float = 0.3,
+        shuffle: bool = True,
+        window: int = 50,
+    ):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.alpha = alpha
+        self.shuffle = shuffle
+        self._lock = Lock()
+        self._stats: Dict[str, Dict] = {
+            name: {
+                "state": CLOSED,
+                "ewma_latency": None,
+                "success_rate": 1.0,
+                "consecutive_failures": 0,
+                "opened_at": None,
+                "cooling_until": 0.0,
+                "probing": False,
+                "requests": 0,
+                "failures": 0,
+                "last_error": None,
+                "latencies": deque(maxlen=window),
+            }
+            for name in names
+        }
+
+    def ranked(self) -> List[str]:
+        """
+        Return providers to try, best first; open circuits only as a last resort.
+
+        Providers parked after a recent failure are left out entirely.
+        """
+
+        now = time.monotonic()
+        with self._lock:
+            names = list(self._stats)
+            if self.shuffle:
+                # Breaks ties between providers with equal scores.
+                random.shuffle(names)
+
+            available, blocked = [], []
+            for name in names:
+                stats = self._stats[name]
+                if stats["cooling_until"] > now:
+                    continue
+                if stats["state"] == OPEN and now - stats["opened_at"] >= self.cooldown_seconds:
+                    stats["state"] = HALF_OPEN
+                    stats["probing"] = False
+                if stats["state"] == CLOSED or (stats["state"] == HALF_OPEN and not stats["probing"]):
+                    available.append(name)
+                else:
+                    blocked.append(name)
+
+            if available:
+                return sorted(available, key=self._score)
+            return sorted(blocked, key=lambda name: self._stats[name]["opened_at"] or 0)
+
+    def candidates(self, passes: int) -> Iterator[str]:
+        """Yield providers to call, best first, re-ranked on each of ``passes`` passes."""
+
+        for _ in range(passes):
+            yield from self.ranked()
+
+    def claim_next(self, names: Iterable[str], busy: set) -> Optional[str]:
+        """
+        Take the next of ``names`` that is not already running this request.
+        Only that one is claimed, so a skipped half-open provider stays free
+        for its probe.
+        """
+
+        for name in names:
+            if name not in busy and self.begin(name):
+                return name
+        return None
+
+    def begin(self, name: str) -> bool:
+        """Claim a call to ``name``; ``False`` if a half-open probe is already running."""
+
+        with self._lock:
+            stats = self._stats[name]
+            if stats["state"] == HALF_OPEN:
+                if stats["probing"]:
+                    return False
+                stats["probing"] = True
+            return True
+
+    def record_success(self, name: str, latency: float) -> None:
+        with self._lock:
+            stats = self._stats[name]
+            self._observe(stats, latency, success=True)
+            stats["consecutive_failures"] = 0
+            stats["cooling_until"] = 0.0
+            stats["state"] = CLOSED
+            stats["opened_at"] = None
+            stats["probing"] = False
+
+    def record_failure(self, name: str, latency: float, error: Exception) -> None:
+        with self._lock:
+            stats = self._stats[name]
+            self._observe(stats, latency, success=False)
+            stats["failures"] += 1
+            stats["consecutive_failures"] += 1
+            stats["last_error"] = f"{type(error).__name__}: {error}"[:200]
+            backoff = self.retry_backoff_seconds * stats["consecutive_failures"]
+            stats["cooling_until"] = time.monotonic() + backoff
+            if stats["state"] == HALF_OPEN or stats["consecutive_failures"] >= self.failure_threshold:
+                if stats["state"] != OPEN:
+                    print(f"Circuit opened for provider {name}: {stats['last_error']}")
+                stats["state"] = OPEN
+                stats["opened_at"] = time.monotonic()
+            stats["probing"] = False
+
+    def release(self, name: str) -> None:
+        """End a claimed call that says nothing about the provider's health."""
+
+        with self._lock:
+            self._stats[name]["probing"] = False
+
+    def hedge_delay(self, name: str, default: float) -> float:
+        """Seconds to wait on ``name`` before hedging: its p95 latency, at most ``default``."""
+
+        with self._lock:
+            latencies = self._stats[name]["latencies"]
+            if len(latencies) < 10:
+                return default
+            return min(_percentile(latencies, 0.95), default)
+
+    def state(self) -> Dict[str, Dict]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    "state": stats["state"],
+                    "requests": stats["requests"],
+                    "failures": stats["failures"],
+                    "success_rate": round(stats["success_rate"], 3),
+                    "ewma_latency": (
+                        round(stats["ewma_latency"], 3) if stats["ewma_latency"] is not None else None
+                    ),
+                    "p50_latency": _percentile(stats["latencies"], 0.5),
+                    "p95_latency": _percentile(stats["latencies"], 0.95),
+                    "cooling_for": round(max(stats["cooling_until"] - now, 0.0), 3),
+                    "last_error": stats["last_error"],
+                }
+                for name, stats in self._stats.items()
+            }
+
+    def _observe(self, stats: Dict, latency: float, *, success: bool):
+        stats["requests"] += 1
+        stats["success_rate"] += self.alpha * ((1.0 if success else 0.0) - stats["success_rate"])
+        if not success:
+            return
+        stats["latencies"].append(latency)
+        if stats["ewma_latency"] is None:
+            stats["ewma_latency"] = latency
+        else:
+            stats["ewma_latency"] += self.alpha * (latency - stats["ewma_latency"])
+
+    def _score(self, name: str) -> float:
+        stats = self._stats[name]
+        if stats["ewma_latency"] is None:
+            return 0.0
+        # Expected time per successful answer.
+        return stats["ewma_latency"] / max(stats["success_rate"], 0.05)
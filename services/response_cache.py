@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, Optional
+from uuid import uuid4
+
+from utils.local_storage import DATA_DIR
+from utils.metrics import AI_CACHE_LOOKUPS
+
+
+class ResponseCache:
+    """
+    Two-tier cache for provider responses: an in-memory LRU in front of files
+    under ``data/response_cache`` that every worker process shares.
+
+    Entries expire after ``ttl_seconds``, or earlier if ``set`` is given a
+    shorter ``ttl``. Only chat replies at temperature 0 are cached: otherwise
+    the same message would get the same "creative" reply word for word. The memory tier holds at most
+    ``memory_entries`` items; the disk tier is trimmed to ``disk_max_bytes`` by
+    removing the least recently used files (disk hits refresh a file's mtime);
+    the trim runs every few dozen writes, so the cap may be overshot briefly.
+    Hit/miss counters are kept per process and reported by ``stats()``, along
+    with the provider time the hits saved.
+    """
+
+    # Trim the disk tier after this many writes rather than on every write.
+    _SWEEP_EVERY_WRITES = 50
+
+    def __init__(
+        self,
+        directory: Path,
+        *,
+        enabled: bool = True,
+        ttl_seconds: float = 3600,
+        image_ttl_seconds: float = 600,
+        memory_entries: int = 256,
+        disk_max_bytes: int = 50 * 1024 * 1024,
+    ):
+        self.directory = Path(directory)
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        # Provider image URLs expire, so image entries must not outlive them.
+        self.image_ttl_seconds = min(image_ttl_seconds, ttl_seconds)
+        self.memory_entries = memory_entries
+        self.disk_max_bytes = disk_max_bytes
+        self._memory: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = Lock()
+        self._writes_since_sweep = 0
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+            "saved_seconds": 0.0,
+        }
+        if enabled:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        return cls(
+            DATA_DIR / "response_cache",
+            enabled=os.getenv("AI_CACHE_ENABLED", "true").lower() != "false",
+            ttl_seconds=float(os.getenv("AI_CACHE_TTL_SECONDS", "3600")),
+            image_ttl_seconds=float(os.getenv("AI_CACHE_IMAGE_TTL_SECONDS", "600")),
+            memory_entries=int(os.getenv("AI_CACHE_MEMORY_ENTRIES", "256")),
+            disk_max_bytes=int(os.getenv("AI_CACHE_DISK_MAX_BYTES", str(50 * 1024 * 1024))),
+        )
+
+    def key(self, kind: str, payload: Dict) -> Optional[str]:
+        """Return a canonical hash of a request, or ``None`` when caching is off."""
+
+        if not self.enabled:
+            return None
+        canonical = json.dumps(
+            {"kind": kind, "payload": payload},
+            sort_keys=True,
+            ensure_ascii=False,
+            separators=(",", ":"),
+            default=str,
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def chat_key(self, payload: Dict) -> Optional[str]:
+        """``key`` for a chat request; ``None`` unless it is deterministic (temperature 0)."""
+
+        if payload.get("temperature") != 0:
+            return None
+        return self.key("chat", payload)
+
+    def get(self, key: Optional[str]) -> Optional[Any]:
+        if key is None:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry["created_at"] < entry.get("ttl", self.ttl_seconds):
+                self._memory.move_to_end(key)
+                self._record_hit("memory_hits", entry)
+                AI_CACHE_LOOKUPS.inc(result="memory")
+                return entry["value"]
+            if entry:
+                del self._memory[key]
+
+        entry = self._read_disk(key, now)
+        with self._lock:
+            if entry is None:
+                self._counters["misses"] += 1
+            else:
+                self._remember(key, entry)
+                self._record_hit("disk_hits", entry)
+        AI_CACHE_LOOKUPS.inc(result="miss" if entry is None else "disk")
+        return None if entry is None else entry["value"]
+
+    def set(self, key: Optional[str], value: Any, *, latency: float = 0.0, ttl: Optional[float] = None) -> None:
+        if key is None or value is None:
+            return
+        entry = {"created_at": time.time(), "latency": latency, "value": value}
+        if ttl is not None:
+            entry["ttl"] = min(ttl, self.ttl_seconds)
+        with self._lock:
+            self._remember(key, entry)
+            self._counters["stores"] += 1
+            self._writes_since_sweep += 1
+            sweep = self._writes_since_sweep >= self._SWEEP_EVERY_WRITES
+            if sweep:
+                self._writes_since_sweep = 0
+        self._write_disk(key, entry)
+        if sweep:
+            self._sweep_disk()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else 0.0
+        stats["saved_seconds"] = round(stats["saved_seconds"], 3)
+        stats["enabled"] = self.enabled
+        return stats
+
+    def _record_hit(self, counter: str, entry: Dict):
+        self._counters[counter] += 1
+        self._counters["saved_seconds"] += entry.get("latency", 0.0)
+
+    def _remember(self, key: str, entry: Dict):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self._counters["memory_evictions"] += 1
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def _read_disk(self, key: str, now: float) -> Optional[Dict]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                entry = json.load(fh)
+        except (FileNotFoundError, ValueError):
+            return None
+        if now - entry.get("created_at", 0) >= entry.get("ttl", self.ttl_seconds):
+            path.unlink(missing_ok=True)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def _write_disk(self, key: str, entry: Dict):
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{path.name}.{uuid4().hex[:8]}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as fh:
+                json.dump(entry, fh, ensure_ascii=False)
+            tmp_path.replace(path)
+        except OSError as exc:
+            print(f"Failed to write response cache entry: {exc}")
+
+    def _sweep_disk(self):
+        """Delete expired files, then the least recently used ones above the size cap."""
+
+        now = time.time()
+        files = []
+        total = 0
+        for path in self.directory.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime >= self.ttl_seconds:
+                path.unlink(missing_ok=True)
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        files.sort()
+        evicted = 0
+        for _, size, path in files:
+            if total <= self.disk_max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            evicted += 1
+        if evicted:
+            with self._lock:
+                self._counters["disk_evictions"] += evicted
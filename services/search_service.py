@@ -0,0 +1,110 @@
+from typing import Dict, Iterable, List, Optional
+
+from utils.search_index import SearchIndex, snippet
+
+SEARCH_KINDS = ("message", "prompt", "image")
+
+search_index = SearchIndex("search_index", indexes=("session_id",))
+
+
+def message_document(message: Dict) -> Dict:
+    return {
+        "id": f"message:{message['id']}",
+        "kind": "message",
+        "source_id": message["id"],
+        "user_id": message.get("user_id"),
+        "session_id": message.get("session_id"),
+        "role": message.get("role"),
+        "text": message.get("content") or "",
+        "created_at": message.get("created_at"),
+    }
+
+
+def prompt_document(prompt: Dict) -> Dict:
+    return {
+        "id": f"prompt:{prompt['id']}",
+        "kind": "prompt",
+        "source_id": prompt["id"],
+        "user_id": prompt.get("user_id"),
+        "title": prompt.get("title"),
+        "text": f"{prompt.get('title') or ''}\n{prompt.get('content') or ''}",
+        "created_at": prompt.get("created_at"),
+    }
+
+
+def image_document(image: Dict) -> Dict:
+    return {
+        "id": f"image:{image['id']}",
+        "kind": "image",
+        "source_id": image["id"],
+        "user_id": image.get("user_id"),
+        "url": image.get("url"),
+        "text": image.get("prompt") or "",
+        "created_at": image.get("created_at"),
+    }
+
+
+def index_documents(documents: List[Dict]) -> None:
+    """Add or replace documents; errors are logged so the write that triggered them still succeeds."""
+
+    try:
+        search_index.add(documents)
+    except Exception as exc:
+        print(f"Search index update failed: {exc}")
+
+
+def unindex_documents(doc_ids: Iterable[str]) -> None:
+    try:
+        search_index.remove(doc_ids)
+    except Exception as exc:
+        print(f"Search index update failed: {exc}")
+
+
+def unindex_session(session_id: int) -> None:
+    try:
+        search_index.remove_where("session_id", session_id)
+    except Exception as exc:
+        print(f"Search index update failed: {exc}")
+
+
+def rebuild_search_index() -> int:
+    """Rebuild the index from the message, prompt and image stores; returns the document count."""
+
+    from services.chat_service import message_store, session_archive, session_store
+    from services.image_service import images_store
+    from services.prompt_service import prompt_store
+
+    # Writers index their records under the same lock, so none is lost
+    # between reading the stores and replacing the index.
+    with search_index.hold():
+        documents = [message_document(message) for message in message_store.read()]
+        # Archived sessions stay searchable.
+        for session in session_store.snapshot():
+            if session.get("archived_at"):
+                documents += [message_document(message) for message in session_archive.read(session["id"])]
+        documents += [prompt_document(prompt) for prompt in prompt_store.snapshot()]
+        documents += [image_document(image) for image in images_store.snapshot()]
+        search_index.write(documents)
+    return len(documents)
+
+
+class SearchService:
+    def __init__(self, index: SearchIndex = search_index):
+        self.index = index
+
+    def search(
+        self, user_id: str, query: str, *, kinds: Optional[Iterable[str]] = None, limit: int = 20
+    ) -> List[Dict]:
+        """Return the user's best matching messages, prompts and images with a snippet each."""
+
+        if not self.index.exists():
+            rebuild_search_index()
+        results = []
+        for score, document in self.index.search(query, user_id=user_id, kinds=kinds, limit=limit):
+            text = document.pop("text", "")
+            document.pop("user_id", None)
+            document["id"] = document.pop("source_id")
+            document["score"] = score
+            document["snippet"] = snippet(text, query)
+            results.append(document)
+        return results
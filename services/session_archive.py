@@ -0,0 +1,208 @@
+import gzip
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from threading import Lock, Thread, get_native_id
+from typing import Dict, Iterator, List, Optional
+
+from utils.local_storage import JsonStore, _encode_line
+from utils.metrics import ARCHIVED_SESSIONS
+
+try:
+    import fcntl
+except ImportError:  # Windows: workers may archive at the same time, which is harmless.
+    fcntl = None
+
+# Session fields that only matter while the session is in use; they move into
+# the segment so the stub left in the session store stays small.
+_SEGMENT_SESSION_FIELDS = ("summary", "summary_upto_id")
+# Share of dead lines in the message log from which an archive run compacts it.
+COMPACT_DEAD_SHARE = 0.3
+
+
+class SessionArchive:
+    """
+    Moves chat sessions nobody has used for ``max_idle_seconds`` out of the
+    message store into one gzip-compressed JSONL segment per session.
+
+    The session itself stays in the session store as a stub with
+    ``archived_at`` and its listing fields, so it still shows up in the
+    history. ``restore`` moves the messages back; the chat service calls it
+    whenever an archived session is opened. Both directions run under the
+    session store's lock and write the segment before the stores, so a crash
+    at any point leaves the messages readable from one place or the other.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        sessions: JsonStore,
+        messages,
+        *,
+        max_idle_seconds: float,
+        interval: float,
+        batch_size: int = 20,
+    ):
+        self.directory = Path(directory)
+        self.sessions = sessions
+        self.messages = messages
+        self.max_idle_seconds = max_idle_seconds
+        self.interval = interval
+        self.batch_size = batch_size
+        self._pid = None
+        self._start_lock = Lock()
+
+    def start(self) -> None:
+        """Start the archiver thread in this process; cheap to call on every use."""
+
+        if self.interval <= 0 or self.max_idle_seconds <= 0 or self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            Thread(target=self._archive_loop, name="session_archiver", daemon=True).start()
+
+    def segment_path(self, session_id: int) -> Path:
+        return self.directory / f"{session_id}.jsonl.gz"
+
+    def archive_idle(self, max_idle_seconds: Optional[float] = None) -> int:
+        """Archive every session idle for longer than ``max_idle_seconds``; return how many."""
+
+        max_idle_seconds = self.max_idle_seconds if max_idle_seconds is None else max_idle_seconds
+        cutoff = (datetime.utcnow() - timedelta(seconds=max_idle_seconds)).isoformat()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / ".archive.lock", "a+b") as lock_fh:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return 0
+            try:
+                archived = 0
+                while True:
+                    count = self._archive_batch(cutoff)
+                    archived += count
+                    if count < self.batch_size:
+                        break
+                if archived and hasattr(self.messages, "compact"):
+                    # Deleted messages are only tombstones until the log is rewritten,
+                    # but rewriting it for a few sessions would cost more than it saves.
+                    self.messages.compact(min_dead_share=COMPACT_DEAD_SHARE)
+                return archived
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_fh, fcntl.LOCK_UN)
+
+    def _archive_batch(self, cutoff: str) -> int:
+        if not any(_is_idle(session, cutoff) for session in self.sessions.snapshot()):
+            # Nothing to do: spare the transaction its rewrite of the session store.
+            return 0
+        # Held past the transaction so that no restore runs before the messages are dropped.
+        with self.sessions.hold():
+            with self.sessions.transaction() as sessions:
+                # Re-checked under the lock: a session used since is no longer idle.
+                batch = [session for session in sessions if _is_idle(session, cutoff)][: self.batch_size]
+                for session in batch:
+                    self._write_segment(session, self.messages.find("session_id", session["id"]))
+                    for key in _SEGMENT_SESSION_FIELDS:
+                        session.pop(key, None)
+                    session.pop("restored_at", None)
+                    session["archived_at"] = datetime.utcnow().isoformat()
+            if not batch:
+                return 0
+            # The stubs are stored by now, so the messages can go.
+            for session in batch:
+                self.messages.delete_where("session_id", session["id"])
+        ARCHIVED_SESSIONS.inc(len(batch), action="archive")
+        return len(batch)
+
+    def _write_segment(self, session: Dict, messages: List[Dict]) -> None:
+        path = self.segment_path(session["id"])
+        tmp_path = path.with_name(path.name + ".tmp")
+        header = {key: session[key] for key in _SEGMENT_SESSION_FIELDS if key in session}
+        with gzip.open(tmp_path, "wb") as fh:
+            fh.write(_encode_line({"session": header}))
+            for message in messages:
+                fh.write(_encode_line(message))
+        tmp_path.replace(path)
+
+    def read(self, session_id: int) -> Iterator[Dict]:
+        """Yield the archived messages of a session without restoring them."""
+
+        try:
+            fh = gzip.open(self.segment_path(session_id), "rb")
+        except FileNotFoundError:
+            return
+        with fh:
+            for line in fh:
+                entry = json.loads(line)
+                if "session" not in entry:
+                    yield entry
+
+    def restore(self, session_id: int) -> bool:
+        """Move an archived session's messages back; ``False`` if it was not archived."""
+
+        with self.sessions.transaction() as sessions:
+            session = next((s for s in sessions if s.get("id") == session_id), None)
+            if session is None or not self.restore_into(session):
+                return False
+        self.discard(session_id)
+        return True
+
+    def restore_into(self, session: Dict) -> bool:
+        """
+        Restore the messages of ``session`` while the caller holds the session
+        store's transaction with it. The segment is left for ``discard``.
+        """
+
+        if not session.get("archived_at"):
+            return False
+        path = self.segment_path(session["id"])
+        messages = []
+        try:
+            with gzip.open(path, "rb") as fh:
+                for line in fh:
+                    entry = json.loads(line)
+                    if "session" in entry:
+                        session.update(entry["session"])
+                    else:
+                        messages.append(entry)
+        except FileNotFoundError:
+            print(f"Archive segment of session {session['id']} is missing")
+        # Messages keep their ids, so a restore repeated after a crash replaces them.
+        self.messages.upsert(messages)
+        session.pop("archived_at", None)
+        session["restored_at"] = datetime.utcnow().isoformat()
+        ARCHIVED_SESSIONS.inc(action="restore")
+        return True
+
+    def discard(self, session_id: int) -> None:
+        self.segment_path(session_id).unlink(missing_ok=True)
+
+    def _archive_loop(self):
+        try:
+            # Only lower this thread's priority: on Linux every thread has its own nice value.
+            os.setpriority(os.PRIO_PROCESS, get_native_id(), 10)
+        except (AttributeError, OSError):
+            pass
+        # Spread the workers' runs over the interval.
+        time.sleep(random.uniform(0.5, 1.0) * self.interval)
+        while self._pid == os.getpid():
+            try:
+                archived = self.archive_idle()
+                if archived:
+                    print(f"Archived {archived} idle chat sessions")
+            except Exception as exc:
+                print(f"Session archiving failed: {exc}")
+            time.sleep(self.interval)
+
+
+def _is_idle(session: Dict, cutoff: str) -> bool:
+    if session.get("archived_at"):
+        return False
+    last_used = max(session.get("updated_at") or "", session.get("restored_at") or "")
+    return bool(last_used) and last_used < cutoff
@@ -0,0 +1,70 @@
+from pathlib import Path
+from typing import List, Optional
+from uuid import uuid4
+
+from config import Config
+
+try:
+    from PIL import Image
+except ImportError:
+    # Listed in requirements.txt; without it every size serves the original file.
+    print("Pillow is not installed: image thumbnails are disabled and the originals are served")
+    Image = None
+
+# Longest side of each variant, in pixels.
+THUMBNAIL_SIZES = {"thumb": 320, "medium": 960}
+
+THUMBNAIL_DIR = Config.IMAGE_DOWNLOAD_DIR / "thumbs"
+
+
+def thumbnail_path(source: Path, size: str) -> Path:
+    name = Path(source).stem
+    return THUMBNAIL_DIR / name[:2] / f"{name}_{THUMBNAIL_SIZES[size]}.jpg"
+
+
+def thumbnails_of(source: Path) -> List[Path]:
+    """All cached variants of ``source``."""
+
+    name = Path(source).stem
+    return list((THUMBNAIL_DIR / name[:2]).glob(f"{name}_*.jpg"))
+
+
+def get_thumbnail(source: Path, size: str) -> Path:
+    """
+    Return the ``size`` variant of ``source``, creating and caching it on disk
+    on first use. Falls back to ``source`` when Pillow is not installed, the
+    image is already small enough or cannot be decoded.
+    """
+
+    target = thumbnail_path(source, size)
+    if target.exists():
+        return target
+    if Image is None:
+        return source
+    thumbnail = _render(source, THUMBNAIL_SIZES[size])
+    if thumbnail is None:
+        return source
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = target.with_name(f"{target.name}.{uuid4().hex[:8]}.tmp")
+    try:
+        thumbnail.save(tmp_path, "JPEG", quality=85, optimize=True)
+        tmp_path.replace(target)
+    except OSError as exc:
+        print(f"Failed to save thumbnail {target}: {exc}")
+        return source
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return target
+
+
+def _render(source: Path, longest_side: int) -> Optional["Image.Image"]:
+    try:
+        with Image.open(source) as image:
+            if max(image.size) <= longest_side:
+                return None
+            image.thumbnail((longest_side, longest_side))
+            return image.convert("RGB")
+    except Exception as exc:
+        print(f"Failed to create thumbnail of {source}: {exc}")
+        return None
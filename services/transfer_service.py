@@ -0,0 +1,254 @@
+import json
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from services.chat_service import message_store, rebuild_session_stats, session_archive, session_store
+from services.image_service import images_store
+from services.prompt_service import prompt_store
+from services.search_service import image_document, index_documents, message_document, prompt_document
+
+EXPORT_FORMAT_VERSION = 1
+# Records read or written per store call while streaming.
+TRANSFER_BATCH = 500
+
+# Sessions, prompts and images are matched on import by owner and creation
+# time, messages by creation time and role within their session, so importing
+# the same export again updates the records it created instead of copying them.
+# Summaries point at local message ids and archiving is local state.
+_SESSION_LOCAL_FIELDS = ("summary", "summary_upto_id", "archived_at", "restored_at")
+
+
+class InvalidExportError(ValueError):
+    """Raised for an export stream of an unsupported format."""
+
+
+def _in_range(record: Dict, since: Optional[str], until: Optional[str], field: str = "created_at") -> bool:
+    value = record.get(field) or record.get("created_at") or ""
+    return (since is None or value >= since) and (until is None or value < until)
+
+
+def _line(kind: str, data: Dict) -> bytes:
+    return (json.dumps({"type": kind, "data": data}, ensure_ascii=False, separators=(",", ":")) + "\n").encode(
+        "utf-8"
+    )
+
+
+def export_ndjson(
+    user_id: Optional[str] = None, *, since: Optional[str] = None, until: Optional[str] = None
+) -> Iterator[bytes]:
+    """
+    Yield the data of ``user_id`` (everyone if ``None``) as NDJSON lines.
+
+    A header line is followed by the sessions, the messages grouped by
+    session, the prompts and the images. ``since``/``until`` select records
+    created in ``[since, until)``; a session is included if it was active in
+    that range. Messages are read ``TRANSFER_BATCH`` at a time.
+    """
+
+    yield _line(
+        "export",
+        {"version": EXPORT_FORMAT_VERSION, "exported_at": datetime.utcnow().isoformat(), "user_id": user_id},
+    )
+
+    sessions = [
+        session
+        for session in session_store.snapshot()
+        if (user_id is None or session.get("user_id") == user_id)
+        and _in_range(session, since, None, "updated_at")
+        and _in_range(session, None, until)
+    ]
+    for session in sessions:
+        yield _line("session", {key: value for key, value in session.items() if key not in _SESSION_LOCAL_FIELDS})
+
+    for session in sessions:
+        if session.get("archived_at"):
+            # Read from the segment: exporting should not pull old sessions back in.
+            for message in session_archive.read(session["id"]):
+                if _in_range(message, since, until):
+                    yield _line("message", message)
+            continue
+        after = None
+        while True:
+            batch = message_store.find("session_id", session["id"], after=after, first=TRANSFER_BATCH)
+            for message in batch:
+                if _in_range(message, since, until):
+                    yield _line("message", message)
+            if len(batch) < TRANSFER_BATCH:
+                break
+            after = batch[-1]["id"]
+
+    for prompt in prompt_store.snapshot():
+        if (user_id is None or prompt.get("user_id") == user_id) and _in_range(prompt, since, until):
+            yield _line("prompt", dict(prompt))
+
+    for image in images_store.snapshot():
+        if (user_id is None or image.get("user_id") == user_id) and _in_range(image, since, until):
+            # The local copy is not exported; the importing side serves the original URL.
+            yield _line("image", {key: value for key, value in image.items() if key != "file_path"})
+
+
+def _existing(store, records: List[Dict], key) -> Dict[Tuple, Dict]:
+    """Stored records of the owners in ``records`` by natural key, one ``find`` per owner."""
+
+    existing = {}
+    for user_id in {record["user_id"] for record in records}:
+        for record in store.find("user_id", user_id):
+            existing[key(record)] = record
+    return existing
+
+
+def _owner_key(record: Dict) -> Tuple:
+    return record.get("user_id"), record.get("created_at")
+
+
+def _image_key(record: Dict) -> Tuple:
+    return record.get("user_id"), record.get("created_at"), record.get("url")
+
+
+class _Importer:
+    def __init__(self, user_id: Optional[str]):
+        self.user_id = user_id
+        self.counts = {"sessions": 0, "messages": 0, "prompts": 0, "images": 0, "skipped": 0}
+        self.session_ids: Dict[int, int] = {}
+        self.pending: Dict[str, List[Dict]] = {"session": [], "message": [], "prompt": [], "image": []}
+        self.pending_session_ids: List[int] = []
+        self.message_session: Optional[int] = None
+        self.message_keys: Dict[Tuple, int] = {}
+
+    def add(self, kind: str, data: Dict) -> None:
+        record = dict(data)
+        if self.user_id is not None:
+            record["user_id"] = self.user_id
+        if not record.get("user_id") or not record.get("created_at"):
+            self.counts["skipped"] += 1
+            return
+        if kind != "session":
+            # Messages refer to session ids, so sessions are written first.
+            self._flush_sessions()
+        getattr(self, f"_add_{kind}")(record)
+
+    def _add_session(self, session: Dict) -> None:
+        for key in _SESSION_LOCAL_FIELDS:
+            session.pop(key, None)
+        self.pending_session_ids.append(session.pop("id", None))
+        self._queue("session", session)
+
+    def _add_message(self, message: Dict) -> None:
+        session_id = self.session_ids.get(message.get("session_id"))
+        if session_id is None:
+            self.counts["skipped"] += 1
+            return
+        if session_id != self.message_session:
+            self._flush("message")
+            self.message_session = session_id
+            self.message_keys = {
+                (m.get("created_at"), m.get("role")): m["id"] for m in message_store.find("session_id", session_id)
+            }
+        message["session_id"] = session_id
+        message["id"] = self.message_keys.get((message["created_at"], message.get("role")))
+        self._queue("message", message)
+
+    def _add_prompt(self, prompt: Dict) -> None:
+        prompt.pop("id", None)
+        self._queue("prompt", prompt)
+
+    def _add_image(self, image: Dict) -> None:
+        image.pop("id", None)
+        image.pop("file_path", None)
+        self._queue("image", image)
+
+    def _queue(self, kind: str, record: Dict) -> None:
+        if record.get("id") is None:
+            record.pop("id", None)
+        self.pending[kind].append(record)
+        if len(self.pending[kind]) >= TRANSFER_BATCH:
+            self._flush(kind)
+
+    def _flush_sessions(self) -> None:
+        if self.pending["session"]:
+            self._flush("session")
+
+    def _flush(self, kind: str) -> None:
+        records = self.pending[kind]
+        if not records:
+            return
+        self.pending[kind] = []
+        if kind == "session":
+            existing = _existing(session_store, records, _owner_key)
+            for session in records:
+                match = existing.get(_owner_key(session))
+                if match is None:
+                    continue
+                session["id"] = match["id"]
+                if match.get("archived_at"):
+                    # Merge into the full session, not into its stub.
+                    session_archive.restore(match["id"])
+            stored = session_store.upsert(records)
+            for old_id, session in zip(self.pending_session_ids, stored):
+                self.session_ids[old_id] = session["id"]
+            self.pending_session_ids = []
+            self.counts["sessions"] += len(stored)
+        elif kind == "message":
+            stored = message_store.upsert(records)
+            for message in stored:
+                self.message_keys[(message["created_at"], message.get("role"))] = message["id"]
+            index_documents([message_document(message) for message in stored])
+            self.counts["messages"] += len(stored)
+        elif kind == "prompt":
+            existing = _existing(prompt_store, records, _owner_key)
+            for prompt in records:
+                if _owner_key(prompt) in existing:
+                    prompt["id"] = existing[_owner_key(prompt)]["id"]
+            stored = prompt_store.upsert(records)
+            index_documents([prompt_document(prompt) for prompt in stored])
+            self.counts["prompts"] += len(stored)
+        else:
+            existing = _existing(images_store, records, _image_key)
+            for image in records:
+                match = existing.get(_image_key(image))
+                if match is not None:
+                    image["id"] = match["id"]
+                    if match.get("file_path"):
+                        image["file_path"] = match["file_path"]
+            stored = images_store.upsert(records)
+            index_documents([image_document(image) for image in stored])
+            self.counts["images"] += len(stored)
+
+    def finish(self) -> Dict[str, int]:
+        self._flush_sessions()
+        for kind in ("message", "prompt", "image"):
+            self._flush(kind)
+        rebuild_session_stats(set(self.session_ids.values()))
+        return self.counts
+
+
+def import_ndjson(lines: Iterable[bytes], user_id: Optional[str] = None) -> Dict[str, int]:
+    """
+    Upsert the records of an ``export_ndjson`` stream and return counts per type.
+
+    With ``user_id`` every record is imported for that user. Lines are read
+    and written ``TRANSFER_BATCH`` at a time, so memory does not grow with
+    the size of the export. Malformed lines are counted as skipped.
+    """
+
+    importer = _Importer(user_id)
+    for number, raw in enumerate(lines, start=1):
+        if not raw.strip():
+            continue
+        try:
+            entry = json.loads(raw)
+            kind, data = entry["type"], entry["data"]
+        except (ValueError, KeyError, TypeError) as exc:
+            print(f"Skipping import line {number}: {exc}")
+            importer.counts["skipped"] += 1
+            continue
+        if kind == "export":
+            if data.get("version") != EXPORT_FORMAT_VERSION:
+                raise InvalidExportError(f"Unsupported export version: {data.get('version')}")
+            continue
+        if kind not in importer.pending or not isinstance(data, dict):
+            print(f"Skipping import line {number}: unknown type {kind!r}")
+            importer.counts["skipped"] += 1
+            continue
+        importer.add(kind, data)
+    return importer.finish()
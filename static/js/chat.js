@@ -3,6 +3,9 @@ document.addEventListener('DOMContentLoaded', function() {
     const messageInput = document.getElementById('message-input');
     const sendButton = document.querySelector('.chat-input button');
 
+    // The dashboard only uses the streaming helpers from this file.
+    if (!messageInput || !sendButton) return;
+
     // Send message when Enter is pressed (without Shift)
     messageInput.addEventListener('keydown', function(e) {
         if (e.key === 'Enter' && !e.shiftKey) {
@@ -25,40 +28,103 @@ async function sendMessage() {
     appendMessage('user', message);
     messageInput.value = '';
     
+    const assistantDiv = appendMessage('assistant', '');
+    let responseText = '';
+
     try {
-        const response = await fetch('/api/chat', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
+        await streamChat({
+            message: message,
+            model: window.modelUtils.getSelectedTextModel()
+        }, {
+            token: data => {
+                responseText += data.text;
+                assistantDiv.textContent = responseText;
+                scrollChatToBottom();
             },
-            body: JSON.stringify({
-                message: message,
-                model: window.modelUtils.getSelectedTextModel()
-            })
-        });
-        
-        const data = await response.json();
-        
-        if (data.error) {
-            appendMessage('error', data.error);
-        } else {
-            // Append AI's text response
-            appendMessage('assistant', data.response);
-            
-            // Append both images if they exist
-            if (data.user_image_url) {
-                appendImage('You:', data.user_image_url);
-            }
-            if (data.ai_image_url) {
-                appendImage('AI:', data.ai_image_url);
+            done: data => {
+                assistantDiv.innerHTML = linkify(data.response);
+            },
+            images: data => {
+                if (data.user_image_url) {
+                    appendImage('You:', data.user_image_url);
+                }
+                if (data.ai_image_url) {
+                    appendImage('AI:', data.ai_image_url);
+                }
+            },
+            error: data => {
+                assistantDiv.remove();
+                appendMessage('error', data.error);
             }
-        }
+        });
     } catch (error) {
         console.error('Error:', error);
+        assistantDiv.remove();
         appendMessage('error', 'Failed to send message. Please try again.');
     }
 }
 
+// Send a chat turn to /api/chat/stream and call handlers[event](data) for every
+// Server-Sent Event as it arrives, so the reply can be rendered token by token.
+async function streamChat(payload, handlers) {
+    return streamEvents('/api/chat/stream', payload, handlers);
+}
+
+// POST payload to an SSE endpoint and dispatch its events to handlers.
+async function streamEvents(url, payload, handlers) {
+    const response = await fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream',
+        },
+        body: JSON.stringify(payload)
+    });
+
+    if (!response.ok || !response.body) {
+        let errorMessage = 'Failed to get response. Please try again.';
+        try {
+            errorMessage = (await response.json()).error || errorMessage;
+        } catch (e) {
+            // Keep the generic message when the body is not JSON.
+        }
+        throw new Error(errorMessage);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            dispatchServerEvent(buffer.slice(0, boundary), handlers);
+            buffer = buffer.slice(boundary + 2);
+        }
+    }
+}
+
+function dispatchServerEvent(rawEvent, handlers) {
+    let eventName = 'message';
+    const dataLines = [];
+
+    rawEvent.split('\n').forEach(line => {
+        if (line.startsWith('event:')) {
+            eventName = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+            dataLines.push(line.slice(5).trimStart());
+        }
+    });
+
+    if (dataLines.length && handlers[eventName]) {
+        handlers[eventName](JSON.parse(dataLines.join('\n')));
+    }
+}
+
 async function generateImage() {
     const promptInput = document.getElementById('image-prompt');
     const prompt = promptInput.value.trim();
@@ -93,22 +159,29 @@ async function generateImage() {
     }
 }
 
-function appendMessage(role, content) {
-    const messagesContainer = document.getElementById('chat-messages');
-    const messageDiv = document.createElement('div');
-    messageDiv.className = `message ${role}`;
-    
+function linkify(content) {
     // Convert URLs to clickable links
-    const contentWithLinks = content.replace(
+    return content.replace(
         /(https?:\/\/[^\s]+)/g,
         '<a href="$1" target="_blank" rel="noopener noreferrer">$1</a>'
     );
-    
-    messageDiv.innerHTML = contentWithLinks;
-    messagesContainer.appendChild(messageDiv);
+}
+
+function scrollChatToBottom() {
+    const messagesContainer = document.getElementById('chat-messages');
     messagesContainer.scrollTop = messagesContainer.scrollHeight;
 }
 
+function appendMessage(role, content) {
+    const messagesContainer = document.getElementById('chat-messages');
+    const messageDiv = document.createElement('div');
+    messageDiv.className = `message ${role}`;
+    messageDiv.innerHTML = linkify(content);
+    messagesContainer.appendChild(messageDiv);
+    scrollChatToBottom();
+    return messageDiv;
+}
+
 function appendImage(caption, imageUrl) {
     const messagesContainer = document.getElementById('chat-messages');
     const imageDiv = document.createElement('div');
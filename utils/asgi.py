@@ -0,0 +1,109 @@
+import asyncio
+import json
+from typing import AsyncIterable, Awaitable, Callable, Dict, Tuple
+
+from utils.sse import format_sse
+
+Scope = Dict
+Receive = Callable[[], Awaitable[Dict]]
+Send = Callable[[Dict], Awaitable[None]]
+
+
+class Request:
+    """The parts of an ASGI HTTP request the async routes need."""
+
+    def __init__(self, scope: Scope, body: bytes):
+        self.scope = scope
+        self.body = body
+        self.method = scope["method"]
+        self.path = scope["path"]
+
+    def json(self) -> Dict:
+        """The JSON body, or an empty dict if it is missing or malformed."""
+
+        try:
+            data = json.loads(self.body or b"{}")
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+
+
+class Response:
+    def __init__(self, body: bytes = b"", status: int = 200, content_type: str = "text/plain; charset=utf-8"):
+        self.body = body
+        self.status = status
+        self.headers = [(b"content-type", content_type.encode("latin-1"))] if body else []
+
+    async def __call__(self, send: Send, receive: Receive) -> None:
+        headers = self.headers + [(b"content-length", str(len(self.body)).encode())]
+        await send({"type": "http.response.start", "status": self.status, "headers": headers})
+        await send({"type": "http.response.body", "body": self.body})
+
+
+def json_response(data, status: int = 200) -> Response:
+    return Response(json.dumps(data, ensure_ascii=False).encode("utf-8"), status, "application/json")
+
+
+class SSEResponse:
+    """
+    Streams ``(event, data)`` pairs as Server-Sent Events.
+
+    Failures are reported as a final ``error`` event, as ``iter_sse`` does.
+    When the client disconnects the events generator is closed, so the
+    service's cleanup runs just as it does for the threaded routes.
+    """
+
+    def __init__(self, events: AsyncIterable[Tuple[str, Dict]], error_message: str):
+        self.events = events
+        self.error_message = error_message
+
+    async def __call__(self, send: Send, receive: Receive) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream; charset=utf-8"),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no"),
+                ],
+            }
+        )
+        stream = asyncio.ensure_future(self._stream(send))
+        disconnect = asyncio.ensure_future(_wait_for_disconnect(receive))
+        try:
+            await asyncio.wait([stream, disconnect], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            disconnect.cancel()
+            if not stream.done():
+                stream.cancel()
+            await asyncio.gather(stream, return_exceptions=True)
+
+    async def _stream(self, send: Send) -> None:
+        try:
+            async for event, data in self.events:
+                await _send_chunk(send, format_sse(event, data))
+        except Exception as exc:
+            print(f"Stream error: {exc}")
+            await _send_chunk(send, format_sse("error", {"error": self.error_message}))
+        finally:
+            await self.events.aclose()
+        await send({"type": "http.response.body", "body": b""})
+
+
+async def _send_chunk(send: Send, text: str) -> None:
+    await send({"type": "http.response.body", "body": text.encode("utf-8"), "more_body": True})
+
+
+async def _wait_for_disconnect(receive: Receive) -> None:
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def read_body(receive: Receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
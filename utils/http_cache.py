@@ -0,0 +1,65 @@
+import gzip
+import hashlib
+from typing import Any, Callable
+
+from flask import Response, jsonify, request
+
+from config import Config
+from utils.local_user import get_user_id
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip is used on its own.
+    brotli = None
+
+# Preferred first when the client accepts several equally.
+_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def conditional_json(version: str, build: Callable[[], Any]) -> Response:
+    """
+    Return ``jsonify(build())`` tagged with an ETag derived from ``version``
+    (the write tags of the stores the data comes from), the user and the
+    request URL.
+
+    A client sending that tag back in ``If-None-Match`` gets ``304`` before
+    ``build`` runs, so nothing is loaded or serialized. The tag is weak
+    because the same data may be sent with different compression.
+    """
+
+    key = f"{version}\0{get_user_id()}\0{request.full_path}"
+    etag = hashlib.blake2b(key.encode("utf-8"), digest_size=12).hexdigest()
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag, weak=True)
+    # Cached copies must be revalidated, which costs a 304 at most.
+    response.cache_control.no_cache = True
+    return response
+
+
+def compress_response(response: Response) -> Response:
+    """Compress JSON bodies of ``RESPONSE_COMPRESS_MIN_BYTES`` or more with brotli or gzip."""
+
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or response.mimetype != "application/json"
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    body = response.get_data()
+    if len(body) < Config.RESPONSE_COMPRESS_MIN_BYTES:
+        return response
+    encoding = request.accept_encodings.best_match(_ENCODINGS)
+    if encoding == "br":
+        response.set_data(brotli.compress(body, quality=5))
+    elif encoding == "gzip":
+        response.set_data(gzip.compress(body, compresslevel=6, mtime=0))
+    else:
+        return response
+    response.headers["Content-Encoding"] = encoding
+    return response
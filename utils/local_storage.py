@@ -1,37 +1,598 @@
 import copy
 import json
 import os
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
 from pathlib import Path
-from threading import Lock
-from typing import Any, Callable
+from threading import RLock
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional
+
+from utils.metrics import STORE_OPERATION_DURATION
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only.
+    fcntl = None
 
 
 DATA_DIR = Path(os.getenv("LOCAL_DATA_DIR", "data"))
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
+# "log" keeps record collections in an indexed append-only file, "json" falls
+# back to rewriting a single JSON document per store.
+STORAGE_BACKEND = os.getenv("LOCAL_STORAGE_BACKEND", "log").lower()
+
+
+class StoreLock:
+    """
+    Re-entrant lock shared by the threads of one process and, through ``flock``
+    on a sidecar ``.lock`` file, by every gunicorn worker using the same store.
+    The sidecar also holds a write counter that readers use to validate caches.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path.with_name(path.name + ".lock")
+        self._thread_lock = RLock()
+        self._depth = 0
+        self._fh = None
+
+    @contextmanager
+    def hold(self, shared: bool = False):
+        with self._thread_lock:
+            if self._depth:
+                self._depth += 1
+                try:
+                    yield
+                finally:
+                    self._depth -= 1
+                return
+            # The file is opened per acquisition: flock state must not be
+            # inherited by forked workers through a shared descriptor.
+            with open(self.path, "a+b") as fh:
+                if fcntl is not None:
+                    fcntl.flock(fh, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+                self._fh = fh
+                self._depth = 1
+                try:
+                    yield
+                finally:
+                    self._depth = 0
+                    self._fh = None
+                    if fcntl is not None:
+                        fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def version(self) -> int:
+        """Return the store's write counter; the lock must be held."""
+
+        self._fh.seek(0)
+        raw = self._fh.read().strip()
+        return int(raw) if raw.isdigit() else 0
+
+    def bump(self) -> int:
+        """Increment the write counter; the lock must be held exclusively."""
+
+        version = self.version() + 1
+        self._fh.truncate(0)
+        self._fh.write(str(version).encode("ascii"))
+        self._fh.flush()
+        return version
+
 
 class JsonStore:
-    """Simple JSON-backed storage with naive in-process locking."""
+    """
+    JSON-backed storage whose writes are serialized across threads and processes.
+
+    The parsed file is cached per store and only re-read when another writer
+    bumps the write counter or the file's mtime/size change. ``snapshot()``
+    hands out the shared cached records for read-only use; ``read()`` and
+    ``transaction()`` copy records one level deep so callers may modify them.
+    """
 
     def __init__(self, name: str, default_factory: Callable[[], Any]):
+        self.name = name
         self.path = DATA_DIR / f"{name}.json"
         self.default_factory = default_factory
-        self._lock = Lock()
+        self._lock = StoreLock(self.path)
+        self._cache = None
+        self._cache_key = None
+
+    def snapshot(self):
+        """Return the cached data without copying. Callers must not mutate it."""
+
+        with self._lock.hold(shared=True):
+            return self._cached()
 
     def read(self):
-        with self._lock:
-            if not self.path.exists():
-                return self.default_factory()
-            with open(self.path, "r", encoding="utf-8") as fh:
-                data = json.load(fh)
-            return copy.deepcopy(data)
+        with self._lock.hold(shared=True):
+            return _thaw(self._cached())
 
     def write(self, data):
-        with self._lock:
-            tmp_path = self.path.with_suffix(".tmp")
+        with self._lock.hold():
+            self._dump(data)
+
+    @contextmanager
+    def hold(self):
+        """
+        Hold the store's exclusive lock across several calls; the store's own
+        methods may be used inside, as the lock is re-entrant.
+        """
+
+        with self._lock.hold():
+            yield
+
+    @contextmanager
+    def transaction(self):
+        """
+        Yield the current data under an exclusive lock and write it back on exit.
+
+        Use this for every read-modify-write so that concurrent workers never
+        overwrite each other's changes or hand out the same ``next_id``.
+        """
+
+        with STORE_OPERATION_DURATION.time(store=self.name, operation="transaction"):
+            with self._lock.hold():
+                data = _thaw(self._cached())
+                yield data
+                self._dump(data)
+
+    def append(self, records: List[Dict]) -> List[Dict]:
+        """Add records to a list store, assigning ids to records without one."""
+
+        with STORE_OPERATION_DURATION.time(store=self.name, operation="append"), self._lock.hold():
+            items = _thaw(self._cached())
+            stored = []
+            for record in records:
+                if record.get("id") is None:
+                    record = {"id": next_id(items), **record}
+                items.append(record)
+                stored.append(record)
+            self._dump(items)
+        return stored
+
+    def upsert(self, records: List[Dict]) -> List[Dict]:
+        """Replace records whose id is already stored and append the others."""
+
+        with STORE_OPERATION_DURATION.time(store=self.name, operation="append"), self._lock.hold():
+            items = _thaw(self._cached())
+            positions = {item.get("id"): index for index, item in enumerate(items)}
+            next_record_id = next_id(items)
+            stored = []
+            for record in records:
+                if record.get("id") is None:
+                    record = {"id": next_record_id, **record}
+                if isinstance(record["id"], int):
+                    next_record_id = max(next_record_id, record["id"] + 1)
+                if record["id"] in positions:
+                    items[positions[record["id"]]] = record
+                else:
+                    positions[record["id"]] = len(items)
+                    items.append(record)
+                stored.append(record)
+            self._dump(items)
+        return stored
+
+    def find(
+        self,
+        field: str,
+        value: Hashable,
+        *,
+        after: Optional[int] = None,
+        before: Optional[int] = None,
+        first: Optional[int] = None,
+        last: Optional[int] = None,
+    ) -> List[Dict]:
+        """Return records whose ``field`` equals ``value`` (a full scan for this backend)."""
+
+        matches = [
+            dict(item)
+            for item in self.snapshot()
+            if item.get(field) == value
+            and (after is None or item.get("id", 0) > after)
+            and (before is None or item.get("id", 0) < before)
+        ]
+        if first:
+            matches = matches[:first]
+        return matches[-last:] if last else matches
+
+    def delete_where(self, field: str, value: Hashable) -> int:
+        with self._lock.hold():
+            items = self._cached()
+            kept = [item for item in items if item.get(field) != value]
+            if len(kept) != len(items):
+                self._dump(kept)
+            return len(items) - len(kept)
+
+    def etag(self) -> str:
+        """A tag that changes with every write; costs a ``stat``, not a read."""
+
+        with self._lock.hold(shared=True):
+            key = self._current_key()
+        return _tag(key)
+
+    def _cached(self):
+        key = self._current_key()
+        if self._cache_key != key or key is None:
+            if key is None:
+                data = self.default_factory()
+            else:
+                with STORE_OPERATION_DURATION.time(store=self.name, operation="load"):
+                    with open(self.path, "r", encoding="utf-8") as fh:
+                        data = json.load(fh)
+            self._cache = _freeze(data)
+            self._cache_key = key
+        return self._cache
+
+    def _current_key(self):
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return (self._lock.version(), stat.st_mtime_ns, stat.st_size)
+
+    def _dump(self, data):
+        tmp_path = self.path.with_suffix(".tmp")
+        with STORE_OPERATION_DURATION.time(store=self.name, operation="dump"):
             with open(tmp_path, "w", encoding="utf-8") as fh:
                 json.dump(data, fh, ensure_ascii=False, indent=2)
             tmp_path.replace(self.path)
+        self._lock.bump()
+        self._cache = _freeze(data)
+        self._cache_key = self._current_key()
+
+
+def _freeze(data):
+    """Detach data from its caller before it becomes the shared cached snapshot."""
+
+    if isinstance(data, list):
+        return tuple(dict(item) if isinstance(item, dict) else item for item in data)
+    return copy.deepcopy(data)
+
+
+def _thaw(data):
+    """Return a copy of a cached snapshot that is safe to modify one level deep."""
+
+    if isinstance(data, tuple):
+        return [dict(item) if isinstance(item, dict) else item for item in data]
+    return copy.deepcopy(data)
+
+
+class RecordLog:
+    """
+    Append-only JSON-lines storage for collections of dict records.
+
+    Every write appends lines instead of rewriting the file, and byte offsets of
+    the live records are kept in memory together with secondary indexes on the
+    configured fields. Appending a record or loading all records that share an
+    indexed value therefore costs O(records touched), not O(file size).
+    Ids are usually assigned integers but may be any JSON string or number.
+    A record written again with an existing id replaces the previous version,
+    deletions are written as tombstones and ``compact()`` drops dead lines.
+    Writers hold the store's exclusive lock and readers a shared one, so every
+    worker process sees whole lines and ids stay unique across processes.
+    A line left incomplete by a writer that crashed is dropped by the next
+    append, and lines that cannot be decoded are skipped.
+    """
+
+    COMPACT_MIN_DEAD_LINES = 1000
+
+    def __init__(self, name: str, indexes: Iterable[str] = ()):
+        self.name = name
+        self.path = DATA_DIR / f"{name}.jsonl"
+        self.legacy_path = DATA_DIR / f"{name}.json"
+        self.indexes = tuple(indexes)
+        self._lock = StoreLock(self.path)
+        self._reset()
+        with self._lock.hold():
+            if not self.path.exists():
+                self._migrate_legacy()
+
+    def read(self) -> List[Dict]:
+        """Return every live record in id order."""
+
+        with self._lock.hold(shared=True):
+            self._catch_up()
+            live = self._offsets
+            records = []
+            if not live:
+                return records
+            with open(self.path, "rb") as fh:
+                offset = 0
+                for line in fh:
+                    if len(line) > 1:
+                        entry = _decode_line(line)
+                        if entry is not None and live.get(entry.get("id")) == offset:
+                            records.append(entry)
+                    offset += len(line)
+            records.sort(key=lambda record: _id_order(record["id"]))
+            return records
+
+    def write(self, data: List[Dict]) -> None:
+        """Replace the whole collection (also used to compact the log)."""
+
+        with self._lock.hold():
+            self._rewrite(data)
+
+    def append(self, records: List[Dict]) -> List[Dict]:
+        """Append records, assigning ids to records without one."""
+
+        if not records:
+            return []
+        with STORE_OPERATION_DURATION.time(store=self.name, operation="append"), self._lock.hold():
+            self._catch_up()
+            next_record_id = self._max_id + 1
+            stored = []
+            for record in records:
+                if record.get("id") is None:
+                    record = {"id": next_record_id, **record}
+                if isinstance(record["id"], int):
+                    next_record_id = max(next_record_id, record["id"] + 1)
+                stored.append(record)
+            self._append_lines(stored)
+        return stored
+
+    def upsert(self, records: List[Dict]) -> List[Dict]:
+        """Same as ``append``: a record with an existing id replaces it."""
+
+        return self.append(records)
+
+    def find(
+        self,
+        field: str,
+        value: Hashable,
+        *,
+        after: Optional[int] = None,
+        before: Optional[int] = None,
+        first: Optional[int] = None,
+        last: Optional[int] = None,
+    ) -> List[Dict]:
+        """
+        Return records whose indexed ``field`` equals ``value`` in id order.
+
+        ``after`` and ``before`` keep records with ids strictly between them,
+        ``first`` keeps only the oldest of those and ``last`` only the newest;
+        skipped records are not loaded.
+        """
+
+        with STORE_OPERATION_DURATION.time(store=self.name, operation="find"), self._lock.hold(shared=True):
+            self._catch_up()
+            ids = sorted(self._index[field].get(value, ()), key=_id_order)
+            if after is not None:
+                ids = ids[bisect_right(ids, _id_order(after), key=_id_order):]
+            if before is not None:
+                ids = ids[:bisect_left(ids, _id_order(before), key=_id_order)]
+            if first:
+                ids = ids[:first]
+            if last:
+                ids = ids[-last:]
+            return self._load(ids)
+
+    def count(self, field: str, value: Hashable) -> int:
+        with self._lock.hold(shared=True):
+            self._catch_up()
+            return len(self._index[field].get(value, ()))
+
+    def delete_where(self, field: str, value: Hashable) -> int:
+        """Write tombstones for all records whose indexed ``field`` equals ``value``."""
+
+        with STORE_OPERATION_DURATION.time(store=self.name, operation="delete"), self._lock.hold():
+            self._catch_up()
+            ids = sorted(self._index[field].get(value, ()), key=_id_order)
+            self._append_lines([{"id": record_id, "_deleted": True} for record_id in ids])
+            if self._dead_lines >= max(self.COMPACT_MIN_DEAD_LINES, len(self._offsets)):
+                self._rewrite(self._load(sorted(self._offsets, key=_id_order)))
+            return len(ids)
+
+    def etag(self) -> str:
+        """A tag that changes with every write; costs a ``stat``, not a read."""
+
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return _tag(None)
+        # Appends grow the file and rewrites replace it.
+        return _tag((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+
+    @contextmanager
+    def hold(self):
+        """
+        Hold the store's exclusive lock across several calls; the store's own
+        methods may be used inside, as the lock is re-entrant.
+        """
+
+        with self._lock.hold():
+            yield
+
+    def compact(self, min_dead_share: float = 0.0) -> bool:
+        """
+        Rewrite the log without dead lines; with ``min_dead_share`` only if at
+        least that share of its lines is dead. Returns whether it rewrote.
+        """
+
+        with self._lock.hold():
+            self._catch_up()
+            lines = self._dead_lines + len(self._offsets)
+            if not lines or self._dead_lines < min_dead_share * lines:
+                return False
+            self._rewrite(self._load(sorted(self._offsets, key=_id_order)))
+            return True
+
+    def _reset(self):
+        self._offsets: Dict[Any, int] = {}
+        self._keys: Dict[Any, tuple] = {}
+        self._index: Dict[str, Dict[Hashable, Dict[Any, None]]] = {
+            field: {} for field in self.indexes
+        }
+        self._position = 0
+        self._inode = None
+        self._dead_lines = 0
+        self._max_id = 0
+
+    def _catch_up(self):
+        """Index lines appended since the last call, rebuilding if the file was replaced."""
+
+        try:
+            fh = open(self.path, "rb")
+        except FileNotFoundError:
+            self._reset()
+            return
+        with fh:
+            # The open file, not the path: it may be replaced while we read.
+            stat = os.fstat(fh.fileno())
+            if stat.st_ino != self._inode or stat.st_size < self._position:
+                self._reset()
+                self._inode = stat.st_ino
+            if stat.st_size == self._position:
+                return
+            fh.seek(self._position)
+            offset = self._position
+            for line in fh:
+                if not line.endswith(b"\n"):
+                    # A concurrent append is still in progress.
+                    break
+                if len(line) > 1:
+                    entry = _decode_line(line)
+                    if entry is None:
+                        print(f"Skipping unreadable line at byte {offset} of {self.path.name}")
+                    else:
+                        self._apply(entry, offset)
+                offset += len(line)
+        self._position = offset
+
+    def _apply(self, entry: Dict, offset: int):
+        record_id = entry.get("id")
+        if record_id is None:
+            return
+        if isinstance(record_id, int):
+            self._max_id = max(self._max_id, record_id)
+        if record_id in self._offsets:
+            self._dead_lines += 1
+            self._unindex(record_id)
+        if entry.get("_deleted"):
+            self._dead_lines += 1
+            return
+        self._offsets[record_id] = offset
+        keys = tuple(entry.get(field) for field in self.indexes)
+        self._keys[record_id] = keys
+        for field, key in zip(self.indexes, keys):
+            self._index[field].setdefault(key, {})[record_id] = None
+
+    def _unindex(self, record_id):
+        del self._offsets[record_id]
+        for field, key in zip(self.indexes, self._keys.pop(record_id)):
+            bucket = self._index[field].get(key)
+            if bucket is not None:
+                bucket.pop(record_id, None)
+                if not bucket:
+                    del self._index[field][key]
+
+    def _load(self, ids: List) -> List[Dict]:
+        if not ids:
+            return []
+        records = []
+        with open(self.path, "rb") as fh:
+            for record_id in ids:
+                fh.seek(self._offsets[record_id])
+                records.append(json.loads(fh.readline()))
+        return records
+
+    def _append_lines(self, entries: List[Dict]):
+        if not entries:
+            return
+        lines = [_encode_line(entry) for entry in entries]
+        start = self._write_lines(lines)
+        if start != self._position:
+            # Someone else wrote to the file in between; re-read from our position.
+            self._catch_up()
+            return
+        if self._inode is None:
+            self._inode = self.path.stat().st_ino
+        offset = start
+        for entry, line in zip(entries, lines):
+            self._apply(entry, offset)
+            offset += len(line)
+        self._position = offset
+
+    def _write_lines(self, lines: List[bytes]) -> int:
+        """Append encoded lines under the exclusive lock; return where they start."""
+
+        with open(self.path, "a+b") as fh:
+            start = fh.seek(0, os.SEEK_END)
+            if start and _last_byte(fh, start) != b"\n":
+                # A writer died mid-line. Nobody else writes while we hold the
+                # lock, so drop the torn line instead of gluing ours onto it.
+                start = _line_start(fh, start)
+                fh.truncate(start)
+            fh.write(b"".join(lines))
+        return start
+
+    def _rewrite(self, records: List[Dict]):
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "wb") as fh:
+            fh.writelines(_encode_line(record) for record in records)
+        tmp_path.replace(self.path)
+        self._reset()
+        self._catch_up()
+
+    def _migrate_legacy(self):
+        """Convert a store written by ``JsonStore`` into the log format once."""
+
+        if not self.legacy_path.exists():
+            return
+        with open(self.legacy_path, "r", encoding="utf-8") as fh:
+            records = json.load(fh)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "wb") as fh:
+            fh.writelines(_encode_line(record) for record in records)
+        tmp_path.replace(self.path)
+        self.legacy_path.replace(self.legacy_path.with_suffix(".json.migrated"))
+
+
+def _id_order(record_id):
+    """Sort key for ids: numbers in numeric order, then strings."""
+
+    return (1, record_id) if isinstance(record_id, str) else (0, record_id)
+
+
+def _decode_line(line: bytes) -> Optional[Dict]:
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+
+def _last_byte(fh, size: int) -> bytes:
+    fh.seek(size - 1)
+    return fh.read(1)
+
+
+def _line_start(fh, size: int) -> int:
+    """Offset just past the last newline before ``size``, or 0."""
+
+    end = size
+    while end > 0:
+        start = max(end - 65536, 0)
+        fh.seek(start)
+        position = fh.read(end - start).rfind(b"\n")
+        if position >= 0:
+            return start + position + 1
+        end = start
+    return 0
+
+
+def _tag(key) -> str:
+    return "-".join(f"{part:x}" for part in key) if key else "0"
+
+
+def _encode_line(entry: Dict) -> bytes:
+    return (json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def open_record_store(name: str, indexes: Iterable[str] = ()):
+    """Return the configured storage backend for a collection of records."""
+
+    if STORAGE_BACKEND == "json":
+        return JsonStore(name, default_factory=list)
+    return RecordLog(name, indexes=indexes)
 
 
 def next_id(items, key: str = "id") -> int:
@@ -39,4 +600,3 @@ def next_id(items, key: str = "id") -> int:
     if not items:
         return 1
     return max(int(item.get(key, 0)) for item in items) + 1
-
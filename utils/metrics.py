@@ -0,0 +1,264 @@
+import json
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock, Thread
+from typing import Dict, Iterator, List, Sequence, Tuple
+from uuid import uuid4
+
+# Lives next to the stores of utils.local_storage, which itself reports here.
+METRICS_DIR = Path(os.getenv("LOCAL_DATA_DIR", "data")) / "metrics"
+FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class _Registry:
+    """
+    Per-process metric values, shared with other workers through files.
+
+    Every process writes its values to ``data/metrics/<pid>.json`` every
+    ``FLUSH_INTERVAL`` seconds from a background thread; ``render`` sums the
+    files of all processes, so any gunicorn worker can answer a scrape.
+    Files that have not been rewritten for a while belong to exited workers
+    and are removed, which Prometheus sees as a counter reset.
+    """
+
+    def __init__(self, directory: Path, flush_interval: float):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._metrics: Dict[str, "_Metric"] = {}
+        self._lock = Lock()
+        self._pid = None
+
+    def register(self, metric: "_Metric") -> "_Metric":
+        self._metrics[metric.name] = metric
+        return metric
+
+    def touch(self):
+        """Start the flush thread in this process; after a fork, drop inherited values."""
+
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            if self._pid is not None:
+                for metric in self._metrics.values():
+                    metric.reset()
+            self._pid = pid
+            Thread(target=self._flush_loop, name="metrics_flush", daemon=True).start()
+
+    def flush(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        data = {name: metric.dump() for name, metric in self._metrics.items()}
+        path = self.directory / f"{os.getpid()}.json"
+        tmp_path = path.with_name(f"{path.name}.{uuid4().hex[:8]}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(data, fh)
+        tmp_path.replace(path)
+
+    def render(self) -> str:
+        """Return all metrics of all live processes in Prometheus text format."""
+
+        self.touch()
+        self.flush()
+        merged: Dict[str, Dict[str, List[float]]] = {name: {} for name in self._metrics}
+        stale_after = time.time() - self.flush_interval * 10
+        for path in self.directory.glob("*.json"):
+            try:
+                if path.stat().st_mtime < stale_after:
+                    path.unlink(missing_ok=True)
+                    continue
+                with open(path, "r", encoding="utf-8") as fh:
+                    data = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            for name, series in data.items():
+                if name not in merged:
+                    continue
+                for labels, values in series.items():
+                    current = merged[name].get(labels)
+                    if current is None:
+                        merged[name][labels] = list(values)
+                    else:
+                        for index, value in enumerate(values):
+                            current[index] += value
+
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.extend(metric.render(merged[name]))
+        return "\n".join(lines) + "\n"
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as exc:
+                print(f"Failed to write metrics: {exc}")
+
+
+_registry = _Registry(METRICS_DIR, FLUSH_INTERVAL)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Tuple[str, str] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = ",".join(
+        '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in pairs
+    )
+    return "{" + escaped + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = Lock()
+        _registry.register(self)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def dump(self) -> Dict[str, List[float]]:
+        with self._lock:
+            return {json.dumps(key): list(values) for key, values in self._values.items()}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self, series: Dict[str, List[float]]) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        _registry.touch()
+        key = self._key(labels)
+        with self._lock:
+            values = self._values.setdefault(key, [0.0])
+            values[0] += amount
+
+    def render(self, series: Dict[str, List[float]]) -> List[str]:
+        lines = self._header()
+        for raw_key, values in sorted(series.items()):
+            labels = _format_labels(self.labelnames, json.loads(raw_key))
+            lines.append(f"{self.name}{labels} {_format_value(values[0])}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        _registry.touch()
+        key = self._key(labels)
+        # Layout: one count per bucket (not cumulative), then +Inf, sum, count.
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0.0] * (len(self.buckets) + 3)
+            values[index] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self, series: Dict[str, List[float]]) -> List[str]:
+        lines = self._header()
+        for raw_key, values in sorted(series.items()):
+            label_values = json.loads(raw_key)
+            cumulative = 0.0
+            for bound, count in zip((*self.buckets, "+Inf"), values):
+                cumulative += count
+                labels = _format_labels(self.labelnames, label_values, ("le", str(bound)))
+                lines.append(f"{self.name}_bucket{labels} {_format_value(cumulative)}")
+            labels = _format_labels(self.labelnames, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(values[-2])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(values[-1])}")
+        return lines
+
+
+def render_metrics() -> str:
+    return _registry.render()
+
+
+HTTP_REQUESTS = Counter(
+    "jarvis_http_requests_total", "HTTP requests by endpoint and status.", ("endpoint", "method", "status")
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "jarvis_http_request_duration_seconds",
+    "Time until the response is returned to the server (streamed bodies continue after it).",
+    ("endpoint", "method"),
+)
+CHAT_STAGE_DURATION = Histogram(
+    "jarvis_chat_stage_duration_seconds", "Duration of each stage of a chat turn.", ("stage",)
+)
+AI_PROVIDER_DURATION = Histogram(
+    "jarvis_ai_provider_request_duration_seconds",
+    "Provider calls by provider, model, kind (chat, stream, image) and outcome.",
+    ("provider", "model", "kind", "outcome"),
+)
+AI_CACHE_LOOKUPS = Counter(
+    "jarvis_ai_cache_lookups_total", "Response cache lookups by result (memory, disk, miss).", ("result",)
+)
+IMAGE_GENERATION_DURATION = Histogram(
+    "jarvis_image_generation_duration_seconds", "Generation of a single image, including retries.", ("source",)
+)
+IMAGE_DOWNLOAD_DURATION = Histogram(
+    "jarvis_image_download_duration_seconds", "Background image downloads by outcome.", ("outcome",)
+)
+IMAGE_FILES_REMOVED = Counter(
+    "jarvis_image_files_removed_total", "Downloaded images removed by reason (deleted, orphan, quota).", ("reason",)
+)
+ARCHIVED_SESSIONS = Counter(
+    "jarvis_archived_sessions_total", "Chat sessions moved to and back from the archive.", ("action",)
+)
+STORE_OPERATION_DURATION = Histogram(
+    "jarvis_store_operation_duration_seconds",
+    "Local store operations, including time spent waiting for the file lock.",
+    ("store", "operation"),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+JOBS = Counter("jarvis_jobs_total", "Background jobs by queue and final status.", ("queue", "status"))
+JOB_DURATION = Histogram("jarvis_job_duration_seconds", "Run time of background jobs.", ("queue",))
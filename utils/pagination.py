@@ -0,0 +1,122 @@
+import base64
+import heapq
+import json
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidPageError(ValueError):
+    """Raised for malformed ``limit``, ``cursor`` or ``fields`` parameters."""
+
+
+def encode_cursor(record: Mapping, sort_key: str) -> str:
+    position = [record.get(sort_key) or "", record.get("id") or 0]
+    raw = json.dumps(position, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, record_id = json.loads(raw)
+    except (ValueError, TypeError) as exc:
+        raise InvalidPageError("Invalid cursor") from exc
+    if not isinstance(sort_value, str) or not isinstance(record_id, int):
+        raise InvalidPageError("Invalid cursor")
+    return sort_value, record_id
+
+
+def parse_page_args(args: Mapping) -> Tuple[Optional[int], Optional[str], Optional[List[str]]]:
+    """
+    Read ``limit``, ``cursor`` and ``fields`` from query parameters.
+
+    Without ``limit`` the caller should return the whole collection as before.
+    """
+
+    raw_limit = args.get("limit")
+    limit = None
+    if raw_limit not in (None, ""):
+        try:
+            limit = int(raw_limit)
+        except ValueError as exc:
+            raise InvalidPageError("limit must be an integer") from exc
+        if limit < 1:
+            raise InvalidPageError("limit must be positive")
+        limit = min(limit, MAX_PAGE_SIZE)
+
+    cursor = args.get("cursor") or None
+    if cursor is not None:
+        decode_cursor(cursor)
+        if limit is None:
+            limit = DEFAULT_PAGE_SIZE
+
+    raw_fields = args.get("fields")
+    fields = [field.strip() for field in raw_fields.split(",") if field.strip()] if raw_fields else None
+    return limit, cursor, fields
+
+
+def _position(record: Mapping, sort_key: str) -> Tuple[str, int]:
+    return record.get(sort_key) or "", record.get("id") or 0
+
+
+def select_page(
+    records: Iterable[Mapping],
+    *,
+    sort_key: str,
+    limit: Optional[int],
+    cursor: Optional[str] = None,
+    descending: bool = True,
+) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Return one page of ``records`` ordered by ``sort_key`` then id, and the
+    cursor of the next page.
+
+    Only ``limit + 1`` records are kept in a heap, so a page costs
+    O(n log limit) instead of sorting the whole collection. Cursors point at
+    a position rather than an offset, so records added or removed meanwhile
+    do not shift later pages. Without ``limit`` everything is returned sorted.
+    """
+
+    if limit is None:
+        ordered = sorted(records, key=lambda r: _position(r, sort_key), reverse=descending)
+        return [dict(record) for record in ordered], None
+
+    if cursor:
+        boundary = decode_cursor(cursor)
+        if descending:
+            records = (r for r in records if _position(r, sort_key) < boundary)
+        else:
+            records = (r for r in records if _position(r, sort_key) > boundary)
+
+    select = heapq.nlargest if descending else heapq.nsmallest
+    page = select(limit + 1, records, key=lambda r: _position(r, sort_key))
+    return trim_page([dict(record) for record in page], limit, sort_key)
+
+
+def trim_page(items: List[Dict], limit: Optional[int], sort_key: str) -> Tuple[List[Dict], Optional[str]]:
+    """Cut a page fetched with one extra record down to ``limit`` and derive the next cursor."""
+
+    if limit is None or len(items) <= limit:
+        return items, None
+    items = items[:limit]
+    return items, encode_cursor(items[-1], sort_key)
+
+
+def project(items: List[Dict], fields: Optional[List[str]]) -> List[Dict]:
+    """Keep only ``fields`` (and always ``id``) of every item."""
+
+    if not fields:
+        return items
+    wanted = ["id", *[field for field in fields if field != "id"]]
+    return [{field: item[field] for field in wanted if field in item} for item in items]
+
+
+def page_response(items: List[Dict], next_cursor: Optional[str], limit: Optional[int], fields: Optional[List[str]]):
+    """Plain list for unpaginated requests, ``{"items", "next_cursor"}`` otherwise."""
+
+    items = project(items, fields)
+    if limit is None:
+        return items
+    return {"items": items, "next_cursor": next_cursor}
@@ -1,30 +1,117 @@
-import sys
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
 from typing import Dict, List, Optional
 
+from config import BASE_DIR
+
+
+class PromptTemplates:
+    """
+    Serves prompt files from memory.
+
+    A file is re-read only when its mtime or size changes, and that is checked
+    at most once per ``check_interval`` seconds, so editing a template takes
+    effect without a restart. Missing or unreadable files yield an empty string.
+    """
+
+    def __init__(self, paths: Dict[str, Path], *, check_interval: float = 1.0, max_combined: int = 256):
+        self.paths = paths
+        self.check_interval = check_interval
+        self.max_combined = max_combined
+        self._texts: Dict[str, str] = {}
+        self._signatures: Dict[str, Optional[tuple]] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._combined: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, name: str) -> str:
+        now = time.monotonic()
+        with self._lock:
+            if name in self._texts and now - self._checked_at[name] < self.check_interval:
+                return self._texts[name]
+            self._checked_at[name] = now
+            path = self.paths[name]
+            try:
+                stat = path.stat()
+                signature = (stat.st_mtime_ns, stat.st_size)
+            except OSError as exc:
+                signature = None
+                if self._signatures.get(name, ()) is not None:
+                    print(f"Error reading prompt template {path}: {exc}")
+            if name in self._texts and signature == self._signatures.get(name):
+                return self._texts[name]
+
+            text = ""
+            if signature is not None:
+                try:
+                    text = path.read_text(encoding="utf-8").strip()
+                except OSError as exc:
+                    print(f"Error reading prompt template {path}: {exc}")
+            self._texts[name] = text
+            self._signatures[name] = signature
+            return text
+
+    def system_message(self, selected_prompts: Optional[List[Dict]] = None) -> str:
+        """
+        Return the system message for a chat turn: system and user templates plus
+        the selected prompts. Results are cached by a hash of everything they
+        are built from, so an edited template produces a new entry.
+        """
+
+        system_prompt = self.get("system")
+        user_prompt = self.get("user")
+        prompt_contents = [p.get("content", "") for p in selected_prompts or [] if p.get("content")]
+
+        digest = hashlib.sha256()
+        for part in (system_prompt, user_prompt, *prompt_contents):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        key = digest.hexdigest()
+
+        with self._lock:
+            combined = self._combined.get(key)
+            if combined is not None:
+                self._combined.move_to_end(key)
+                return combined
+
+        combined = f"{system_prompt}\n\n{user_prompt}"
+        if prompt_contents:
+            combined += f"\n\nVery important context: {' '.join(prompt_contents)}"
+
+        with self._lock:
+            self._combined[key] = combined
+            while len(self._combined) > self.max_combined:
+                self._combined.popitem(last=False)
+        return combined
+
+
+prompt_templates = PromptTemplates(
+    {
+        "system": BASE_DIR / "prompts" / "system.txt",
+        "user": BASE_DIR / "prompts" / "user_prompt.txt",
+        "image": BASE_DIR / "image_promt.txt",
+    },
+    check_interval=float(os.getenv("PROMPT_RELOAD_CHECK_SECONDS", "1")),
+)
+
+
 def get_system_prompt():
-    """Read system prompt from prompts/system.txt file"""
-    try:
-        with open('prompts/system.txt', 'r', encoding='utf-8') as file:
-            return file.read().strip()
-    except Exception as e:
-        print(f"Error reading system prompt: {e}")
-        return ""
+    """Return the system prompt from prompts/system.txt"""
+    return prompt_templates.get("system")
 
 def get_user_prompt():
-    """Read user prompt from prompts/user_prompt.txt file"""
-    try:
-        with open('prompts/user_prompt.txt', 'r', encoding='utf-8') as file:
-            return file.read().strip()
-    except Exception as e:
-        print(f"Error reading user prompt: {e}")
-        return "" 
+    """Return the user prompt from prompts/user_prompt.txt"""
+    return prompt_templates.get("user")
 
 def enhance_image_prompt(
         prompt: str, selected_prompts: Optional[List[Dict]] = None
     ) -> str:
 
-        with open('image_promt.txt', 'r') as file:
-            system_context = file.read()
+        system_context = prompt_templates.get("image")
 
         enhanced_prompt = prompt
         if selected_prompts:
@@ -32,5 +119,6 @@ def enhance_image_prompt(
             if prompt_contents:
                 enhanced_prompt = f"Style and details: {' '.join(prompt_contents)}. {enhanced_prompt}"
 
-        enhanced_prompt = f"{system_context}. {enhanced_prompt}"
-        return enhanced_prompt
\ No newline at end of file
+        if system_context:
+            enhanced_prompt = f"{system_context}. {enhanced_prompt}"
+        return enhanced_prompt
@@ -0,0 +1,382 @@
+import heapq
+import math
+import re
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from threading import Lock, Thread
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from utils.local_storage import RecordLog, _encode_line
+from utils.metrics import STORE_OPERATION_DURATION
+
+_TOKEN_RE = re.compile(r"[^\W_]+")
+
+_STOP_WORDS = frozenset(
+    """
+    а без более бы был была были было быть в вам вас во вот все всего всех вы где да даже для до его ее ей
+    ему если есть еще же за здесь и из или им их к как какая какой когда кто ли между меня мне может мы на
+    над надо нас не него нее нет ни них но ну о об он она они оно от по под после при про с со так также
+    там те тем то того тоже только том ты у уже чем что чтобы это этот эти этого этой эту я
+    a an and are as at be but by for from in is it of on or that the this to was were with
+    """.split()
+)
+
+# Common Russian inflections, longest first. Stripping them is a crude
+# stemmer, but the same one runs over documents and queries, so "эльфа",
+# "эльфы" and "эльфов" all find "эльф".
+_RUSSIAN_ENDINGS = tuple(
+    sorted(
+        """
+        иями ями ами иям иях ией ого его ому ему ыми ими ая яя ое ее ие ые ую юю ой ей ий ый ым им ых их
+        ов ев ом ем ам ям ах ях ия ии ию а я о е и ы у ю ь
+        """.split(),
+        key=len,
+        reverse=True,
+    )
+)
+_MIN_STEM = 3
+_CYRILLIC_RE = re.compile(r"[а-я]")
+
+_stems: Dict[str, str] = {}
+
+
+def _stem(word: str) -> str:
+    stem = _stems.get(word)
+    if stem is None:
+        stem = word
+        if _CYRILLIC_RE.match(word):
+            for ending in _RUSSIAN_ENDINGS:
+                if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM:
+                    stem = word[: -len(ending)]
+                    break
+        if len(_stems) < 500_000:
+            _stems[word] = stem
+    return stem
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case, fold ``ё`` into ``е``, drop stop words and stem."""
+
+    words = _TOKEN_RE.findall((text or "").lower().replace("ё", "е"))
+    stems = _stems
+    return [stems.get(word) or _stem(word) for word in words if word not in _STOP_WORDS]
+
+
+def snippet(text: str, query: str, width: int = 160) -> str:
+    """Cut ``width`` characters of ``text`` around the first query term in it."""
+
+    text = text or ""
+    terms = set(tokenize(query))
+    normalized = text.lower().replace("ё", "е")
+    start = 0
+    for match in _TOKEN_RE.finditer(normalized):
+        if _stem(match.group()) in terms:
+            start = max(match.start() - width // 4, 0)
+            break
+    fragment = text[start:start + width].strip()
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if start + width < len(text) else ""
+    return f"{prefix}{fragment}{suffix}"
+
+
+def _contains(numbers: array, number: int) -> bool:
+    position = bisect_left(numbers, number)
+    return position < len(numbers) and numbers[position] == number
+
+
+class SearchIndex(RecordLog):
+    """
+    Full-text index over documents ``{"id", "kind", "user_id", "text", ...}``.
+
+    Documents are kept in a ``RecordLog``. Writes only append lines to it;
+    the in-memory inverted index is built by the first query in a process and
+    brought up to date by reading the lines appended since the previous one,
+    so workers that never search never load it. The bulk of that reading runs
+    without the file lock, so a worker loading a large index does not hold up
+    writes in the others. Documents are ranked with BM25. Postings are compact
+    arrays of document numbers in ascending order; a changed or deleted
+    document gets a new number and its old postings are skipped until the log
+    is compacted. Each queried term also keeps its postings sorted by score,
+    so a single-term query reads only the head of a long posting list.
+    """
+
+    K1 = 1.2
+    B = 0.75
+    # Single-term matches a multi-term query scores at most.
+    CANDIDATES = 100
+    # Longer posting lists are probed rather than copied into a set when a
+    # multi-term query looks for documents holding several terms.
+    INTERSECT_MAX = 20_000
+    # Postings appended to a term before its score order is rebuilt.
+    RESORT_AFTER = 64
+
+    def __init__(self, name: str, indexes: Iterable[str] = ()):
+        super().__init__(name, indexes)
+        # Guards the in-memory index, which is also updated outside the file lock.
+        self._memory_lock = Lock()
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def add(self, documents: List[Dict]) -> None:
+        """
+        Index or re-index ``documents``. Skipped until the index has been built:
+        the build reads the primary stores, so it will include them.
+        """
+
+        self._write_entries(documents)
+
+    def remove(self, doc_ids: Iterable[str]) -> None:
+        self._write_entries([{"id": doc_id, "_deleted": True} for doc_id in doc_ids])
+
+    def remove_where(self, field: str, value) -> None:
+        """Remove every document whose indexed ``field`` equals ``value``."""
+
+        # Resolved to documents by whoever reads the log, so writing it needs no index.
+        self._write_entries([{"_deleted_where": [field, value]}])
+
+    def warm(self) -> None:
+        """Load the index, or catch up with the log, ahead of the next query."""
+
+        with self._memory_lock:
+            self._catch_up()
+
+    def search(
+        self, query: str, *, user_id: str, kinds: Optional[Iterable[str]] = None, limit: int = 20
+    ) -> List[Tuple[float, Dict]]:
+        """Return up to ``limit`` ``(score, document)`` pairs, best first."""
+
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        kinds = set(kinds) if kinds else None
+
+        def accept(number: int) -> bool:
+            return self._doc_users[number] == user_id and (kinds is None or self._doc_kinds[number] in kinds)
+
+        with STORE_OPERATION_DURATION.time(store=self.name, operation="search"), self._memory_lock:
+            # A first load or a reload after a rewrite reads the whole file: do
+            # it without the file lock, then catch up with the last few lines
+            # under it, so the offsets stay valid while documents are loaded.
+            self._catch_up()
+            with self._lock.hold(shared=True):
+                self._catch_up()
+                best = self._top(terms, accept, limit)
+                documents = self._load([self._doc_ids[number] for _, number in best])
+            compact = self._dead_lines >= max(self.COMPACT_MIN_DEAD_LINES, len(self._offsets))
+        if compact:
+            self._compact()
+        return [(round(score, 4), document) for (score, _), document in zip(best, documents)]
+
+    def _top(self, terms: List[str], accept: Callable[[int], bool], limit: int) -> List[Tuple[float, int]]:
+        """
+        BM25 top-``limit`` with the threshold algorithm: walk every term's
+        postings in descending score order and stop as soon as no unseen
+        document can beat the current ``limit``-th score.
+
+        With several terms the walk rarely stops early, so documents holding
+        at least two of them are scored directly and the walk, now only
+        looking for single-term matches, is cut off after ``CANDIDATES``
+        documents. That can only miss single-term matches far down a list.
+        Scoring those documents dominates multi-term queries: with frequent
+        terms they take a few milliseconds, single terms well under one.
+        """
+
+        live = self._live_documents
+        if not live or limit < 1:
+            return []
+        average_length = self._total_length / live
+        lists = []
+        for term in terms:
+            entry = self._postings.get(term)
+            if entry is None:
+                continue
+            numbers, frequencies = entry
+            idf = math.log(1 + (live - len(numbers) + 0.5) / (len(numbers) + 0.5))
+            order, ranked = self._ranked(term, average_length)
+            lists.append((idf, numbers, frequencies, order, ranked))
+        if not lists:
+            return []
+
+        lengths = self._doc_lengths
+        doc_ids = self._doc_ids
+        # _impact() spelled out: this is the innermost loop of every query.
+        k1_plus_1 = self.K1 + 1
+        base = self.K1 * (1 - self.B)
+        slope = self.K1 * self.B / average_length
+        lookups = [(idf * k1_plus_1, numbers, frequencies, len(numbers)) for idf, numbers, frequencies, _, _ in lists]
+        heap: List[Tuple[float, int]] = []
+        seen = set()
+
+        def consider(number: int) -> None:
+            if number in seen:
+                return
+            seen.add(number)
+            if doc_ids[number] is None or not accept(number):
+                return
+            norm = base + slope * lengths[number]
+            score = 0.0
+            for weight, numbers, frequencies, count in lookups:
+                position = bisect_left(numbers, number)
+                if position < count and numbers[position] == number:
+                    frequency = frequencies[position]
+                    score += weight * frequency / (frequency + norm)
+            if len(heap) < limit:
+                heapq.heappush(heap, (score, number))
+            elif score > heap[0][0]:
+                heapq.heapreplace(heap, (score, number))
+
+        # Postings added since a term was last sorted are few; score them all.
+        for _, numbers, _, _, ranked in lists:
+            for number in numbers[ranked:]:
+                consider(number)
+
+        def walk(budget: float) -> None:
+            stop_at = len(seen) + budget
+            depth = 0
+            while len(seen) < stop_at:
+                threshold = 0.0
+                active = False
+                for idf, numbers, frequencies, order, ranked in lists:
+                    if depth < ranked:
+                        active = True
+                        position = order[depth]
+                        number = numbers[position]
+                        threshold += idf * self._impact(frequencies[position], lengths[number], average_length)
+                        consider(number)
+                if not active or (len(heap) == limit and heap[0][0] >= threshold):
+                    return
+                depth += 1
+
+        if len(lists) == 1:
+            walk(math.inf)
+            return sorted(heap, reverse=True)
+
+        # A document with two or more of the terms usually outranks one with a
+        # single term, but may sit deep in every list's score order. Score all
+        # of those first; the best single-term documents head the lists, so
+        # the walk after them is short.
+        once: set = set()
+        several: set = set()
+        for numbers in sorted((entry[1] for entry in lists), key=len):
+            if len(numbers) <= self.INTERSECT_MAX:
+                members = set(numbers)
+                several |= once & members
+                once |= members
+            else:
+                # Too long to copy into a set: look up the rarer terms' documents in it.
+                several.update(number for number in once if _contains(numbers, number))
+        for number in several:
+            consider(number)
+        walk(max(self.CANDIDATES, limit * len(lists) * 2))
+        return sorted(heap, reverse=True)
+
+    def _ranked(self, term: str, average_length: float) -> Tuple[array, int]:
+        """
+        Positions of ``term``'s postings by descending score and how many
+        postings they cover. Re-sorted once ``RESORT_AFTER`` more postings
+        arrived or the average document length drifted, which reorders scores.
+        """
+
+        numbers, frequencies = self._postings[term]
+        cached = self._rankings.get(term)
+        if cached is not None:
+            order, sorted_average = cached
+            if len(numbers) - len(order) <= self.RESORT_AFTER and abs(sorted_average - average_length) <= (
+                0.05 * average_length
+            ):
+                return order, len(order)
+        lengths = self._doc_lengths
+        order = array(
+            "I",
+            sorted(
+                range(len(numbers)),
+                key=lambda position: self._impact(frequencies[position], lengths[numbers[position]], average_length),
+                reverse=True,
+            ),
+        )
+        self._rankings[term] = (order, average_length)
+        return order, len(order)
+
+    def _impact(self, frequency: int, length: int, average_length: float) -> float:
+        """The BM25 term weight before multiplying by idf."""
+
+        norm = self.K1 * (1 - self.B + self.B * length / average_length)
+        return frequency * (self.K1 + 1) / (frequency + norm)
+
+    def _reset(self):
+        super()._reset()
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._rankings: Dict[str, Tuple[array, float]] = {}
+        self._doc_ids: List[Optional[str]] = []
+        self._doc_users: List[Optional[str]] = []
+        self._doc_kinds: List[Optional[str]] = []
+        self._doc_lengths = array("I")
+        self._numbers: Dict[str, int] = {}
+        self._live_documents = 0
+        self._total_length = 0
+
+    def _apply(self, entry: Dict, offset: int):
+        where = entry.get("_deleted_where")
+        if where is not None:
+            field, value = where
+            for record_id in list(self._index[field].get(value, ())):
+                self._dead_lines += 1
+                self._unindex(record_id)
+            self._dead_lines += 1
+            return
+        super()._apply(entry, offset)
+        doc_id = entry.get("id")
+        if doc_id is None or entry.get("_deleted"):
+            return
+        number = len(self._doc_ids)
+        counts = Counter(tokenize(entry.get("text")))
+        length = sum(counts.values())
+        self._doc_ids.append(doc_id)
+        self._doc_users.append(entry.get("user_id"))
+        self._doc_kinds.append(entry.get("kind"))
+        self._doc_lengths.append(length)
+        self._numbers[doc_id] = number
+        self._live_documents += 1
+        self._total_length += length
+        postings = self._postings
+        for term, frequency in counts.items():
+            entry_postings = postings.get(term)
+            if entry_postings is None:
+                entry_postings = postings[term] = (array("I"), array("H"))
+            entry_postings[0].append(number)
+            entry_postings[1].append(frequency if frequency < 0xFFFF else 0xFFFF)
+
+    def _unindex(self, record_id):
+        super()._unindex(record_id)
+        number = self._numbers.pop(record_id, None)
+        if number is None:
+            return
+        self._doc_ids[number] = None
+        self._doc_users[number] = None
+        self._live_documents -= 1
+        self._total_length -= self._doc_lengths[number]
+
+    def _write_entries(self, entries: List[Dict]) -> None:
+        if not entries:
+            return
+        with self._lock.hold():
+            if self.exists():
+                self._write_lines([_encode_line(entry) for entry in entries])
+
+    def _compact(self) -> None:
+        """Drop dead lines, then reload in the background rather than on the next query."""
+
+        with self._memory_lock, self._lock.hold():
+            self._catch_up()
+            self._rewrite(self._load(sorted(self._offsets)))
+        Thread(target=self.warm, name=f"{self.name}_warm", daemon=True).start()
+
+    def _rewrite(self, records: List[Dict]):
+        # Only the file: document numbers change, so the in-memory index is
+        # rebuilt from it by the next catch-up, outside the file lock.
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "wb") as fh:
+            fh.writelines(_encode_line(record) for record in records)
+        tmp_path.replace(self.path)
@@ -0,0 +1,24 @@
+import json
+from typing import Dict, Iterable, Iterator, Tuple
+
+
+def format_sse(event: str, data: Dict) -> str:
+    """Encode one Server-Sent Events message with a JSON payload."""
+
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def iter_sse(events: Iterable[Tuple[str, Dict]], error_message: str) -> Iterator[str]:
+    """
+    Turn ``(event, data)`` pairs into SSE messages.
+
+    Headers are already sent once streaming starts, so a failure is reported
+    to the client as a final ``error`` event instead of an HTTP status.
+    """
+
+    try:
+        for event, data in events:
+            yield format_sse(event, data)
+    except Exception as exc:
+        print(f"Stream error: {exc}")
+        yield format_sse("error", {"error": error_message})